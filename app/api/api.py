@@ -1,7 +1,7 @@
 from fastapi import APIRouter
 
-from app.api.endpoints import (login, login_google, password_recovery, todos,
-                               users)
+from app.api.endpoints import (admin, login, login_google, password_recovery,
+                               todos, users)
 
 api_router = APIRouter()
 api_router.include_router(users.router)
@@ -9,3 +9,4 @@ api_router.include_router(login.router)
 api_router.include_router(login_google.router)
 api_router.include_router(todos.router)
 api_router.include_router(password_recovery.router)
+api_router.include_router(admin.router)
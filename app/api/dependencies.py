@@ -1,38 +1,98 @@
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+import math
 
-from app import models
+from fastapi import Body, Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from pydantic import EmailStr
+
+from app import models, schemas
 from app.core.config import Settings, get_settings
-from app.core.security import decode_token
-from app.database.db import SessionLocal
+from app.core.rate_limit import rate_limiter
+from app.core.security import decode_token_cached
+from app.database.db import (DBSession, close_session, create_session,
+                             replica_router)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token")
 
+READ_ONLY_METHODS = ("GET", "HEAD")
+# header to always read from the primary DB (instead of a replica)
+READ_FROM_PRIMARY_HEADER = "X-Read-From-Primary"
+# cookie set after writing, to read from the primary DB for a while
+READ_YOUR_WRITES_COOKIE = "read_your_writes"
+
 
-def get_db():
+async def get_db():
     """
     Dependency to create/close a new session per request,
     making sure that the session is always closed even if
-    there is an exception.
+    there is an exception. The session is async unless
+    the DATABASE_ASYNC setting is disabled.
     """
+    db = create_session()
     try:
-        db = SessionLocal()
         yield db
     finally:
-        db.close()
+        await close_session(db)
+
+
+def _read_from_primary(request: Request) -> bool:
+    return (
+        request.method not in READ_ONLY_METHODS
+        or request.headers.get(READ_FROM_PRIMARY_HEADER, "").lower() == "true"
+        or READ_YOUR_WRITES_COOKIE in request.cookies
+    )
+
+
+async def get_read_db(request: Request, db: DBSession = Depends(get_db)):
+    """
+    Dependency to get a session of a read replica (if there are any) for
+    read-only requests. Other requests, requests with the read from primary
+    header, and requests of clients that wrote recently (to read their own
+    writes) get the same session of the primary DB as get_db.
+    """
+    replica = None if _read_from_primary(request) else replica_router.choose()
+    if replica is None:
+        yield db
+        return
+
+    replica_db = create_session(replica, primary=db)
+    try:
+        yield replica_db
+    finally:
+        await close_session(replica_db)
 
 
-def get_current_user(
-    db: Session = Depends(get_db),
+async def check_token_not_revoked(db: DBSession, token_data: schemas.TokenPayload):
+    if await models.RevokedToken.is_revoked_async(db, token_data):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+async def get_token_data(
+    db: DBSession = Depends(get_db),
     token: str = Depends(oauth2_scheme),
     settings: Settings = Depends(get_settings),
+) -> schemas.TokenPayload:
+    """
+    Dependency to get the payload of the provided token,
+    checking that it is valid and it was not revoked.
+    """
+    token_data = decode_token_cached(token, settings)
+    await check_token_not_revoked(db, token_data)
+
+    return token_data
+
+
+async def get_current_user(
+    db: DBSession = Depends(get_read_db),
+    token_data: schemas.TokenPayload = Depends(get_token_data),
 ) -> models.User:
     """
     Dependency to get the current user from the provided token.
     """
-    token_data = decode_token(token, settings)
-    user = models.User.get_by_id(db, id=token_data.sub)
+    user = await models.User.get_by_id_async(db, id=token_data.sub)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -41,7 +101,28 @@ def get_current_user(
     return user
 
 
-def get_current_active_user(
+async def get_current_principal(
+    db: DBSession = Depends(get_db),
+    token_data: schemas.TokenPayload = Depends(get_token_data),
+) -> schemas.Principal:
+    """
+    Dependency to get the authorization fields of the current user from the
+    provided token. Unlike get_current_user, the DB is only queried if the
+    user is not in the principal cache.
+    """
+    principal = None
+    if token_data.sub and token_data.sub.isdigit():
+        principal = await models.User.get_principal_async(db, id=int(token_data.sub))
+
+    if not principal:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    return principal
+
+
+async def get_current_active_user(
     current_user: models.User = Depends(get_current_user),
 ) -> models.User:
     if not current_user.is_active:
@@ -53,12 +134,112 @@ def get_current_active_user(
     return current_user
 
 
-def get_current_active_superuser(
-    current_user: models.User = Depends(get_current_active_user),
-) -> models.User:
+async def get_current_active_principal(
+    current_user: schemas.Principal = Depends(get_current_principal),
+) -> schemas.Principal:
+    if not current_user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Inactive user",
+        )
+
+    return current_user
+
+
+async def get_current_active_superuser(
+    current_user: schemas.Principal = Depends(get_current_active_principal),
+) -> schemas.Principal:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not superuser"
         )
 
     return current_user
+
+
+def _check_rate_limit(retry_after: float):
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def _get_client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def limit_login_attempts(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(OAuth2PasswordRequestForm),
+    settings: Settings = Depends(get_settings),
+):
+    """
+    Dependency to limit the login attempts per client IP and per username,
+    rejecting them before checking the password.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+
+    window = settings.RATE_LIMIT_WINDOW_SECONDS
+    ip_key = f"login:ip:{_get_client_ip(request)}"
+    _check_rate_limit(
+        rate_limiter.hit_sliding_window(
+            ip_key, settings.LOGIN_RATE_LIMIT_PER_IP, window
+        )
+    )
+    username_key = f"login:username:{form_data.username.lower()}"
+    _check_rate_limit(
+        rate_limiter.hit_sliding_window(
+            username_key, settings.LOGIN_RATE_LIMIT_PER_USERNAME, window
+        )
+    )
+
+
+def limit_password_recovery(
+    request: Request,
+    email: EmailStr = Body(..., embed=True),
+    settings: Settings = Depends(get_settings),
+):
+    """
+    Dependency to limit the password recovery requests per client IP and
+    per email, rejecting them before querying the DB or sending any email.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+
+    window = settings.RATE_LIMIT_WINDOW_SECONDS
+    ip_key = f"password_recovery:ip:{_get_client_ip(request)}"
+    _check_rate_limit(
+        rate_limiter.hit_sliding_window(
+            ip_key, settings.PASSWORD_RECOVERY_RATE_LIMIT_PER_IP, window
+        )
+    )
+    email_key = f"password_recovery:email:{email.lower()}"
+    _check_rate_limit(
+        rate_limiter.hit_sliding_window(
+            email_key, settings.PASSWORD_RECOVERY_RATE_LIMIT_PER_EMAIL, window
+        )
+    )
+
+
+def limit_registrations(
+    request: Request,
+    settings: Settings = Depends(get_settings),
+):
+    """
+    Dependency to limit the new registrations per client IP, allowing
+    short bursts of requests.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+
+    ip_key = f"register:ip:{_get_client_ip(request)}"
+    _check_rate_limit(
+        rate_limiter.hit_token_bucket(
+            ip_key,
+            settings.REGISTER_RATE_LIMIT_BURST,
+            settings.REGISTER_RATE_LIMIT_PER_MINUTE / 60,
+        )
+    )
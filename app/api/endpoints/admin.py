@@ -0,0 +1,99 @@
+import os
+from typing import Any
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app import schemas
+from app.api import dependencies
+from app.core.google_auth import google_token_validator
+from app.core.security import hashing_executor, token_cache
+from app.database.db import async_engine, engine, replica_router
+from app.database.pool import get_pool_stats
+from app.database.purge import user_purger
+from app.models.todo import todo_stats_cache
+from app.models.user import principal_cache
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+def _get_metrics() -> dict[str, Any]:
+    pools = {"sync": get_pool_stats(engine.pool)}
+    if async_engine is not None:
+        pools["async"] = get_pool_stats(async_engine.pool)
+    for replica in replica_router.replicas:
+        pools[replica.name] = get_pool_stats(replica.engine.pool)
+        if replica.async_engine is not None:
+            pools[f"{replica.name}_async"] = get_pool_stats(replica.async_engine.pool)
+
+    return {
+        "pid": os.getpid(),
+        "db_pool": pools,
+        "db_replica": {
+            replica.name: {"healthy": int(replica.healthy)}
+            for replica in replica_router.replicas
+        },
+        "cache": {
+            "token": token_cache.stats(),
+            "principal": principal_cache.stats(),
+            "todo_stats": todo_stats_cache.stats(),
+            "google_token": google_token_validator.cache.stats(),
+        },
+        "password_hashing": hashing_executor.stats(),
+        "user_purge": user_purger.stats(),
+    }
+
+
+def _to_prometheus(name: str, stats: dict[str, Any], labels: dict[str, Any]) -> str:
+    label_list = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return "".join(
+        f"{name}_{key}{{{label_list}}} {value}\n"
+        for key, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    )
+
+
+@router.get(
+    "/metrics",
+    summary="Get the metrics of the worker process",
+    response_description="DB connection pools, caches, password hashing and purges",
+)
+async def read_metrics(
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_superuser
+    ),
+):
+    """
+    Live metrics of the worker process handling the request
+    (every worker has its own pools and caches).
+    """
+    return _get_metrics()
+
+
+@router.get(
+    "/metrics/prometheus",
+    response_class=PlainTextResponse,
+    summary="Get the metrics of the worker process in Prometheus format",
+)
+async def read_metrics_prometheus(
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_superuser
+    ),
+):
+    metrics = _get_metrics()
+    pid = metrics["pid"]
+    output = ""
+    for engine_name, stats in metrics["db_pool"].items():
+        output += _to_prometheus("db_pool", stats, {"engine": engine_name, "pid": pid})
+    for replica_name, stats in metrics["db_replica"].items():
+        output += _to_prometheus(
+            "db_replica", stats, {"replica": replica_name, "pid": pid}
+        )
+    for cache_name, stats in metrics["cache"].items():
+        output += _to_prometheus("cache", stats, {"cache": cache_name, "pid": pid})
+    output += _to_prometheus(
+        "password_hashing", metrics["password_hashing"], {"pid": pid}
+    )
+    output += _to_prometheus("user_purge", metrics["user_purge"], {"pid": pid})
+
+    return PlainTextResponse(output, media_type="text/plain; version=0.0.4")
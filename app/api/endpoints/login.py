@@ -1,14 +1,17 @@
-from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
+from fastapi import (APIRouter, Body, Depends, HTTPException, Request,
+                     Response, status)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
 
 from app import models, schemas
 from app.api import dependencies
 from app.api.emails.email_utils import send_account_verification_email
 from app.core.config import Settings, get_settings
+from app.core.keys import get_key_ring
 from app.core.security import (create_access_token,
                                create_account_verification_token,
                                create_refresh_token, decode_token)
+from app.database.db import DBSession, run_db
 
 router = APIRouter(prefix="", tags=["login"])
 
@@ -42,18 +45,19 @@ def _generate_token_response(user_id, include_refresh=True):
     response_model=schemas.Token,
     response_model_exclude_unset=True,
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(dependencies.limit_login_attempts)],
     summary="Get a new access token",
     response_description="The access token",
 )
-def get_access_token_from_username(
-    db: Session = Depends(dependencies.get_db),
+async def get_access_token_from_username(
+    db: DBSession = Depends(dependencies.get_db),
     form_data: OAuth2PasswordRequestForm = Depends(OAuth2PasswordRequestForm),
 ):
     """
     Get an OAuth2 access token from a user logging in with a username and password,
     to use in future requests as an authenticated user.
     """
-    user = models.User.authenticate(
+    user = await models.User.authenticate_async(
         db, email=form_data.username, password=form_data.password
     )
     _check_active_user_exists(user)
@@ -70,9 +74,9 @@ def get_access_token_from_username(
     summary="Get a new access token from a refresh token",
     response_description="The access token",
 )
-def get_access_token_from_refresh_token(
+async def get_access_token_from_refresh_token(
     refresh_token: schemas.RefreshToken,
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
     settings: Settings = Depends(get_settings),
 ):
     if refresh_token.grant_type != "refresh_token":
@@ -81,8 +85,9 @@ def get_access_token_from_refresh_token(
             detail="Invalid refresh token",
         )
 
-    token_data = dependencies.decode_token(refresh_token.token, settings)
-    user = models.User.get_by_id(db, id=token_data.sub)
+    token_data = decode_token(refresh_token.token, settings)
+    await dependencies.check_token_not_revoked(db, token_data)
+    user = await models.User.get_by_id_async(db, id=token_data.sub)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -92,21 +97,51 @@ def get_access_token_from_refresh_token(
     return response
 
 
+@router.post(
+    "/logout",
+    summary="Revoke the current access token",
+)
+async def logout(
+    refresh_token: str | None = Body(default=None, embed=True),
+    db: DBSession = Depends(dependencies.get_db),
+    token_data: schemas.TokenPayload = Depends(dependencies.get_token_data),
+    settings: Settings = Depends(get_settings),
+):
+    """
+    Revoke the access token used in the request and,
+    if provided, the refresh token of the same user.
+    """
+    revoked_tokens = [token_data]
+    if refresh_token:
+        refresh_token_data = decode_token(refresh_token, settings)
+        if refresh_token_data.sub != token_data.sub:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid refresh token",
+            )
+        revoked_tokens.append(refresh_token_data)
+
+    await run_db(db, models.RevokedToken.revoke_tokens, revoked_tokens)
+
+    return {"message": "Logged out"}
+
+
 @router.post(
     "/register",
     response_model=schemas.User,
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(dependencies.limit_registrations)],
     summary="Register a new user",
     response_description="The new created user",
 )
-def register_user(
+async def register_user(
     *,
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
     user_in: schemas.UserCreate,
     settings: Settings = Depends(get_settings),
     request: Request,
 ):
-    user = models.User.get_by_email(db, user_in.email)
+    user = await models.User.get_by_email_async(db, user_in.email)
     if user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -115,14 +150,16 @@ def register_user(
 
     # already verified if emails are not supported
     is_verified = not settings.EMAIL_ENABLED
-    user = models.User.create(db, user_in, is_verified)
+    user = await models.User.create_async(db, user_in, is_verified)
 
     if settings.EMAIL_ENABLED:
         # send account verification email
         account_verification_token = create_account_verification_token(user.email)
         endpoint = request.url_for("verify_account")
         account_verification_url = f"{endpoint}?token={account_verification_token}"
-        send_account_verification_email(user, account_verification_url)
+        await run_in_threadpool(
+            send_account_verification_email, user, account_verification_url
+        )
 
     return user
 
@@ -131,19 +168,42 @@ def register_user(
     "/verify_account",
     summary="Account verification",
 )
-def verify_account(
+async def verify_account(
     token: str = Body(..., embed=True),
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
     settings: Settings = Depends(get_settings),
 ):
     token_data = decode_token(token, settings)
-    user = models.User.get_by_email(db, token_data.sub)
+    user = await models.User.get_by_email_async(db, token_data.sub)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No user registered with that email",
         )
 
-    models.User.update(db, current=user, new={"is_verified": True})
+    await models.User.update_async(db, current=user, new={"is_verified": True})
 
     return {"message": "User verified"}
+
+
+@router.get(
+    "/.well-known/jwks.json",
+    summary="Get the public keys to verify access tokens",
+    response_description="The JSON Web Key Set",
+)
+def get_jwks(
+    response: Response,
+    settings: Settings = Depends(get_settings),
+):
+    """
+    Public keys that other services can use to verify access tokens locally.
+    The set is empty if tokens are signed with a symmetric secret key.
+    """
+    if not settings.JWT_KEYS_FILE:
+        return {"keys": []}
+
+    response.headers[
+        "Cache-Control"
+    ] = f"public, max-age={settings.JWT_KEYS_RELOAD_SECONDS}"
+    key_ring = get_key_ring(settings.JWT_KEYS_FILE, settings.JWT_KEYS_RELOAD_SECONDS)
+    return key_ring.jwks()
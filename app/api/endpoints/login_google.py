@@ -1,31 +1,45 @@
-import secrets
-import string
-
-import requests
 from fastapi import APIRouter, Body, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from app import models, schemas
 from app.api import dependencies
+from app.core.google_auth import google_token_validator
+from app.database.db import DBSession, run_db
 
 from .login import _check_active_user_exists, _generate_token_response
 
 router = APIRouter(prefix="", tags=["login"])
 
+GOOGLE_PROVIDER = "google"
 
-def _validate_google_token(token: str) -> dict[str, str]:
-    headers = {"Authorization": f"Bearer {token}"}
-    resp = requests.get(
-        "https://www.googleapis.com/oauth2/v3/userinfo", headers=headers
-    )
 
-    if resp.status_code != 200:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Incorrect email or password",
-        )
+async def _validate_google_token(token: str) -> dict[str, str]:
+    return await google_token_validator.validate(token)
+
+
+def _is_email_verified(user_data: dict[str, str]) -> bool:
+    # a boolean in the ID tokens, but a string in some userinfo responses
+    return user_data.get("email_verified") in (True, "true")
+
+
+def _get_google_user(db: Session, user_data: dict[str, str]):
+    """
+    Get the user linked to the Google account. Users registered before
+    linking accounts are found by email, and linked on their first login,
+    only if Google has verified that the email belongs to the account.
+    """
+    user = models.User.get_by_identity(db, GOOGLE_PROVIDER, user_data["sub"])
+    if user:
+        return user
 
-    return resp.json()
+    if not _is_email_verified(user_data):
+        return None
+
+    user = models.User.get_by_email(db, email=user_data.get("email"))
+    if user:
+        models.UserIdentity.create(db, user.id, GOOGLE_PROVIDER, user_data["sub"])
+
+    return user
 
 
 @router.post(
@@ -34,16 +48,16 @@ def _validate_google_token(token: str) -> dict[str, str]:
     summary="Validate Google token and get a new API access token",
     response_description="The access token",
 )
-def get_access_token_from_google(
+async def get_access_token_from_google(
     access_token: str = Body(embed=True),
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
 ):
     """
     Get an OAuth2 access token from a user logging with Google,
     to use in future requests as an authenticated user.
     """
-    user_data = _validate_google_token(access_token)
-    user = models.User.get_by_email(db, email=user_data.get("email"))
+    user_data = await _validate_google_token(access_token)
+    user = await run_db(db, _get_google_user, user_data)
     _check_active_user_exists(user)
 
     response = _generate_token_response(user.id)
@@ -57,26 +71,34 @@ def get_access_token_from_google(
     summary="Validate Google token and create a new user",
     response_description="The created user",
 )
-def create_user_from_google(
+async def create_user_from_google(
     access_token: str = Body(embed=True),
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
 ):
-    user_data = _validate_google_token(access_token)
-    user = models.User.get_by_email(db, email=user_data.get("email"))
+    user_data = await _validate_google_token(access_token)
+    if not _is_email_verified(user_data):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Google email not verified",
+        )
+
+    user = await models.User.get_by_identity_async(
+        db, GOOGLE_PROVIDER, user_data["sub"]
+    ) or await models.User.get_by_email_async(db, email=user_data.get("email"))
     if user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
 
-    random_password = "".join(
-        secrets.choice(string.ascii_letters + string.digits) for i in range(20)
+    # no password for users registered using Google, they can set one later
+    # by recovering the password
+    user = await models.User.create_federated_async(
+        db,
+        email=user_data["email"],
+        provider=GOOGLE_PROVIDER,
+        subject=user_data["sub"],
+        full_name=user_data.get("name"),
     )
-    user_create = schemas.UserCreate(email=user_data["email"], password=random_password)
-    if "name" in user_data:
-        user_create.full_name = user_data["name"]
-
-    # user already verified if registering using Google
-    user = models.User.create(db, user_create, is_verified=True)
 
     return user
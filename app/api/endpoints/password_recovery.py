@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import EmailStr
-from sqlalchemy.orm import Session
 
 from app import models
 from app.api import dependencies
 from app.api.emails.email_utils import send_password_recovery_email
 from app.core.config import Settings, get_settings
 from app.core.security import create_password_reset_token, decode_token
+from app.database.db import DBSession, run_db
 
 router = APIRouter(prefix="", tags=["password_recovery"])
 
@@ -14,12 +15,13 @@ router = APIRouter(prefix="", tags=["password_recovery"])
 @router.post(
     "/password_recovery",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(dependencies.limit_password_recovery)],
     summary="Password recovery",
 )
-def recover_password(
+async def recover_password(
     request: Request,
     email: EmailStr = Body(..., embed=True),
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
     settings: Settings = Depends(get_settings),
 ):
     if not settings.EMAIL_ENABLED:
@@ -28,7 +30,7 @@ def recover_password(
             detail="Sending emails not supported",
         )
 
-    user = models.User.get_by_email(db, email)
+    user = await models.User.get_by_email_async(db, email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -38,7 +40,7 @@ def recover_password(
     password_reset_token = create_password_reset_token(email)
     endpoint = request.url_for("reset_password")
     reset_url = f"{endpoint}?token={password_reset_token}"
-    send_password_recovery_email(user=user, url=reset_url)
+    await run_in_threadpool(send_password_recovery_email, user=user, url=reset_url)
 
     return {"message": "Password recovery email sent"}
 
@@ -47,20 +49,26 @@ def recover_password(
     "/password_reset",
     summary="Password reset",
 )
-def reset_password(
+async def reset_password(
     token: str = Body(...),
     password: str = Body(...),
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
     settings: Settings = Depends(get_settings),
 ):
     token_data = decode_token(token, settings)
-    user = models.User.get_by_email(db, token_data.sub)
+    # reset tokens can only be used once
+    await dependencies.check_token_not_revoked(db, token_data)
+    user = await models.User.get_by_email_async(db, token_data.sub)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No user registered with that email",
         )
 
-    models.User.update(db, current=user, new={"password": password})
+    await models.User.update_async(db, current=user, new={"password": password})
+
+    # revoke the reset token and all the tokens issued with the old password
+    await run_db(db, models.RevokedToken.revoke_token, token_data, commit=False)
+    await run_db(db, models.RevokedToken.revoke_user, user.id)
 
     return {"message": "Password updated"}
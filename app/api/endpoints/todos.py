@@ -1,25 +1,36 @@
+import logging
 from datetime import datetime
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 
 from app import models, schemas
-from app.api import dependencies
+from app.api import dependencies, export, fieldsets, imports, pagination
+from app.api.responses import FastJSONResponse, RowsJSONResponse
+from app.core.config import get_settings
+from app.database.db import DBSession
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
 
 router = APIRouter(prefix="/todos", tags=["todos"])
 
 
-def get_todo_from_id(
+async def get_todo_from_id(
     todo_id: int,
-    db: Session = Depends(dependencies.get_db),
-    current_user: models.User = Depends(dependencies.get_current_active_user),
+    db: DBSession = Depends(dependencies.get_read_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
 ):
     """
     Common dependency to check that the ToDo item exists and
     that the current user has access to it.
     """
-    todo = models.ToDo.get_by_id(db, id=todo_id)
+    todo = await models.ToDo.get_by_id_async(db, id=todo_id)
     if not todo:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -34,6 +45,55 @@ def get_todo_from_id(
     return todo
 
 
+def check_bulk_size(count: int):
+    if count > settings.TODOS_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many ToDo items (maximum {settings.TODOS_BULK_MAX_ITEMS})",
+        )
+
+
+async def get_bulk_results(
+    db: DBSession,
+    ids: list[int],
+    todos: dict[int, models.ToDo | None],
+    status_code: int,
+) -> list[schemas.ToDoBulkResult]:
+    """
+    Result of each requested ID, in the same order, with the same errors
+    as get_todo_from_id for the todos that were not processed.
+    """
+    missing_ids = [todo_id for todo_id in ids if todo_id not in todos]
+    owners = await models.ToDo.get_owners_async(db, missing_ids) if missing_ids else {}
+
+    results = []
+    for todo_id in ids:
+        if todo_id in todos:
+            result = schemas.ToDoBulkResult(
+                id=todo_id, status_code=status_code, todo=todos[todo_id]
+            )
+        elif todo_id in owners:
+            result = schemas.ToDoBulkResult(
+                id=todo_id,
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="ToDo does not belong to current user",
+            )
+        else:
+            result = schemas.ToDoBulkResult(
+                id=todo_id,
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="ToDo not found",
+            )
+        results.append(result)
+
+    return results
+
+
+def get_owner_id(current_user: schemas.Principal) -> int | None:
+    # superusers have access to the todos of every user
+    return None if current_user.is_superuser else current_user.id
+
+
 @router.post(
     "",
     response_model=schemas.ToDoOut,
@@ -41,13 +101,15 @@ def get_todo_from_id(
     summary="Create a new ToDo",
     response_description="The new created ToDo",
 )
-def create_todo(
+async def create_todo(
     *,
-    db: Session = Depends(dependencies.get_db),
-    current_user: models.User = Depends(dependencies.get_current_active_user),
+    db: DBSession = Depends(dependencies.get_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
     todo_in: schemas.ToDoCreate,
 ):
-    todo = models.ToDo.create(db, todo_in, current_user.id)
+    todo = await models.ToDo.create_async(db, todo_in, current_user.id)
     return todo
 
 
@@ -57,37 +119,314 @@ def create_todo(
     summary="Get a range of todos for the current user",
     response_description="List of todos",
 )
-def read_todos(
-    db: Session = Depends(dependencies.get_db),
-    current_user: models.User = Depends(dependencies.get_current_active_user),
-    offset: int = Query(default=0, ge=0),
-    limit: int = Query(default=100, ge=0),
+async def read_todos(
+    db: DBSession = Depends(dependencies.get_read_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
+    page: tuple[str | None, int, int] = Depends(pagination.get_page_params),
+    fields: tuple[str, ...] = Depends(fieldsets.get_fields_param(schemas.ToDoOut)),
     start_datetime: datetime | None = None,
     end_datetime: datetime | None = None,
     done: bool | None = None,
 ):
-    return models.ToDo.get_multiple(
+    cursor, offset, limit = page
+    after = pagination.decode_cursor(cursor, datetime, int) if cursor else None
+    # rows with the fields of the response, serialized without validating them
+    todos = await models.ToDo.get_multiple_rows_async(
         db,
+        fields,
         user_id=current_user.id,
         offset=offset,
         limit=limit,
         start_datetime=start_datetime,
         end_datetime=end_datetime,
         done=done,
+        after=after,
+    )
+    response = RowsJSONResponse(todos, fields)
+    pagination.set_next_cursor(response, todos, limit, "time_created", "id")
+    return response
+
+
+@router.get(
+    "/stats",
+    response_model=schemas.ToDoStats,
+    summary="Get the todo counts of the current user",
+    response_description="Total, open and done todos, and todos done per day",
+)
+async def read_todo_stats(
+    db: DBSession = Depends(dependencies.get_read_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
+):
+    stats = await models.ToDo.get_stats_async(db, current_user.id)
+    # already a response model, not validated again
+    return FastJSONResponse(stats)
+
+
+@router.post(
+    "/bulk",
+    response_model=list[schemas.ToDoBulkResult],
+    status_code=status.HTTP_201_CREATED,
+    summary="Create several ToDos",
+    response_description="The result of each ToDo, in the same order",
+)
+async def create_todos(
+    *,
+    db: DBSession = Depends(dependencies.get_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
+    todos_in: schemas.ToDoBulkCreate,
+):
+    check_bulk_size(len(todos_in.items))
+    todos = await models.ToDo.create_multiple_async(db, todos_in.items, current_user.id)
+    results = [
+        schemas.ToDoBulkResult(
+            id=todo.id, status_code=status.HTTP_201_CREATED, todo=todo
+        )
+        for todo in todos
+    ]
+    return FastJSONResponse(results, status_code=status.HTTP_201_CREATED)
+
+
+@router.patch(
+    "/bulk",
+    response_model=list[schemas.ToDoBulkResult],
+    status_code=status.HTTP_207_MULTI_STATUS,
+    summary="Update several ToDos by ID",
+    response_description="The result of each ToDo, in the same order",
+)
+async def update_todos(
+    *,
+    db: DBSession = Depends(dependencies.get_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
+    update_data: schemas.ToDoBulkUpdate,
+):
+    """
+    Multi-Status response, as some ToDos can fail: the status of each one
+    (200 if updated) is in its result.
+    """
+    check_bulk_size(len(update_data.items))
+    updates = {
+        item.id: item.dict(exclude_unset=True, exclude={"id"})
+        for item in update_data.items
+    }
+    todos = await models.ToDo.update_multiple_async(
+        db, updates, get_owner_id(current_user)
+    )
+    results = await get_bulk_results(
+        db, list(updates), {todo.id: todo for todo in todos}, status.HTTP_200_OK
+    )
+    return FastJSONResponse(results, status_code=status.HTTP_207_MULTI_STATUS)
+
+
+@router.put(
+    "/bulk/resolve",
+    response_model=list[schemas.ToDoBulkResult],
+    status_code=status.HTTP_207_MULTI_STATUS,
+    summary="Mark several ToDos as done",
+    response_description="The result of each ToDo, in the same order",
+)
+async def mark_multiple_as_done(
+    *,
+    db: DBSession = Depends(dependencies.get_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
+    todo_ids: schemas.ToDoBulkIds,
+):
+    """
+    Multi-Status response, as some ToDos can fail: the status of each one
+    (200 if marked as done) is in its result.
+    """
+    ids = list(dict.fromkeys(todo_ids.ids))
+    check_bulk_size(len(ids))
+    update_data: dict[str, Any] = {
+        "done": True,
+        "time_done": datetime.utcnow().replace(microsecond=0),
+    }
+    todos = await models.ToDo.update_all_async(
+        db, ids, update_data, get_owner_id(current_user)
+    )
+    results = await get_bulk_results(
+        db, ids, {todo.id: todo for todo in todos}, status.HTTP_200_OK
+    )
+    return FastJSONResponse(results, status_code=status.HTTP_207_MULTI_STATUS)
+
+
+@router.delete(
+    "/bulk",
+    response_model=list[schemas.ToDoBulkResult],
+    status_code=status.HTTP_207_MULTI_STATUS,
+    summary="Delete several ToDos by ID",
+    response_description="The result of each ToDo, in the same order",
+)
+async def delete_todos(
+    db: DBSession = Depends(dependencies.get_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
+    ids: list[int] = Query(),
+):
+    """
+    Multi-Status response, as some ToDos can fail: the status of each one
+    (204 if deleted) is in its result.
+    """
+    ids = list(dict.fromkeys(ids))
+    check_bulk_size(len(ids))
+    deleted_ids = await models.ToDo.delete_multiple_async(
+        db, ids, get_owner_id(current_user)
+    )
+    results = await get_bulk_results(
+        db,
+        ids,
+        dict.fromkeys(deleted_ids),
+        status.HTTP_204_NO_CONTENT,
+    )
+    return FastJSONResponse(results, status_code=status.HTTP_207_MULTI_STATUS)
+
+
+async def export_todos_response(
+    db: DBSession,
+    user_id: int | None,
+    export_format: export.ExportFormat,
+    start_datetime: datetime | None,
+    end_datetime: datetime | None,
+    done: bool | None,
+):
+    todos = models.ToDo.stream_async(
+        db,
+        user_id=user_id,
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        done=done,
+        batch_size=settings.TODOS_EXPORT_BATCH_SIZE,
+    )
+    return export.stream_export(
+        todos, list(schemas.ToDoOut.__fields__), export_format, filename="todos"
+    )
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    summary="Export all the todos of the current user",
+    response_description="The todos as NDJSON (one per line) or CSV",
+)
+async def export_todos(
+    db: DBSession = Depends(dependencies.get_read_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
+    export_format: export.ExportFormat = Query(
+        default=export.ExportFormat.ndjson, alias="format"
+    ),
+    start_datetime: datetime | None = None,
+    end_datetime: datetime | None = None,
+    done: bool | None = None,
+):
+    return await export_todos_response(
+        db, current_user.id, export_format, start_datetime, end_datetime, done
     )
 
 
+@router.get(
+    "/export/all",
+    response_class=StreamingResponse,
+    summary="Export the todos of all the users",
+    response_description="The todos as NDJSON (one per line) or CSV",
+)
+async def export_all_todos(
+    db: DBSession = Depends(dependencies.get_read_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_superuser
+    ),
+    export_format: export.ExportFormat = Query(
+        default=export.ExportFormat.ndjson, alias="format"
+    ),
+    start_datetime: datetime | None = None,
+    end_datetime: datetime | None = None,
+    done: bool | None = None,
+):
+    return await export_todos_response(
+        db, None, export_format, start_datetime, end_datetime, done
+    )
+
+
+@router.post(
+    "/import",
+    response_model=schemas.ToDoImportResult,
+    summary="Import todos from a NDJSON or CSV body",
+    response_description="The number of imported todos and the invalid lines",
+)
+async def import_todos(
+    request: Request,
+    db: DBSession = Depends(dependencies.get_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
+    import_format: imports.ImportFormat = Query(
+        default=imports.ImportFormat.ndjson, alias="format"
+    ),
+):
+    """
+    Import todos from a streamed body, with a new todo per line (NDJSON) or per
+    record (CSV with a header line). The body is parsed as it arrives and the
+    valid todos are written in batches, the invalid lines are skipped.
+    """
+    result = schemas.ToDoImportResult()
+    batch: list[schemas.ToDoCreate] = []
+
+    async def write_batch():
+        result.imported += await models.ToDo.import_multiple_async(
+            db, batch, current_user.id
+        )
+        batch.clear()
+        logger.info(
+            "Imported %d todos of user %s (%d failed)",
+            result.imported,
+            current_user.id,
+            result.failed,
+        )
+
+    records = imports.iter_records(request.stream(), import_format)
+    async for line, record, error in records:
+        if error is None:
+            try:
+                batch.append(schemas.ToDoCreate.parse_obj(record))
+            except ValidationError as e:
+                error = imports.validation_error_detail(e)
+
+        if error is not None:
+            result.failed += 1
+            if len(result.errors) < settings.TODOS_IMPORT_MAX_ERRORS:
+                result.errors.append(schemas.ToDoImportError(line=line, detail=error))
+        elif len(batch) >= settings.TODOS_IMPORT_BATCH_SIZE:
+            await write_batch()
+
+    if batch:
+        await write_batch()
+
+    return FastJSONResponse(result)
+
+
 @router.get(
     "/{todo_id}",
     response_model=schemas.ToDoOut,
     summary="Get a specific ToDo by ID",
     response_description="The ToDo with the specified ID",
 )
-def read_todo_by_id(
+async def read_todo_by_id(
     todo: models.ToDo = Depends(get_todo_from_id),
+    fields: tuple[str, ...] = Depends(fieldsets.get_fields_param(schemas.ToDoOut)),
 ):
 
-    return todo
+    return fieldsets.fieldset_response(todo, schemas.ToDoOut, fields)
 
 
 @router.put(
@@ -96,12 +435,12 @@ def read_todo_by_id(
     summary="Update a specific ToDo by ID",
     response_description="The updated ToDo with the specified ID",
 )
-def update_todo_by_id(
+async def update_todo_by_id(
     update_data: schemas.ToDoUpdate,
     todo: models.ToDo = Depends(get_todo_from_id),
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
 ):
-    todo = models.ToDo.update(db, current=todo, new=update_data)
+    todo = await models.ToDo.update_async(db, current=todo, new=update_data)
     return todo
 
 
@@ -110,11 +449,11 @@ def update_todo_by_id(
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Delete a specific ToDo by ID",
 )
-def delete_todo_by_id(
+async def delete_todo_by_id(
     todo: models.ToDo = Depends(get_todo_from_id),
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
 ):
-    models.ToDo.delete(db, todo)
+    await models.ToDo.delete_async(db, todo)
     # the body will be empty when using status code 204
 
 
@@ -124,13 +463,13 @@ def delete_todo_by_id(
     summary="Mark a specific ToDo as done",
     response_description="The done ToDo with the specified ID",
 )
-def mark_as_done(
+async def mark_as_done(
     todo: models.ToDo = Depends(get_todo_from_id),
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
 ):
     update_data: dict[str, Any] = {
         "done": True,
         "time_done": datetime.utcnow().replace(microsecond=0),
     }
-    todo = models.ToDo.update(db, current=todo, new=update_data)
+    todo = await models.ToDo.update_async(db, current=todo, new=update_data)
     return todo
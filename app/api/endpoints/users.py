@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 
 from app import models, schemas
-from app.api import dependencies
+from app.api import dependencies, fieldsets, pagination
+from app.api.responses import RowsJSONResponse
+from app.database.db import DBSession
+from app.database.purge import user_purger
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -14,25 +16,27 @@ router = APIRouter(prefix="/users", tags=["users"])
     summary="Create a new user",
     response_description="The new created user",
 )
-def create_user(
+async def create_user(
     *,
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
     user_in: schemas.UserCreate,
-    current_user: models.User = Depends(dependencies.get_current_active_superuser),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_superuser
+    ),
 ):
     """
     Open endpoint to creat a new user. No need to be
     logged in, anyone can create a user and then log
     in as that user to perform more actions.
     """
-    user = models.User.get_by_email(db, user_in.email)
+    user = await models.User.get_by_email_async(db, user_in.email)
     if user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
 
-    user = models.User.create(db, user_in)
+    user = await models.User.create_async(db, user_in)
     return user
 
 
@@ -42,13 +46,22 @@ def create_user(
     summary="Get a range of users",
     response_description="List of users",
 )
-def read_users(
-    db: Session = Depends(dependencies.get_db),
-    current_user: models.User = Depends(dependencies.get_current_active_superuser),
-    offset: int = Query(default=0, ge=0),
-    limit: int = Query(default=100, ge=0),
+async def read_users(
+    db: DBSession = Depends(dependencies.get_read_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_superuser
+    ),
+    page: tuple[str | None, int, int] = Depends(pagination.get_page_params),
+    fields: tuple[str, ...] = Depends(fieldsets.get_fields_param(schemas.User)),
 ):
-    return models.User.get_multiple(db, offset=offset, limit=limit)
+    cursor, offset, limit = page
+    after_id = pagination.decode_cursor(cursor, int)[0] if cursor else None
+    users = await models.User.get_multiple_rows_async(
+        db, fields, offset=offset, limit=limit, after_id=after_id
+    )
+    response = RowsJSONResponse(users, fields)
+    pagination.set_next_cursor(response, users, limit, "id")
+    return response
 
 
 @router.get(
@@ -57,15 +70,16 @@ def read_users(
     summary="Get current user",
     response_description="The current user information",
 )
-def read_user_me(
-    db: Session = Depends(dependencies.get_db),
+async def read_user_me(
+    db: DBSession = Depends(dependencies.get_read_db),
     current_user: models.User = Depends(dependencies.get_current_active_user),
+    fields: tuple[str, ...] = Depends(fieldsets.get_fields_param(schemas.User)),
 ):
     """
     Get the user currently logged in.
     """
 
-    return current_user
+    return fieldsets.fieldset_response(current_user, schemas.User, fields)
 
 
 @router.get(
@@ -74,12 +88,15 @@ def read_user_me(
     summary="Get a specific user by ID",
     response_description="The user with the specified ID",
 )
-def read_user_by_id(
+async def read_user_by_id(
     user_id: int,
-    db: Session = Depends(dependencies.get_db),
-    current_user: models.User = Depends(dependencies.get_current_active_user),
+    db: DBSession = Depends(dependencies.get_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
+    fields: tuple[str, ...] = Depends(fieldsets.get_fields_param(schemas.User)),
 ):
-    user = models.User.get_by_id(db, id=user_id)
+    user = await models.User.get_by_id_async(db, id=user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -90,7 +107,7 @@ def read_user_by_id(
     if user.id != current_user.id and not current_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-    return user
+    return fieldsets.fieldset_response(user, schemas.User, fields)
 
 
 @router.put(
@@ -99,12 +116,14 @@ def read_user_by_id(
     summary="Update current user",
     response_description="The updated current user",
 )
-def update_user_me(
+async def update_user_me(
     update_data: schemas.UserUpdate,
-    db: Session = Depends(dependencies.get_db),
+    db: DBSession = Depends(dependencies.get_db),
     current_user: models.User = Depends(dependencies.get_current_active_user),
 ):
-    updated_user = models.User.update(db, current=current_user, new=update_data)
+    updated_user = await models.User.update_async(
+        db, current=current_user, new=update_data
+    )
     return updated_user
 
 
@@ -114,13 +133,15 @@ def update_user_me(
     summary="Update a specific user by ID",
     response_description="The updated user with the specified ID",
 )
-def update_user_by_id(
+async def update_user_by_id(
     user_id: int,
     update_data: schemas.UserUpdate,
-    db: Session = Depends(dependencies.get_db),
-    current_user: models.User = Depends(dependencies.get_current_active_user),
+    db: DBSession = Depends(dependencies.get_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
 ):
-    user = models.User.get_by_id(db, id=user_id)
+    user = await models.User.get_by_id_async(db, id=user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -131,7 +152,7 @@ def update_user_by_id(
     if user.id != current_user.id and not current_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-    user = models.User.update(db, current=user, new=update_data)
+    user = await models.User.update_async(db, current=user, new=update_data)
     return user
 
 
@@ -140,12 +161,17 @@ def update_user_by_id(
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Delete current user",
 )
-def delete_user_me(
-    db: Session = Depends(dependencies.get_db),
+async def delete_user_me(
+    background_tasks: BackgroundTasks,
+    db: DBSession = Depends(dependencies.get_db),
     current_user: models.User = Depends(dependencies.get_current_active_user),
 ):
-
-    models.User.delete(db, current_user)
+    """
+    The user is gone right away, while its todos are deleted in the background
+    (after sending the response).
+    """
+    await models.User.soft_delete_async(db, current_user)
+    background_tasks.add_task(user_purger.purge_user, db, current_user.id)
     # the body will be empty when using status code 204
 
 
@@ -154,12 +180,15 @@ def delete_user_me(
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Delete a specific user by ID",
 )
-def delete_user_by_id(
+async def delete_user_by_id(
     user_id: int,
-    db: Session = Depends(dependencies.get_db),
-    current_user: models.User = Depends(dependencies.get_current_active_user),
+    background_tasks: BackgroundTasks,
+    db: DBSession = Depends(dependencies.get_db),
+    current_user: schemas.Principal = Depends(
+        dependencies.get_current_active_principal
+    ),
 ):
-    user = models.User.get_by_id(db, id=user_id)
+    user = await models.User.get_by_id_async(db, id=user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -170,5 +199,6 @@ def delete_user_by_id(
     if user.id != current_user.id and not current_user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-    models.User.delete(db, user)
+    await models.User.soft_delete_async(db, user)
+    background_tasks.add_task(user_purger.purge_user, db, user.id)
     # the body will be empty when using status code 204
@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Any, AsyncIterator
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.engine import Row
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def _export_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def _ndjson_chunks(
+    batches: AsyncIterator[list[Row]], fields: list[str]
+) -> AsyncIterator[str]:
+    async for batch in batches:
+        yield "".join(
+            json.dumps({field: _export_value(row._mapping[field]) for field in fields})
+            + "\n"
+            for row in batch
+        )
+
+
+async def _csv_chunks(
+    batches: AsyncIterator[list[Row]], fields: list[str]
+) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [_export_value(row._mapping[field]) for field in fields] for row in batch
+        )
+        yield buffer.getvalue()
+
+
+def stream_export(
+    batches: AsyncIterator[list[Row]],
+    fields: list[str],
+    export_format: ExportFormat,
+    filename: str,
+) -> StreamingResponse:
+    """
+    Response streaming the rows as they are fetched from the DB, one chunk
+    per batch of rows, so the memory used doesn't depend on the total rows.
+    """
+    chunks = (_ndjson_chunks if export_format == ExportFormat.ndjson else _csv_chunks)(
+        batches, fields
+    )
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="{filename}.{export_format.value}"'
+            )
+        },
+    )
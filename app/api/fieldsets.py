@@ -0,0 +1,48 @@
+from typing import Any, Callable
+
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel
+
+from app.api.responses import FastJSONResponse
+
+
+def get_fields_param(schema: type[BaseModel]) -> Callable[..., tuple[str, ...]]:
+    """
+    Dependency for the fields query parameter of the endpoints returning the
+    schema (comma separated), to only get some of its fields. The fields are
+    returned in the order of the schema, all of them by default.
+    """
+    all_fields = tuple(schema.__fields__)
+
+    def get_fields(
+        fields: str
+        | None = Query(
+            default=None,
+            description=f"Comma separated fields to get: {','.join(all_fields)}",
+        ),
+    ) -> tuple[str, ...]:
+        if fields is None:
+            return all_fields
+
+        requested = {field.strip() for field in fields.split(",")} - {""}
+        unknown = requested - set(all_fields)
+        if not requested or unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid fields: {','.join(sorted(unknown)) or fields}",
+            )
+
+        # same order for the same fields (they share the projection)
+        return tuple(field for field in all_fields if field in requested)
+
+    return get_fields
+
+
+def fieldset_response(
+    obj: Any, schema: type[BaseModel], fields: tuple[str, ...]
+) -> FastJSONResponse:
+    """
+    Response with only the given fields of an ORM object, validated with the
+    schema (instead of the response model of the endpoint).
+    """
+    return FastJSONResponse(schema.from_orm(obj).dict(include=set(fields)))
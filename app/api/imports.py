@@ -0,0 +1,120 @@
+import codecs
+import csv
+import json
+from enum import Enum
+from typing import Any, AsyncIterator
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+
+# longest line accepted, so that a body without newlines is never buffered
+MAX_LINE_BYTES = 1024 * 1024
+
+
+class ImportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Lines of a streamed UTF-8 body, decoded incrementally as the chunks arrive.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        try:
+            pending += decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The body is not valid UTF-8",
+            )
+
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+
+        if len(pending) > MAX_LINE_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Line longer than {MAX_LINE_BYTES} bytes",
+            )
+
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_records(
+    chunks: AsyncIterator[bytes], import_format: ImportFormat
+) -> AsyncIterator[tuple[int, dict[str, Any] | None, str | None]]:
+    """
+    Records of a streamed NDJSON or CSV body (with a header line), as
+    (line number, record, error) tuples. Empty lines are skipped.
+    """
+    lines = iter_lines(chunks)
+    if import_format == ImportFormat.ndjson:
+        line_number = 0
+        async for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Invalid JSON: not an object"
+                continue
+            yield line_number, record, None
+        return
+
+    header = None
+    line_number = 0
+    # quoted values can have newlines, so a record can span several lines
+    record_lines: list[str] = []
+    record_size = 0
+    quotes = 0
+    async for line in lines:
+        line_number += 1
+        record_lines.append(line)
+        record_size += len(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            if record_size > MAX_LINE_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Record longer than {MAX_LINE_BYTES} bytes",
+                )
+            continue
+
+        first_line_number = line_number - len(record_lines) + 1
+        text = "\n".join(record_lines)
+        record_lines, record_size, quotes = [], 0, 0
+        if not text.strip():
+            continue
+
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            yield first_line_number, None, f"Invalid CSV: {e}"
+            continue
+
+        if header is None:
+            header = values
+        elif len(values) != len(header):
+            yield first_line_number, None, "Invalid CSV: wrong number of values"
+        else:
+            # CSV has no null values, empty values are taken as null
+            record = {key: value or None for key, value in zip(header, values)}
+            yield first_line_number, record, None
+
+    if record_lines:
+        yield line_number - len(record_lines) + 1, None, "Invalid CSV: unclosed quote"
+
+
+def validation_error_detail(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
@@ -0,0 +1,253 @@
+import zlib
+from typing import Callable
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.dependencies import READ_ONLY_METHODS, READ_YOUR_WRITES_COOKIE
+from app.database.db import replica_router
+
+try:
+    import brotli
+except ImportError:  # optional, like zstandard (gzip is always supported)
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# compressed content types (text based), except the streams of events,
+# whose events shouldn't wait for the compressor
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+NOT_COMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+class ReadYourWritesMiddleware:
+    """
+    After a successful write, make the client read from the primary DB for a
+    while, so that it doesn't miss its own writes on a lagging replica.
+
+    Plain ASGI middleware, because the ones based on BaseHTTPMiddleware
+    cancel the cleanup of the dependencies (closing the DB sessions).
+    """
+
+    def __init__(self, app: ASGIApp, max_age: int):
+        self.app = app
+        self.max_age = max_age
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] in READ_ONLY_METHODS
+            or not replica_router.replicas
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "set-cookie",
+                    f"{READ_YOUR_WRITES_COOKIE}=1; HttpOnly; Max-Age={self.max_age}; "
+                    "Path=/; SameSite=lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# supported encodings, in order of preference (when the client accepts
+# several of them equally)
+COMPRESSORS: dict[str, type] = {}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = ZstdCompressor
+if brotli is not None:
+    COMPRESSORS["br"] = BrotliCompressor
+COMPRESSORS["gzip"] = GzipCompressor
+
+
+def choose_encoding(accept_encoding: str, encodings: list[str]) -> str | None:
+    """
+    Supported encoding with the highest quality in the Accept-Encoding header,
+    None if the client doesn't accept any of them.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    chosen, chosen_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > chosen_quality:
+            chosen, chosen_quality = encoding, quality
+
+    return chosen
+
+
+def is_compressible(status_code: int, headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").lower()
+    return (
+        status_code >= 200
+        and status_code not in (204, 304)
+        # already compressed (or encoded in some other way)
+        and "content-encoding" not in headers
+        and "no-transform" not in headers.get("cache-control", "")
+        and content_type.startswith(COMPRESSIBLE_TYPES)
+        and not content_type.startswith(NOT_COMPRESSIBLE_TYPES)
+    )
+
+
+class CompressionMiddleware:
+    """
+    Compress the responses with the best encoding accepted by the client
+    (gzip, and also brotli and zstd if they are installed).
+
+    The responses smaller than minimum_size are sent as they are. Streaming
+    responses (of unknown size) are compressed chunk by chunk, flushing the
+    compressor after each chunk so that the client doesn't wait for more.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int, levels: dict[str, int]):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = levels
+        self.encodings = [encoding for encoding in COMPRESSORS if encoding in levels]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = None
+        if scope["type"] == "http" and scope["method"] != "HEAD":
+            accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+            encoding = choose_encoding(accept_encoding, self.encodings)
+
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        sender = _CompressingSender(
+            send,
+            encoding,
+            lambda: COMPRESSORS[encoding](self.levels[encoding]),
+            self.minimum_size,
+        )
+        await self.app(scope, receive, sender.send)
+
+
+class _CompressingSender:
+    """
+    Send function of a response, compressing its body once the first part is
+    known to decide (the start message is held until then).
+    """
+
+    def __init__(
+        self,
+        send: Send,
+        encoding: str,
+        create_compressor: Callable,
+        minimum_size: int,
+    ):
+        self._send = send
+        self.encoding = encoding
+        self.create_compressor = create_compressor
+        self.minimum_size = minimum_size
+        self.start_message: Message | None = None
+        self.compressor = None
+        self.skipped = False
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.skipped = not is_compressible(message["status"], headers)
+            if self.skipped:
+                await self._send(message)
+            else:
+                MutableHeaders(scope=message).add_vary_header("Accept-Encoding")
+            return
+
+        if message["type"] != "http.response.body" or self.skipped:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            if not more_body and len(body) < self.minimum_size:
+                self.skipped = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+
+            self.compressor = self.create_compressor()
+            headers = MutableHeaders(scope=self.start_message)
+            headers["Content-Encoding"] = self.encoding
+            del headers["Content-Length"]
+            if not more_body:
+                body = self.compressor.compress(body) + self.compressor.finish()
+                headers["Content-Length"] = str(len(body))
+                await self._send(self.start_message)
+                await self._send({**message, "body": body})
+                return
+
+            await self._send(self.start_message)
+
+        if more_body:
+            body = self.compressor.compress(body) + self.compressor.flush()
+        else:
+            body = self.compressor.compress(body) + self.compressor.finish()
+        await self._send({**message, "body": body})
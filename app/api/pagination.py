@@ -0,0 +1,77 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any
+
+from fastapi import HTTPException, Query, Response, status
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def get_page_params(
+    cursor: str
+    | None = Query(
+        default=None, description=f"Cursor from the {NEXT_CURSOR_HEADER} header"
+    ),
+    offset: int
+    | None = Query(
+        default=None, ge=0, description="Legacy pagination, slower for deep pages"
+    ),
+    limit: int = Query(
+        default=min(100, settings.PAGINATION_MAX_LIMIT),
+        ge=0,
+        le=settings.PAGINATION_MAX_LIMIT,
+    ),
+) -> tuple[str | None, int, int]:
+    """
+    Common dependency for the paginated listings, by cursor or by offset.
+    """
+    if cursor is not None and offset is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either cursor or offset",
+        )
+
+    return cursor, offset or 0, limit
+
+
+def encode_cursor(*values: int | datetime) -> str:
+    """
+    Opaque cursor with the sort key of the last item of a page.
+    """
+    data = [
+        value.isoformat() if isinstance(value, datetime) else value for value in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple[Any, ...]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(data, list) or len(data) != len(types):
+            raise ValueError("wrong number of values")
+
+        return tuple(
+            datetime.fromisoformat(value)
+            if value_type is datetime
+            else value_type(value)
+            for value, value_type in zip(data, types)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def set_next_cursor(response: Response, items: list, limit: int, *key: str):
+    # there can be more items only after a full page
+    if items and len(items) == limit:
+        last_item = items[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            *(getattr(last_item, field) for field in key)
+        )
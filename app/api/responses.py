@@ -0,0 +1,71 @@
+import json
+from datetime import date
+from typing import Any, Sequence
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.engine import Row
+
+try:
+    import orjson
+except ImportError:  # optional, falling back to the json module
+    orjson = None
+
+
+def _json_default(value: Any) -> Any:
+    # only called for the values that are not JSON types
+    # (orjson already serializes the dates and datetimes)
+    if isinstance(value, BaseModel):
+        return value.dict(by_alias=True)
+    if isinstance(value, date):
+        return value.isoformat()
+
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Compact JSON of the content, with orjson if it is installed. Both give
+    the same output, also for response models and datetimes, which don't
+    need to be converted to JSON types first (jsonable_encoder).
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            content, default=_json_default, option=orjson.OPT_NON_STR_KEYS
+        )
+
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        default=_json_default,
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class of the app. The endpoints can also return it
+    directly with validated response models (or lists of them), skipping
+    the validation of the response model and jsonable_encoder.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RowsJSONResponse(FastJSONResponse):
+    """
+    JSON array of DB rows (selected in the order of the fields, any other
+    columns after them are left out), serialized straight from the column
+    values, without an ORM object and a response model per row. Same output
+    as the response model of the fields.
+    """
+
+    def __init__(self, rows: list[Row], fields: Sequence[str], **kwargs):
+        self.fields = fields
+        super().__init__(rows, **kwargs)
+
+    def render(self, content: list[Row]) -> bytes:
+        return dumps([dict(zip(self.fields, row)) for row in content])
@@ -11,10 +11,81 @@ class Settings(BaseSettings):
 
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ALGORITHM: str = "HS256"
+    # JSON file with asymmetric signing keys, used instead of SECRET_KEY if set
+    JWT_KEYS_FILE: str | None = None
+    JWT_KEYS_RELOAD_SECONDS: int = 60
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 1 day
     PASSWORD_RESET_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # in-memory filter of revoked tokens, refreshed from the DB
+    REVOCATION_REFRESH_SECONDS: int = 5
+    REVOCATION_FILTER_CAPACITY: int = 100000
+    REVOCATION_FILTER_ERROR_RATE: float = 0.001
+    # revocations committed this long after they were added are still loaded,
+    # longer than any transaction (plus the clock skew between app and DB)
+    REVOCATION_REFRESH_OVERLAP_SECONDS: int = 60
+
+    # cache of already verified access tokens (per process)
+    TOKEN_CACHE_ENABLED: bool = True
+    TOKEN_CACHE_MAX_SIZE: int = 10000
+    TOKEN_CACHE_TTL_SECONDS: int = 300
+
+    # cache of the user fields needed for authorization (per process)
+    PRINCIPAL_CACHE_ENABLED: bool = True
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+
+    # cache of the todo stats of each user (per process), updated by its writes
+    TODO_STATS_CACHE_ENABLED: bool = True
+    TODO_STATS_CACHE_MAX_SIZE: int = 10000
+    TODO_STATS_CACHE_TTL_SECONDS: int = 300
+
+    # password hashing policy: new hashes use the first scheme, hashes of the
+    # other schemes (or with other costs) are upgraded on login
+    PASSWORD_HASH_SCHEMES: list[str] = ["bcrypt"]
+    BCRYPT_ROUNDS: int = 12
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 4
+    # minimum costs, only meant to speed up the tests
+    PASSWORD_HASH_LOW_COST: bool = False
+
+    # dedicated pool to hash and verify passwords ("thread" or "process")
+    PASSWORD_HASHING_POOL: str = "thread"
+    PASSWORD_HASHING_WORKERS: int = 2
+    PASSWORD_HASHING_MAX_QUEUE: int = 64
+
+    # rate limits of the login related endpoints ("memory" or "sqlite" backend)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_SQLITE_PATH: str = "./rate_limits.db"
+    RATE_LIMIT_WINDOW_SECONDS: int = 60
+    LOGIN_RATE_LIMIT_PER_IP: int = 20
+    LOGIN_RATE_LIMIT_PER_USERNAME: int = 5
+    PASSWORD_RECOVERY_RATE_LIMIT_PER_IP: int = 5
+    PASSWORD_RECOVERY_RATE_LIMIT_PER_EMAIL: int = 2
+    REGISTER_RATE_LIMIT_BURST: int = 5
+    REGISTER_RATE_LIMIT_PER_MINUTE: int = 5
+
+    # maximum page size of the listings
+    PAGINATION_MAX_LIMIT: int = 100
+
+    # maximum number of items in a request of the bulk todo endpoints
+    TODOS_BULK_MAX_ITEMS: int = 100
+    # rows fetched from the DB at a time by the todo exports
+    TODOS_EXPORT_BATCH_SIZE: int = 1000
+    # todos written to the DB at a time by the imports
+    TODOS_IMPORT_BATCH_SIZE: int = 1000
+    # errors reported by an import (the rest are only counted)
+    TODOS_IMPORT_MAX_ERRORS: int = 100
+
+    # todos deleted at a time when purging a deleted user
+    USER_PURGE_BATCH_SIZE: int = 1000
+    # time between runs of the purge of deleted users (to resume interrupted
+    # ones), 0 to only purge them in the requests that delete them
+    USER_PURGE_INTERVAL_SECONDS: int = 600
+
     POSTGRES_USER: str = "postgres"
     POSTGRES_PASSWORD: str = "postgres"
     POSTGRES_DB: str = "postgres"
@@ -23,20 +94,60 @@ class Settings(BaseSettings):
 
     SQLITE_DATABASE_URL: str = "sqlite:///./sql_dev.db"
 
+    # connection pool of each engine (per worker), ignored for SQLite
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30
+    DB_POOL_RECYCLE_SECONDS: int = -1  # -1 to never recycle connections
+    DB_POOL_PRE_PING: bool = False
+    DB_POOL_USE_LIFO: bool = False
+
+    # single statement writes (INSERT/UPDATE/DELETE ... RETURNING), if the DB
+    # supports them (not SQLite)
+    DATABASE_USE_RETURNING: bool = True
+
+    # use async DB sessions (asyncpg), or sync sessions run in the threadpool
+    DATABASE_ASYNC: bool = True
+
+    # read replicas (same URL format as the primary) for read-only requests
+    DATABASE_REPLICA_URLS: list[str] = []
+    # time a replica is skipped after failing
+    DATABASE_REPLICA_EJECT_SECONDS: int = 30
+    # reads of a client go to the primary for a while after it writes
+    READ_YOUR_WRITES_SECONDS: int = 10
+
+    # responses of at least this size (or streamed) are compressed, with the
+    # level of each encoding (brotli and zstd only if they are installed)
+    COMPRESSION_MINIMUM_SIZE: int = 1000
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_LEVEL: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
     USE_ALEMBIC: bool = False
 
     SUPERUSER_EMAIL: EmailStr = "superuser@secretdomain.com"
     SUPERUSER_PASSWORD: str = "secret_password"
 
+    GOOGLE_USERINFO_URL: str = "https://www.googleapis.com/oauth2/v3/userinfo"
+    # Google ID tokens are only accepted if the client ID is set
+    GOOGLE_CLIENT_ID: str | None = None
+    GOOGLE_JWKS_URL: str = "https://www.googleapis.com/oauth2/v3/certs"
+    GOOGLE_JWKS_DEFAULT_MAX_AGE_SECONDS: int = 3600
+    GOOGLE_HTTP_TIMEOUT_SECONDS: float = 5
+    GOOGLE_HTTP_MAX_CONNECTIONS: int = 20
+    GOOGLE_TOKEN_CACHE_MAX_SIZE: int = 10000
+    GOOGLE_TOKEN_CACHE_TTL_SECONDS: int = 60
+
     EMAIL_ENABLED: bool = False
     EMAIL_SENDER: str = "noreply@gmail.com"
 
     class Config:
         env_file = ".env"
 
-    def get_postgres_database_url(self) -> str:
+    def get_postgres_database_url(self, async_driver: bool = False) -> str:
+        driver = "asyncpg" if async_driver else "psycopg2"
         return (
-            f"postgresql+psycopg2://"
+            f"postgresql+{driver}://"
             f"{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
             f"@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         )
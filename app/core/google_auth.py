@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Any, Callable
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import httpx
+from fastapi import HTTPException, status
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+
+
+def _parse_max_age(headers: httpx.Headers) -> int | None:
+    match = re.search(r"max-age=(\d+)", headers.get("Cache-Control", ""))
+    if not match:
+        return None
+
+    # the response might have been in an HTTP cache for a while already
+    age = int(headers.get("Age", 0)) if headers.get("Age", "").isdigit() else 0
+    return max(int(match.group(1)) - age, 0)
+
+
+class GoogleJWKS:
+    """
+    Public keys that Google uses to sign ID tokens, parsed and kept in memory.
+    They are refreshed in the background according to the cache headers of
+    the JWKS response, so verifying a token doesn't need any request.
+    The URL can also be a file:// URL, mostly for testing purposes.
+    """
+
+    # refresh the keys a bit before they expire
+    REFRESH_MARGIN_SECONDS = 60
+    # minimum time between refreshes (e.g. when finding an unknown key ID)
+    MIN_REFRESH_INTERVAL_SECONDS = 30
+
+    def __init__(
+        self,
+        url: str,
+        default_max_age: int,
+        get_client: Callable[[], httpx.AsyncClient],
+    ):
+        self.url = url
+        self.default_max_age = default_max_age
+        self.expires_at = 0.0
+        self._get_client = get_client
+        # parsed keys and their algorithms, indexed by key ID
+        self._keys: dict[str, tuple[Key, str]] = {}
+        self._refreshed_at: float | None = None
+        self._refresh_lock: asyncio.Lock | None = None
+        self._task: asyncio.Task | None = None
+
+    async def _fetch(self) -> tuple[dict[str, Any], int]:
+        parsed_url = urlparse(self.url)
+        if parsed_url.scheme == "file":
+            with open(url2pathname(parsed_url.path)) as f:
+                return json.load(f), self.default_max_age
+
+        resp = await self._get_client().get(self.url)
+        resp.raise_for_status()
+        max_age = _parse_max_age(resp.headers)
+        return resp.json(), self.default_max_age if max_age is None else max_age
+
+    async def refresh(self):
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+
+        async with self._refresh_lock:
+            if (
+                self._refreshed_at is not None
+                and time.monotonic() - self._refreshed_at
+                < self.MIN_REFRESH_INTERVAL_SECONDS
+            ):
+                return
+
+            jwks, max_age = await self._fetch()
+            keys = {}
+            for key_data in jwks["keys"]:
+                algorithm = key_data.get("alg", "RS256")
+                keys[key_data["kid"]] = (jwk.construct(key_data, algorithm), algorithm)
+
+            self._keys = keys
+            self._refreshed_at = time.monotonic()
+            self.expires_at = time.time() + max_age
+
+    async def get_key(self, kid: str) -> tuple[Key, str] | None:
+        if kid not in self._keys or time.time() >= self.expires_at:
+            # keys might have been rotated since the last refresh
+            await self.refresh()
+
+        return self._keys.get(kid)
+
+    async def _refresh_periodically(self):
+        while True:
+            try:
+                await self.refresh()
+                delay = self.expires_at - time.time() - self.REFRESH_MARGIN_SECONDS
+            except (OSError, ValueError, KeyError, httpx.HTTPError, JWTError):
+                logger.exception("Could not refresh the Google JWKS")
+                delay = 0
+
+            await asyncio.sleep(max(delay, self.MIN_REFRESH_INTERVAL_SECONDS))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._refresh_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class GoogleTokenValidator:
+    """
+    Validate Google tokens. ID tokens (JWTs) are verified locally with the
+    cached Google public keys. Access tokens are validated with the userinfo
+    endpoint, using a shared connection pool. Validated tokens are cached
+    for a short time, and concurrent validations of the same token share a
+    single request.
+    """
+
+    def __init__(
+        self,
+        userinfo_url: str,
+        timeout: float,
+        max_connections: int,
+        cache_max_size: int,
+        cache_ttl: float,
+        client_id: str | None = None,
+        jwks_url: str | None = None,
+        jwks_default_max_age: int = 3600,
+    ):
+        self.userinfo_url = userinfo_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.client_id = client_id
+        self.cache = TTLCache(max_size=cache_max_size, ttl=cache_ttl)
+        self.jwks = (
+            GoogleJWKS(jwks_url, jwks_default_max_age, self._get_client)
+            if jwks_url
+            else None
+        )
+        self._client: httpx.AsyncClient | None = None
+        self._pending: dict[bytes, asyncio.Task] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # created lazily, it must be used from inside the event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+
+        return self._client
+
+    async def close(self):
+        if self.jwks is not None:
+            await self.jwks.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def validate(self, token: str) -> dict[str, Any]:
+        key = hashlib.sha256(token.encode()).digest()
+        user_data = self.cache.get(key)
+        if user_data is not None:
+            return user_data
+
+        # ID tokens are JWTs, access tokens are opaque strings
+        if token.count(".") == 2:
+            user_data = await self._verify_id_token(token)
+            # never accepted from the cache after the token expires
+            self.cache.set(key, user_data, ttl=user_data["exp"] - time.time())
+            return user_data
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_user_data(token))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+        # shield the shared request from the cancellation of a single caller
+        user_data = await asyncio.shield(task)
+        self.cache.set(key, user_data)
+
+        return user_data
+
+    async def _fetch_user_data(self, token: str) -> dict[str, Any]:
+        headers = {"Authorization": f"Bearer {token}"}
+        try:
+            resp = await self._get_client().get(self.userinfo_url, headers=headers)
+        except httpx.HTTPError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Could not validate Google token",
+            )
+
+        user_data = resp.json() if resp.status_code == 200 else {}
+        # users are identified by the Google account ID (sub)
+        if not user_data.get("sub") or not user_data.get("email"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Incorrect email or password",
+            )
+
+        return user_data
+
+    async def _verify_id_token(self, token: str) -> dict[str, Any]:
+        invalid_token = HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incorrect email or password",
+        )
+        # the audience must be checked, so a client ID is required
+        if self.jwks is None or not self.client_id:
+            raise invalid_token
+
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = await self.jwks.get_key(kid) if kid else None
+            if key is None:
+                raise invalid_token
+
+            public_key, algorithm = key
+            claims = jwt.decode(
+                token,
+                public_key,
+                algorithms=[algorithm],
+                audience=self.client_id,
+                issuer=GOOGLE_ISSUERS,
+                # the access token is not available to check at_hash
+                options={"verify_at_hash": False},
+            )
+        except JWTError:
+            raise invalid_token
+        except (OSError, ValueError, KeyError, httpx.HTTPError):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Could not validate Google token",
+            )
+
+        if not claims.get("email_verified"):
+            raise invalid_token
+
+        return claims
+
+
+settings = get_settings()
+
+google_token_validator = GoogleTokenValidator(
+    userinfo_url=settings.GOOGLE_USERINFO_URL,
+    timeout=settings.GOOGLE_HTTP_TIMEOUT_SECONDS,
+    max_connections=settings.GOOGLE_HTTP_MAX_CONNECTIONS,
+    cache_max_size=settings.GOOGLE_TOKEN_CACHE_MAX_SIZE,
+    cache_ttl=settings.GOOGLE_TOKEN_CACHE_TTL_SECONDS,
+    client_id=settings.GOOGLE_CLIENT_ID,
+    jwks_url=settings.GOOGLE_JWKS_URL,
+    jwks_default_max_age=settings.GOOGLE_JWKS_DEFAULT_MAX_AGE_SECONDS,
+)
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from jose import jwk
+from jose.backends.base import Key
+
+logger = logging.getLogger(__name__)
+
+# asymmetric algorithms supported by python-jose (EdDSA is not)
+ASYMMETRIC_ALGORITHMS = {
+    "ES256",
+    "ES384",
+    "ES512",
+    "RS256",
+    "RS384",
+    "RS512",
+}
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    algorithm: str
+    public_key: Key
+    # keys without a private key can only be used to verify tokens
+    private_key: Key | None = None
+
+
+class KeyRing:
+    """
+    Set of parsed signing keys indexed by their key ID (kid). Only the
+    active key signs new tokens, but any of the keys can verify them,
+    so keys can be rotated without invalidating the existing tokens.
+    """
+
+    def __init__(self, keys: list[SigningKey], active_kid: str):
+        self._keys = {key.kid: key for key in keys}
+        active_key = self._keys.get(active_kid)
+        if active_key is None or active_key.private_key is None:
+            raise ValueError(f"No private key found for the active key {active_kid}")
+
+        self.active = active_key
+
+    def get(self, kid: str | None) -> SigningKey | None:
+        return self._keys.get(kid) if kid else None
+
+    def jwks(self) -> dict[str, list[dict[str, Any]]]:
+        """
+        Public keys of the key ring, as a JSON Web Key Set.
+        """
+        keys = []
+        for key in self._keys.values():
+            public_jwk = key.public_key.to_dict()
+            public_jwk.update({"kid": key.kid, "use": "sig"})
+            keys.append(public_jwk)
+
+        return {"keys": keys}
+
+
+def _read_pem(data: dict[str, str], name: str, base_path: pathlib.Path) -> str | None:
+    # keys can be inline PEM strings or paths relative to the key ring file
+    if name in data:
+        return data[name]
+    if f"{name}_file" in data:
+        return (base_path / data[f"{name}_file"]).read_text()
+
+    return None
+
+
+def load_key_ring(path: str) -> KeyRing:
+    """
+    Load a key ring from a JSON file with the following format:
+    {
+        "active_kid": "key-2",
+        "keys": [
+            {"kid": "key-1", "alg": "ES256", "public_key_file": "key-1.pub.pem"},
+            {"kid": "key-2", "alg": "ES256", "private_key_file": "key-2.pem"}
+        ]
+    }
+    """
+    file_path = pathlib.Path(path)
+    data = json.loads(file_path.read_text())
+
+    keys = []
+    for key_data in data["keys"]:
+        algorithm = key_data["alg"]
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Unsupported key ring algorithm {algorithm}")
+
+        private_pem = _read_pem(key_data, "private_key", file_path.parent)
+        public_pem = _read_pem(key_data, "public_key", file_path.parent)
+        private_key = jwk.construct(private_pem, algorithm) if private_pem else None
+        if public_pem:
+            public_key = jwk.construct(public_pem, algorithm)
+        elif private_key:
+            public_key = private_key.public_key()
+        else:
+            raise ValueError(f"No key found for {key_data['kid']}")
+
+        keys.append(
+            SigningKey(
+                kid=key_data["kid"],
+                algorithm=algorithm,
+                public_key=public_key,
+                private_key=private_key,
+            )
+        )
+
+    return KeyRing(keys, active_kid=data["active_kid"])
+
+
+class KeyRingLoader:
+    """
+    Keep a parsed key ring in memory, reloading it when its file changes
+    (checking at most once every reload_seconds).
+    """
+
+    def __init__(self, path: str, reload_seconds: float):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._key_ring: KeyRing | None = None
+        self._mtime = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> KeyRing:
+        now = time.monotonic()
+        if self._key_ring is not None and now - self._checked_at < self.reload_seconds:
+            return self._key_ring
+
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime
+            if self._key_ring is None:
+                self._key_ring = load_key_ring(self.path)
+            elif mtime != self._mtime:
+                try:
+                    self._key_ring = load_key_ring(self.path)
+                except (OSError, ValueError, KeyError):
+                    # keep using the previous keys if the new file is not valid
+                    logger.exception("Could not reload the key ring %s", self.path)
+            self._mtime = mtime
+            self._checked_at = now
+
+        return self._key_ring
+
+
+_loaders: dict[str, KeyRingLoader] = {}
+
+
+def get_key_ring(path: str, reload_seconds: float) -> KeyRing:
+    loader = _loaders.get(path)
+    if loader is None:
+        loader = _loaders.setdefault(path, KeyRingLoader(path, reload_seconds))
+
+    return loader.get()
@@ -0,0 +1,183 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable
+
+from app.core.config import Settings, get_settings
+
+# a rate limit state transition: (old state, now) -> (new state, retry after)
+StateFunc = Callable[[Any, float], tuple[Any, float]]
+
+
+def sliding_window(limit: int, window: float) -> StateFunc:
+    """
+    Sliding window counter: the count of the previous fixed window is weighted
+    by how much it still overlaps with the sliding window ending now.
+    The state is (current window start, current count, previous count).
+    """
+
+    def hit(state, now):
+        window_start = now - now % window
+        current = previous = 0
+        if state is not None:
+            start, current, previous = state
+            if start != window_start:
+                previous = current if start == window_start - window else 0
+                current = 0
+
+        elapsed = now - window_start
+        weighted = previous * (window - elapsed) / window + current
+        if weighted + 1 <= limit:
+            return (window_start, current + 1, previous), 0.0
+
+        if current + 1 > limit or previous == 0:
+            # nothing to slide out before the current window ends
+            retry_after = window - elapsed
+        else:
+            # time until enough of the previous window slides out
+            retry_after = window - elapsed - (limit - 1 - current) * window / previous
+
+        return (window_start, current, previous), max(retry_after, 0.0)
+
+    return hit
+
+
+def token_bucket(capacity: int, refill_rate: float) -> StateFunc:
+    """
+    Token bucket refilled at refill_rate tokens per second, every hit takes
+    one token. The state is (available tokens, last update time).
+    """
+
+    def hit(state, now):
+        tokens, updated_at = (capacity, now) if state is None else state
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens >= 1:
+            return (tokens - 1, now), 0.0
+
+        return (tokens, now), (1 - tokens) / refill_rate
+
+    return hit
+
+
+class RateLimiter(ABC):
+    """
+    Base class of the rate limiter backends. Backends only need to apply a
+    state transition function atomically for a given key.
+    """
+
+    @abstractmethod
+    def _apply(self, key: str, hit: StateFunc, ttl: float) -> float:
+        ...
+
+    def hit_sliding_window(self, key: str, limit: int, window: float) -> float:
+        """
+        Register a hit for the key, returning 0 if it is allowed or
+        the number of seconds to wait before trying again otherwise.
+        """
+        return self._apply(key, sliding_window(limit, window), ttl=2 * window)
+
+    def hit_token_bucket(self, key: str, capacity: int, refill_rate: float) -> float:
+        """
+        Register a hit for the key, returning 0 if it is allowed or
+        the number of seconds to wait before trying again otherwise.
+        """
+        return self._apply(
+            key, token_bucket(capacity, refill_rate), ttl=capacity / refill_rate
+        )
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    Rate limiter keeping its state in the memory of the current process.
+    The least recently used keys are discarded when there are too many.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._states: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _apply(self, key: str, hit: StateFunc, ttl: float) -> float:
+        with self._lock:
+            state, retry_after = hit(self._states.get(key), time.time())
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+
+        return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """
+    Rate limiter keeping its state in a SQLite file, so it can be shared
+    by several worker processes running in the same host.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits "
+                "(key TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+
+        return conn
+
+    def _apply(self, key: str, hit: StateFunc, ttl: float) -> float:
+        conn = self._get_connection()
+        now = time.time()
+        # take the write lock right away, so other processes wait for this one
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT state FROM rate_limits WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            state, retry_after = hit(json.loads(row[0]) if row else None, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (key, state, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, json.dumps(state), now + ttl),
+            )
+            # keep the table small, removing keys that were not used recently
+            if not row:
+                conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return retry_after
+
+    def clear(self):
+        self._get_connection().execute("DELETE FROM rate_limits")
+
+
+def create_rate_limiter(settings: Settings) -> RateLimiter:
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteRateLimiter(settings.RATE_LIMIT_SQLITE_PATH)
+
+    return MemoryRateLimiter()
+
+
+rate_limiter = create_rate_limiter(get_settings())
@@ -1,23 +1,162 @@
+import asyncio
+import hashlib
+import secrets
+import time
+import uuid
+from concurrent.futures import (Executor, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
 from datetime import datetime, timedelta
+from typing import Any, Callable
 
 from fastapi import HTTPException, status
 from jose import ExpiredSignatureError, JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import ValidationError
 
+from app.core.cache import TTLCache
 from app.core.config import Settings, get_settings
+from app.core.keys import get_key_ring
 from app.schemas import TokenPayload
 
 settings = get_settings()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def create_password_context(settings: Settings) -> CryptContext:
+    """
+    Context hashing passwords with the first of the configured schemes,
+    and flagging for update any hash with other schemes or costs.
+    """
+    if settings.PASSWORD_HASH_LOW_COST:
+        costs = {
+            "bcrypt__rounds": 4,
+            "argon2__time_cost": 1,
+            "argon2__memory_cost": 8,
+            "argon2__parallelism": 1,
+        }
+    else:
+        costs = {
+            "bcrypt__rounds": settings.BCRYPT_ROUNDS,
+            "argon2__time_cost": settings.ARGON2_TIME_COST,
+            "argon2__memory_cost": settings.ARGON2_MEMORY_COST,
+            "argon2__parallelism": settings.ARGON2_PARALLELISM,
+        }
+    # bcrypt hashes with less rounds than configured need an update too
+    costs["bcrypt__min_rounds"] = costs["bcrypt__rounds"]
+
+    schemes = settings.PASSWORD_HASH_SCHEMES
+    costs = {
+        name: value for name, value in costs.items() if name.split("__")[0] in schemes
+    }
+    return CryptContext(schemes=schemes, deprecated="auto", **costs)
+
+
+pwd_context = create_password_context(settings)
+
+# hashes never start with "!", so it marks accounts without a password
+UNUSABLE_PASSWORD_PREFIX = "!"
+
+
+class PasswordHashingExecutor:
+    """
+    Dedicated pool to run the CPU bound password hashing functions, so they
+    don't block the event loop or use up the threads shared with the rest of
+    the requests. When too many calls are already waiting for a worker, new
+    calls are rejected right away instead of making the queue longer.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, use_processes: bool = False):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.use_processes = use_processes
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: Executor | None = None
+
+    @property
+    def in_flight(self) -> int:
+        return self.submitted - self.completed
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    def _get_executor(self) -> Executor:
+        # create the pool lazily, so importing this module doesn't start workers
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="password_hashing",
+                )
+
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many requests, try again later",
+                headers={"Retry-After": "1"},
+            )
+
+        future = self._get_executor().submit(func, *args)
+        self.submitted += 1
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            self.completed += 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+hashing_executor = PasswordHashingExecutor(
+    max_workers=settings.PASSWORD_HASHING_WORKERS,
+    max_queue=settings.PASSWORD_HASHING_MAX_QUEUE,
+    use_processes=settings.PASSWORD_HASHING_POOL == "process",
+)
+
+# verified token payloads, keyed by the token digest
+token_cache = TTLCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS
+)
+
+
+def _get_verification_key(token: str, settings: Settings):
+    if not settings.JWT_KEYS_FILE:
+        return settings.SECRET_KEY, settings.ALGORITHM
+
+    # raises JWTError if the header is not valid
+    kid = jwt.get_unverified_header(token).get("kid")
+    key_ring = get_key_ring(settings.JWT_KEYS_FILE, settings.JWT_KEYS_RELOAD_SECONDS)
+    signing_key = key_ring.get(kid)
+    if signing_key is None:
+        raise JWTError(f"Unknown key ID {kid}")
+
+    return signing_key.public_key, signing_key.algorithm
 
 
 def decode_token(token: str, settings: Settings) -> TokenPayload:
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        key, algorithm = _get_verification_key(token, settings)
+        payload = jwt.decode(token, key, algorithms=[algorithm])
         # raises ValidationError if the payload is not valid
         token_data = TokenPayload(**payload)
     except ExpiredSignatureError:
@@ -35,6 +174,25 @@ def decode_token(token: str, settings: Settings) -> TokenPayload:
     return token_data
 
 
+def decode_token_cached(token: str, settings: Settings) -> TokenPayload:
+    """
+    Same as decode_token, but skipping the signature check and payload
+    validation if the same token was already verified recently.
+    Cached entries never outlive the expiration time of the token.
+    """
+    if not settings.TOKEN_CACHE_ENABLED:
+        return decode_token(token, settings)
+
+    key = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(key)
+    if token_data is None:
+        token_data = decode_token(token, settings)
+        ttl = token_data.exp - time.time() if token_data.exp is not None else None
+        token_cache.set(key, token_data, ttl=ttl)
+
+    return token_data
+
+
 def create_access_token(
     subject: str | int,
     expires_delta: timedelta | None = None,
@@ -46,10 +204,27 @@ def create_access_token(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
 
-    to_encode = {"exp": expire, "sub": str(subject)}
-    encoded_jwt = jwt.encode(
-        to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM
-    )
+    to_encode = {
+        "exp": expire,
+        "sub": str(subject),
+        # sub-second precision, to revoke tokens issued right before a revocation
+        "iat": time.time(),
+        "jti": uuid.uuid4().hex,
+    }
+    if settings.JWT_KEYS_FILE:
+        key_ring = get_key_ring(
+            settings.JWT_KEYS_FILE, settings.JWT_KEYS_RELOAD_SECONDS
+        )
+        encoded_jwt = jwt.encode(
+            to_encode,
+            key_ring.active.private_key,
+            algorithm=key_ring.active.algorithm,
+            headers={"kid": key_ring.active.kid},
+        )
+    else:
+        encoded_jwt = jwt.encode(
+            to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM
+        )
 
     return encoded_jwt
 
@@ -69,9 +244,57 @@ def create_account_verification_token(email: str) -> str:
     return create_access_token(email, expire)
 
 
+def make_unusable_password() -> str:
+    """
+    Marker stored for accounts without a password (e.g. created with Google),
+    which never matches any password and costs no hashing to create.
+    """
+    return UNUSABLE_PASSWORD_PREFIX + secrets.token_hex(16)
+
+
+def has_usable_password(hashed_password: str | None) -> bool:
+    return bool(hashed_password) and not hashed_password.startswith(
+        UNUSABLE_PASSWORD_PREFIX
+    )
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
+    if not has_usable_password(hashed_password):
+        return False
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """
+    Verify the password, and also return a new hash of it if the current one
+    does not follow the hashing policy anymore.
+    """
+    if not has_usable_password(hashed_password):
+        return False, None
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    if not has_usable_password(hashed_password):
+        return False
+    return await hashing_executor.run(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    if not has_usable_password(hashed_password):
+        return False, None
+    return await hashing_executor.run(
+        verify_and_update_password, plain_password, hashed_password
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await hashing_executor.run(get_password_hash, password)
@@ -1,26 +1,238 @@
-from sqlalchemy import create_engine
+import itertools
+import time
+from typing import Any, AsyncIterator, Callable, TypeVar
+
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import Executable
+
+from app.core.config import Settings, get_settings
+
+from .pool import (MeteredAsyncAdaptedQueuePool, MeteredQueuePool,
+                   attach_pool_metrics)
+
+T = TypeVar("T")
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+# session received by the endpoints, depending on the DATABASE_ASYNC setting
+DBSession = Session | AsyncSession
 
-from app.core.config import get_settings
 
+def get_pool_options(settings: Settings) -> dict[str, Any]:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_use_lifo": settings.DB_POOL_USE_LIFO,
+    }
 
-def create_engine_and_session(db_url):
+
+def create_engine_and_session(db_url, **engine_kwargs):
     if "sqlite" in db_url:
-        engine = create_engine(db_url, connect_args={"check_same_thread": False})
+        engine = create_engine(
+            db_url, connect_args={"check_same_thread": False}, **engine_kwargs
+        )
     else:
-        engine = create_engine(db_url)
+        options = get_pool_options(get_settings())
+        engine = create_engine(
+            db_url, poolclass=MeteredQueuePool, **{**options, **engine_kwargs}
+        )
+    attach_pool_metrics(engine)
 
     # each instance of SessionLocal will be a database session
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # (objects are not expired on commit, as the writes already return them
+    # up to date, see BaseCrudModel)
+    SessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+    )
 
     return engine, SessionLocal
 
 
+def create_async_engine_and_session(db_url, **engine_kwargs):
+    if "sqlite" in db_url:
+        engine = create_async_engine(db_url, **engine_kwargs)
+    else:
+        options = get_pool_options(get_settings())
+        engine = create_async_engine(
+            db_url,
+            poolclass=MeteredAsyncAdaptedQueuePool,
+            **{**options, **engine_kwargs},
+        )
+    attach_pool_metrics(engine.sync_engine)
+
+    # objects are not expired on commit, because expired attributes can't be
+    # loaded again outside of the session (e.g. when serializing the response)
+    AsyncSessionLocal = sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False,
+        bind=engine,
+        class_=AsyncSession,
+    )
+
+    return engine, AsyncSessionLocal
+
+
+def get_async_database_url(db_url: str) -> str:
+    """
+    Same DB URL, with the async driver of the dialect.
+    """
+    driver, _, rest = db_url.partition("://")
+    return f"{ASYNC_DRIVERS.get(driver, driver)}://{rest}"
+
+
+class Replica:
+    """
+    Read replica of the primary DB, with its own engines.
+    """
+
+    def __init__(self, name: str, db_url: str, use_async: bool):
+        self.name = name
+        self.engine, self.SessionLocal = create_engine_and_session(db_url)
+        self.async_engine, self.AsyncSessionLocal = (
+            create_async_engine_and_session(get_async_database_url(db_url))
+            if use_async
+            else (None, None)
+        )
+        self.ejected_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until <= time.monotonic()
+
+
+class ReplicaRouter:
+    """
+    Round robin over the read replicas, skipping for a while the replicas
+    that failed (until then their reads go to the next replica).
+    """
+
+    def __init__(self, replicas: list[Replica], eject_seconds: float):
+        self.replicas = replicas
+        self.eject_seconds = eject_seconds
+        self._counter = itertools.count()
+
+    def choose(self) -> Replica | None:
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._counter) % len(self.replicas)]
+            if replica.healthy:
+                return replica
+
+        return None
+
+    def eject(self, replica: Replica):
+        replica.ejected_until = time.monotonic() + self.eject_seconds
+
+
+def create_session(
+    replica: Replica | None = None, primary: DBSession | None = None
+) -> DBSession:
+    """
+    New session of the primary DB or of a replica, async unless the
+    DATABASE_ASYNC setting is disabled. Replica sessions keep the session
+    of the primary DB to use if the replica fails.
+    """
+    if replica is None:
+        return AsyncSessionLocal() if settings.DATABASE_ASYNC else SessionLocal()
+
+    info = {"replica": replica, "primary": primary}
+    if settings.DATABASE_ASYNC:
+        return replica.AsyncSessionLocal(info=info)
+    return replica.SessionLocal(info=info)
+
+
+async def close_session(db: DBSession):
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
+
+
+async def _run_db(
+    db: DBSession, func: Callable[..., T], *args: Any, **kwargs: Any
+) -> T:
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(func, *args, **kwargs)
+
+    return await run_in_threadpool(func, db, *args, **kwargs)
+
+
+async def run_db(db: DBSession, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a function receiving a sync session as first argument (like the model
+    methods) without blocking the event loop. With an async session, the DB
+    driver is async and the function runs in the event loop, otherwise it runs
+    in the threadpool.
+
+    If the session reads from a replica that can't be reached, the replica is
+    ejected and the function runs again with the session of the primary DB
+    (replica sessions are only used to read, so it is safe to retry).
+    """
+    try:
+        return await _run_db(db, func, *args, **kwargs)
+    except (exc.OperationalError, exc.InterfaceError):
+        replica = db.info.get("replica")
+        if replica is None:
+            raise
+
+    replica_router.eject(replica)
+    return await run_db(db.info["primary"], func, *args, **kwargs)
+
+
+async def stream_db(
+    db: DBSession, statement: Executable, batch_size: int
+) -> AsyncIterator[list[Row]]:
+    """
+    Rows of a query in batches, fetched with a server-side cursor so that
+    they are never all loaded in memory.
+    """
+    statement = statement.execution_options(yield_per=batch_size)
+    if isinstance(db, AsyncSession):
+        result = await db.stream(statement)
+        async for batch in result.partitions():
+            yield batch
+        return
+
+    result = await run_in_threadpool(db.execute, statement)
+    try:
+        async for batch in iterate_in_threadpool(result.partitions()):
+            yield batch
+    finally:
+        result.close()
+
+
 settings = get_settings()
 
 engine, SessionLocal = create_engine_and_session(
     db_url=settings.get_postgres_database_url()
 )
 
+async_engine, AsyncSessionLocal = (
+    create_async_engine_and_session(
+        db_url=settings.get_postgres_database_url(async_driver=True)
+    )
+    if settings.DATABASE_ASYNC
+    else (None, None)
+)
+
+replica_router = ReplicaRouter(
+    replicas=[
+        Replica(f"replica{i}", db_url, settings.DATABASE_ASYNC)
+        for i, db_url in enumerate(settings.DATABASE_REPLICA_URLS)
+    ],
+    eject_seconds=settings.DATABASE_REPLICA_EJECT_SECONDS,
+)
+
 Base = declarative_base()
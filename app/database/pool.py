@@ -0,0 +1,124 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+class PoolMetrics:
+    """
+    Counters of a connection pool, updated by the pool event listeners
+    and by the pool itself (to measure how long checkouts wait).
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.checkout_wait_max_seconds = 0.0
+        self.checkout_timeouts = 0
+        self.in_use = 0
+        self.connections_created = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def listen(self, engine: Engine):
+        # pool events of an engine are kept when the pool is recreated
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "soft_invalidate", self._on_invalidate)
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkout_wait_seconds += seconds
+            self.checkout_wait_max_seconds = max(
+                self.checkout_wait_max_seconds, seconds
+            )
+
+    def record_timeout(self):
+        with self._lock:
+            self.checkout_timeouts += 1
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "checkouts": self.checkouts,
+            "checkout_wait_seconds": self.checkout_wait_seconds,
+            "checkout_wait_max_seconds": self.checkout_wait_max_seconds,
+            "checkout_timeouts": self.checkout_timeouts,
+            "in_use": self.in_use,
+            "connections_created": self.connections_created,
+            "invalidations": self.invalidations,
+        }
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections_created += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.in_use -= 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+
+class MeteredPoolMixin:
+    """
+    Pool measuring the time waited to check out each connection.
+    """
+
+    metrics: PoolMetrics
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class MeteredQueuePool(MeteredPoolMixin, QueuePool):
+    pass
+
+
+class MeteredAsyncAdaptedQueuePool(MeteredPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def attach_pool_metrics(engine: Engine):
+    if isinstance(engine.pool, MeteredPoolMixin):
+        engine.pool.metrics = PoolMetrics()
+        engine.pool.metrics.listen(engine)
+
+
+def get_pool_stats(pool: Pool) -> dict[str, int | float | str]:
+    stats: dict[str, int | float | str] = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            # negative while there are less connections than the pool size
+            overflow=max(pool.overflow(), 0),
+        )
+    if isinstance(pool, MeteredPoolMixin):
+        stats.update(pool.metrics.stats())
+
+    return stats
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.core.config import get_settings
+from app.models import ToDo, User
+
+from .db import DBSession, close_session, create_session
+
+logger = logging.getLogger(__name__)
+
+
+class UserPurger:
+    """
+    Removes the deleted users and their todos, deleting the todos in batches
+    (each one in its own transaction) so that no request has to wait for them
+    and they are never loaded in memory. The pending work is the deleted users
+    themselves, so a purge interrupted by a crash is resumed by the next run.
+    """
+
+    def __init__(self, batch_size: int, interval: int):
+        self.batch_size = batch_size
+        self.interval = interval
+        # progress of the purges of this process
+        self.users_pending = 0
+        self.users_purged = 0
+        self.todos_purged = 0
+        self.batches = 0
+        self._task: asyncio.Task | None = None
+
+    async def purge_user(self, db: DBSession, user_id: int) -> int:
+        """
+        Purge a deleted user, returning the number of deleted todos.
+        """
+        logger.info("Purging deleted user %s", user_id)
+        # until a batch is empty, in case another purge deleted some of them
+        deleted, total = None, 0
+        while deleted != 0:
+            deleted = await ToDo.delete_by_owner_async(db, user_id, self.batch_size)
+            total += deleted
+            self.todos_purged += deleted
+            self.batches += 1
+            logger.debug(
+                "Purged %s todos of user %s (%s so far)", deleted, user_id, total
+            )
+
+        if await User.purge_async(db, user_id):
+            self.users_purged += 1
+            logger.info("Purged deleted user %s with %s todos", user_id, total)
+
+        return total
+
+    async def purge_pending(self, db: DBSession) -> int:
+        """
+        Purge all the users deleted so far, returning the number of purged users.
+        """
+        purged = 0
+        while user_ids := await User.get_deleted_ids_async(db):
+            self.users_pending = len(user_ids)
+            for user_id in user_ids:
+                await self.purge_user(db, user_id)
+                self.users_pending -= 1
+                purged += 1
+
+        return purged
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "users_pending": self.users_pending,
+            "users_purged": self.users_purged,
+            "todos_purged": self.todos_purged,
+            "batches": self.batches,
+        }
+
+    async def _purge_periodically(self):
+        while True:
+            db = create_session()
+            try:
+                await self.purge_pending(db)
+            except SQLAlchemyError:
+                logger.exception("Could not purge the deleted users")
+            finally:
+                await close_session(db)
+
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.ensure_future(self._purge_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+settings = get_settings()
+
+user_purger = UserPurger(
+    batch_size=settings.USER_PURGE_BATCH_SIZE,
+    interval=settings.USER_PURGE_INTERVAL_SECONDS,
+)
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime
+from sqlalchemy.dialects import sqlite
+
+
+class SQLiteTimestamp(sqlite.DATETIME):
+    """
+    SQLite stores the datetimes as strings, compared as such. The server
+    default (CURRENT_TIMESTAMP) has no fractional seconds, so the bound
+    values without microseconds are formatted the same way, instead of with
+    ".000000" (which would sort after the server default timestamps of the
+    same second, e.g. breaking the keyset pagination).
+    """
+
+    def bind_processor(self, dialect):
+        process = super().bind_processor(dialect)
+
+        def process_timestamp(value):
+            if isinstance(value, datetime) and not value.microsecond:
+                return value.strftime("%Y-%m-%d %H:%M:%S")
+            return process(value)
+
+        return process_timestamp
+
+
+# timestamp column type, for the columns with a server default
+Timestamp = DateTime(timezone=True).with_variant(SQLiteTimestamp(), "sqlite")
@@ -2,13 +2,26 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.api import api_router
-from app.core.security import get_settings
+from app.api.middleware import CompressionMiddleware, ReadYourWritesMiddleware
+from app.api.pagination import NEXT_CURSOR_HEADER
+from app.api.responses import FastJSONResponse
+from app.core.google_auth import google_token_validator
+from app.core.keys import get_key_ring
+from app.core.security import get_settings, hashing_executor
+from app.database.db import async_engine, replica_router
 from app.database.init_db import init_db
+from app.database.purge import user_purger
 
-if get_settings().ENVIRONMENT != "test":
+settings = get_settings()
+
+if settings.ENVIRONMENT != "test":
     init_db()
 
-app = FastAPI(title="Simple To-Do API")
+if settings.JWT_KEYS_FILE:
+    # load the signing keys on startup, failing early if they are not valid
+    get_key_ring(settings.JWT_KEYS_FILE, settings.JWT_KEYS_RELOAD_SECONDS)
+
+app = FastAPI(title="Simple To-Do API", default_response_class=FastJSONResponse)
 
 # add CORS middleware to allow requests from any origin (public API)
 app.add_middleware(
@@ -17,6 +30,60 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
+)
+
+# clients read from the primary DB after writing (when using read replicas)
+app.add_middleware(ReadYourWritesMiddleware, max_age=settings.READ_YOUR_WRITES_SECONDS)
+
+# compress the responses (in the outermost middleware, to compress all of them)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    levels={
+        "gzip": settings.COMPRESSION_GZIP_LEVEL,
+        "br": settings.COMPRESSION_BROTLI_LEVEL,
+        "zstd": settings.COMPRESSION_ZSTD_LEVEL,
+    },
 )
 
 app.include_router(api_router, prefix="/api")
+
+
+@app.on_event("startup")
+def start_google_jwks_refresh():
+    # only needed to verify Google ID tokens
+    if settings.GOOGLE_CLIENT_ID and google_token_validator.jwks:
+        google_token_validator.jwks.start()
+
+
+@app.on_event("startup")
+def start_user_purge():
+    # resume the purges of deleted users interrupted by a restart
+    # (the test DB is not the one used by the app, as in init_db)
+    if settings.ENVIRONMENT != "test":
+        user_purger.start()
+
+
+@app.on_event("shutdown")
+async def stop_user_purge():
+    await user_purger.stop()
+
+
+@app.on_event("shutdown")
+def shutdown_password_hashing():
+    hashing_executor.shutdown()
+
+
+@app.on_event("shutdown")
+async def shutdown_google_client():
+    await google_token_validator.close()
+
+
+@app.on_event("shutdown")
+async def dispose_async_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    for replica in replica_router.replicas:
+        if replica.async_engine is not None:
+            await replica.async_engine.dispose()
@@ -1,2 +1,4 @@
+from .revoked_token import RevokedToken
 from .todo import ToDo
 from .user import User
+from .user_identity import UserIdentity
@@ -1,15 +1,71 @@
+from functools import lru_cache
 from typing import Any
 
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy import Column, delete, insert, inspect, select, update
 from sqlalchemy.orm import Session
 
+from app.core.config import get_settings
+from app.database.db import DBSession, run_db
+
+settings = get_settings()
+
+
+@lru_cache(maxsize=None)
+def get_column_names(model: type) -> frozenset[str]:
+    """
+    Names of the column attributes of a mapped class (cached per class).
+    """
+    return frozenset(column.key for column in inspect(model).column_attrs)
+
+
+@lru_cache(maxsize=1024)
+def get_projection(
+    model: type, fields: tuple[str, ...], extra: tuple[str, ...] = ()
+) -> tuple[Column, ...]:
+    """
+    Columns to select for the given fields, followed by the extra ones that
+    are not fields (e.g. the sort key of a page), cached per combination.
+    """
+    table = model.__table__
+    names = fields + tuple(name for name in extra if name not in fields)
+    return tuple(table.c[name] for name in names)
+
+
+def supports_returning(db: Session) -> bool:
+    return settings.DATABASE_USE_RETURNING and db.get_bind().dialect.full_returning
+
 
 class BaseCrudModel:
     @classmethod
     def get_by_id(cls, db: Session, id: int):
         return db.query(cls).filter(cls.id == id).first()
 
+    @classmethod
+    def insert(cls, db: Session, values: dict[str, Any], commit: bool = True):
+        """
+        Insert a new row, getting it back in the same statement
+        (INSERT ... RETURNING) if the DB supports it.
+        """
+        if not supports_returning(db):
+            db_obj = cls(**values)
+            db.add(db_obj)
+            if commit:
+                db.commit()
+            else:
+                db.flush()
+            # load the server defaults (e.g. time_created)
+            db.refresh(db_obj)
+
+            return db_obj
+
+        statement = insert(cls).values(**values).returning(cls)
+        db_obj = db.execute(_returning_objects(cls, statement)).scalar_one()
+        if commit:
+            db.commit()
+
+        return db_obj
+
     @classmethod
     def update(cls, db: Session, current, new: BaseModel | dict[str, Any]):
         if isinstance(new, dict):
@@ -18,16 +74,37 @@ class BaseCrudModel:
             # exclude_unset=True to avoid updating to default values
             update_data = new.dict(exclude_unset=True)
 
-        current_data = jsonable_encoder(current)
-        for field in current_data:
-            if field in update_data:
-                setattr(current, field, update_data[field])
+        column_names = get_column_names(type(current))
+        values = {
+            field: value
+            for field, value in update_data.items()
+            if field in column_names
+        }
+
+        if not supports_returning(db):
+            for field, value in values.items():
+                setattr(current, field, value)
+
+            db.add(current)
+            db.commit()
+            db.refresh(current)
 
-        db.add(current)
+            return current
+
+        if not values:
+            return current
+
+        # the current object is updated with the returned row (same identity)
+        statement = (
+            update(type(current))
+            .where(type(current).id == current.id)
+            .values(**values)
+            .returning(type(current))
+        )
+        updated = db.execute(_returning_objects(type(current), statement)).scalar_one()
         db.commit()
-        db.refresh(current)
 
-        return current
+        return updated
 
     @classmethod
     def delete(cls, db: Session, db_obj):
@@ -38,8 +115,47 @@ class BaseCrudModel:
 
     @classmethod
     def delete_by_id(cls, db: Session, id: int):
-        db_obj = cls.get_by_id(db, id)
-        db.delete(db_obj)
+        """
+        Delete a row, getting it back in the same statement
+        (DELETE ... RETURNING) if the DB supports it.
+        """
+        if not supports_returning(db):
+            db_obj = cls.get_by_id(db, id)
+            db.delete(db_obj)
+            db.commit()
+
+            return db_obj
+
+        # the related rows are deleted by the DB (ON DELETE CASCADE)
+        statement = delete(cls).where(cls.id == id).returning(*cls.__table__.columns)
+        row = db.execute(statement).one_or_none()
         db.commit()
 
-        return db_obj
+        return cls(**row._mapping) if row else None
+
+    @classmethod
+    async def get_by_id_async(cls, db: DBSession, id: int):
+        return await run_db(db, cls.get_by_id, id)
+
+    @classmethod
+    async def update_async(
+        cls, db: DBSession, current, new: BaseModel | dict[str, Any]
+    ):
+        return await run_db(db, cls.update, current=current, new=new)
+
+    @classmethod
+    async def delete_async(cls, db: DBSession, db_obj):
+        return await run_db(db, cls.delete, db_obj)
+
+    @classmethod
+    async def delete_by_id_async(cls, db: DBSession, id: int):
+        return await run_db(db, cls.delete_by_id, id)
+
+
+def _returning_objects(model: type, statement):
+    # load the returned rows as ORM objects, replacing the already loaded ones
+    return (
+        select(model)
+        .from_statement(statement)
+        .execution_options(populate_existing=True)
+    )
@@ -0,0 +1,225 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Column, DateTime, Float, Integer, String, and_, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.core.bloom import BloomFilter
+from app.core.config import get_settings
+from app.database.db import Base, DBSession, run_db
+from app.database.types import Timestamp
+from app.schemas.token import TokenPayload
+
+settings = get_settings()
+
+
+class RevocationFilter:
+    """
+    In-memory Bloom filter with the keys of all the revoked tokens, so that
+    checking a valid token doesn't need a DB query. Each worker refreshes
+    it incrementally with the revocations added by the other workers.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        error_rate: float,
+        refresh_seconds: float,
+        overlap_seconds: float,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        # every refresh loads the revocations added since the previous one,
+        # minus this overlap, in case they were committed after it
+        self.overlap_seconds = overlap_seconds
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._filter: BloomFilter | None = None
+        self._refreshed_since: datetime | None = None
+        self._checked_at = 0.0
+
+    def add(self, key: str):
+        if self._filter is not None:
+            self._filter.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        # without a filter, every key has to be checked in the DB
+        return self._filter is None or key in self._filter
+
+    @property
+    def needs_refresh(self) -> bool:
+        return time.monotonic() - self._checked_at >= self.refresh_seconds
+
+    def refresh(self, db: Session):
+        if not self.needs_refresh:
+            return
+
+        # never wait for a refresh in progress, as it could be running in the
+        # same thread (async sessions run in the event loop). Until the filter
+        # is built, every token is checked in the DB anyway.
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            if not self.needs_refresh:
+                return
+
+            # time_revoked is the start of the transaction adding the row
+            refreshed_since = datetime.now(timezone.utc) - timedelta(
+                seconds=self.overlap_seconds
+            )
+            if self._filter is None or self._filter.count > self._filter.capacity:
+                self._rebuild(db)
+            else:
+                # the keys already in the filter are not counted again
+                for key in RevokedToken.get_since(db, self._refreshed_since):
+                    self._filter.add(key)
+
+            self._refreshed_since = refreshed_since
+            self._checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def _rebuild(self, db: Session):
+        # load only the revocations still in effect, dropping the expired ones
+        keys = RevokedToken.get_since(db, None, include_expired=False)
+        capacity = self.capacity
+        while len(keys) > capacity // 2:
+            capacity *= 2
+
+        new_filter = BloomFilter(capacity, self.error_rate)
+        for key in keys:
+            new_filter.add(key)
+
+        self._filter = new_filter
+
+
+revocation_filter = RevocationFilter(
+    capacity=settings.REVOCATION_FILTER_CAPACITY,
+    error_rate=settings.REVOCATION_FILTER_ERROR_RATE,
+    refresh_seconds=settings.REVOCATION_REFRESH_SECONDS,
+    overlap_seconds=settings.REVOCATION_REFRESH_OVERLAP_SECONDS,
+)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # token ID (jti) of a single token, or "user:<id>" for all the user tokens
+    key = Column(String, index=True, nullable=False)
+    # for user revocations, tokens issued before this timestamp are revoked
+    not_before = Column(Float)
+    # the revocation is no longer needed after this time
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    time_revoked = Column(Timestamp, server_default=func.now(), index=True)
+
+    @staticmethod
+    def user_key(user_id: int | str) -> str:
+        return f"user:{user_id}"
+
+    @classmethod
+    def revoke_token(cls, db: Session, token_data: TokenPayload, commit: bool = True):
+        """
+        Revoke a single token, identified by its jti claim.
+        """
+        if token_data.jti is None:
+            return
+
+        expires_at = (
+            datetime.utcfromtimestamp(token_data.exp)
+            if token_data.exp is not None
+            else datetime.utcnow() + timedelta(minutes=cls._max_token_minutes())
+        )
+        db.add(cls(key=token_data.jti, expires_at=expires_at))
+        if commit:
+            db.commit()
+
+        revocation_filter.add(token_data.jti)
+
+    @classmethod
+    def revoke_tokens(cls, db: Session, tokens: list[TokenPayload]):
+        """
+        Revoke several tokens in the same transaction.
+        """
+        for token_data in tokens:
+            cls.revoke_token(db, token_data, commit=False)
+        db.commit()
+
+    @classmethod
+    def revoke_user(cls, db: Session, user_id: int, commit: bool = True):
+        """
+        Revoke all the tokens issued to a user until now.
+        """
+        key = cls.user_key(user_id)
+        expires_at = datetime.utcnow() + timedelta(minutes=cls._max_token_minutes())
+        db.add(cls(key=key, not_before=time.time(), expires_at=expires_at))
+        if commit:
+            db.commit()
+
+        revocation_filter.add(key)
+
+    @classmethod
+    def is_revoked(cls, db: Session, token_data: TokenPayload) -> bool:
+        revocation_filter.refresh(db)
+        if not cls._in_filter(token_data):
+            return False
+
+        # the filter can return false positives, check the DB to be sure
+        return cls.is_revoked_in_db(db, token_data)
+
+    @classmethod
+    async def is_revoked_async(cls, db: DBSession, token_data: TokenPayload) -> bool:
+        # most tokens are not revoked, which the filter tells without the DB
+        if not revocation_filter.needs_refresh and not cls._in_filter(token_data):
+            return False
+
+        return await run_db(db, cls.is_revoked, token_data)
+
+    @classmethod
+    def _in_filter(cls, token_data: TokenPayload) -> bool:
+        jti_hit = token_data.jti is not None and token_data.jti in revocation_filter
+        return jti_hit or cls.user_key(token_data.sub) in revocation_filter
+
+    @classmethod
+    def is_revoked_in_db(cls, db: Session, token_data: TokenPayload) -> bool:
+        user_key = cls.user_key(token_data.sub)
+        query = db.query(cls.id).filter(
+            or_(
+                cls.key == token_data.jti,
+                and_(
+                    cls.key == user_key,
+                    # tokens without iat were issued before any revocation
+                    cls.not_before > (token_data.iat or 0),
+                ),
+            )
+        )
+        return db.query(query.exists()).scalar()
+
+    @classmethod
+    def get_since(
+        cls, db: Session, revoked_since: datetime | None, include_expired: bool = True
+    ) -> list[str]:
+        """
+        Keys of the revocations added since the given time (all if None).
+        """
+        query = db.query(cls.key)
+        if revoked_since is not None:
+            query = query.filter(cls.time_revoked >= revoked_since)
+        if not include_expired:
+            query = query.filter(cls.expires_at > datetime.utcnow())
+
+        return [key for (key,) in query]
+
+    @staticmethod
+    def _max_token_minutes() -> int:
+        return max(
+            settings.ACCESS_TOKEN_EXPIRE_MINUTES,
+            settings.REFRESH_TOKEN_EXPIRE_MINUTES,
+            settings.PASSWORD_RESET_TOKEN_EXPIRE_MINUTES,
+        )
@@ -1,13 +1,43 @@
-from datetime import datetime
+import io
+import itertools
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime
+from typing import Any, Sequence
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from pydantic import BaseModel
+from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Index, Integer,
+                        String, bindparam, delete, insert, select, text,
+                        tuple_, update)
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session, relationship
 from sqlalchemy.sql import func
+from sqlalchemy.util import await_only
 
-from app.database.db import Base
-from app.schemas.todo import ToDoCreate
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.database.db import Base, DBSession, run_db, stream_db
+from app.database.types import Timestamp
+from app.schemas.todo import ToDoCreate, ToDoDayCount, ToDoStats
 
-from .base_crud_model import BaseCrudModel
+from .base_crud_model import (BaseCrudModel, _returning_objects,
+                              get_column_names, get_projection,
+                              supports_returning)
+
+settings = get_settings()
+
+# todo counts of recently seen users, keyed by user ID, as a Counter of
+# (done, day done) buckets kept up to date by the writes of this process
+todo_stats_cache = TTLCache(
+    max_size=settings.TODO_STATS_CACHE_MAX_SIZE,
+    ttl=settings.TODO_STATS_CACHE_TTL_SECONDS,
+)
+_todo_stats_lock = threading.Lock()
+# generation of the stats being computed for each user, discarded by the
+# writes during the computation (the result could be missing them)
+_todo_stats_computing: dict[int, int] = {}
+_todo_stats_generations = itertools.count()
 
 
 class ToDo(Base, BaseCrudModel):
@@ -16,26 +46,353 @@ class ToDo(Base, BaseCrudModel):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(String)
-    time_created = Column(DateTime(timezone=True), server_default=func.now())
+    time_created = Column(Timestamp, server_default=func.now())
     done = Column(Boolean, default=False)
     time_done = Column(DateTime(timezone=True))
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
 
     user = relationship("User", back_populates="todos")
 
+    # listings of the todos of a user, sorted for keyset pagination
+    __table_args__ = (
+        Index("ix_todos_user_id_time_created_id", "user_id", "time_created", "id"),
+        # partial index for the pending todos (a fraction of all of them)
+        Index(
+            "ix_todos_user_id_pending",
+            "user_id",
+            "time_created",
+            "id",
+            postgresql_where=text("NOT done"),
+            sqlite_where=text("done = 0"),
+        ),
+    )
+
     @classmethod
     def create(cls, db: Session, todo_data: ToDoCreate, user_id: int):
-        new_todo = ToDo(
-            title=todo_data.title,
-            description=todo_data.description,
-            user_id=user_id,
+        started_at = time.monotonic()
+        new_todo = cls.insert(
+            db,
+            {
+                "title": todo_data.title,
+                "description": todo_data.description,
+                "user_id": user_id,
+            },
         )
-        db.add(new_todo)
-        db.commit()
-        db.refresh(new_todo)
+        _update_stats(user_id, {_stats_bucket(new_todo): 1}, started_at)
 
         return new_todo
 
+    @classmethod
+    def update(cls, db: Session, current, new: BaseModel | dict[str, Any]):
+        started_at = time.monotonic()
+        previous_bucket = _stats_bucket(current)
+        updated = super().update(db, current, new)
+        _update_stats(
+            updated.user_id,
+            {previous_bucket: -1, _stats_bucket(updated): 1},
+            started_at,
+        )
+
+        return updated
+
+    @classmethod
+    def delete(cls, db: Session, db_obj):
+        started_at = time.monotonic()
+        deleted = super().delete(db, db_obj)
+        _update_stats(deleted.user_id, {_stats_bucket(deleted): -1}, started_at)
+
+        return deleted
+
+    @classmethod
+    def delete_by_id(cls, db: Session, id: int):
+        started_at = time.monotonic()
+        deleted = super().delete_by_id(db, id)
+        if deleted is not None:
+            _update_stats(deleted.user_id, {_stats_bucket(deleted): -1}, started_at)
+
+        return deleted
+
+    @classmethod
+    def get_stats(cls, db: Session, user_id: int) -> ToDoStats:
+        """
+        Total, open and done todos of a user, and the todos done per day,
+        from a single grouped query (or the cache).
+        """
+        cached = (
+            todo_stats_cache.get(user_id) if settings.TODO_STATS_CACHE_ENABLED else None
+        )
+        if cached is not None:
+            return _stats_from_buckets(cached[0])
+
+        with _todo_stats_lock:
+            generation = next(_todo_stats_generations)
+            _todo_stats_computing[user_id] = generation
+
+        computed_at = time.monotonic()
+        day_done = func.date(cls.time_done)
+        statement = (
+            select(cls.done, day_done, func.count())
+            .where(cls.user_id == user_id)
+            .group_by(cls.done, day_done)
+        )
+        buckets: Counter = Counter()
+        for done, day, count in db.execute(statement):
+            # the date is a string in SQLite
+            day = date.fromisoformat(day) if isinstance(day, str) else day
+            buckets[(bool(done), day if done else None)] += count
+
+        with _todo_stats_lock:
+            # not cached after a write of this process during the query
+            if _todo_stats_computing.get(user_id) == generation:
+                del _todo_stats_computing[user_id]
+                if settings.TODO_STATS_CACHE_ENABLED:
+                    todo_stats_cache.set(user_id, (buckets, computed_at))
+
+        return _stats_from_buckets(buckets)
+
+    @classmethod
+    async def get_stats_async(cls, db: DBSession, user_id: int) -> ToDoStats:
+        return await run_db(db, cls.get_stats, user_id)
+
+    @classmethod
+    async def create_async(cls, db: DBSession, todo_data: ToDoCreate, user_id: int):
+        return await run_db(db, cls.create, todo_data, user_id)
+
+    @classmethod
+    def create_multiple(
+        cls, db: Session, todos_data: list[ToDoCreate], user_id: int
+    ) -> list["ToDo"]:
+        """
+        Create several todos with a multi-row INSERT, in the order of the data.
+        Without RETURNING, they are loaded again after the INSERT in SQLite,
+        and inserted one by one in the other DBs (to get their IDs).
+        """
+        started_at = time.monotonic()
+        values = [
+            {
+                "title": todo_data.title,
+                "description": todo_data.description,
+                "user_id": user_id,
+            }
+            for todo_data in todos_data
+        ]
+        if not supports_returning(db):
+            if db.get_bind().dialect.name == "sqlite":
+                # the rows of a statement get consecutive IDs (there is a
+                # single writer), the last one in last_insert_rowid()
+                last_id = db.execute(insert(cls).values(values)).lastrowid
+                ids = list(range(last_id - len(values) + 1, last_id + 1))
+            else:
+                todos = [cls(**todo_values) for todo_values in values]
+                db.add_all(todos)
+                db.flush()
+                ids = [todo.id for todo in todos]
+            db.commit()
+            _update_stats(user_id, {(False, None): len(ids)}, started_at)
+            # load the server defaults (e.g. time_created)
+            return cls.get_multiple_by_id(db, ids)
+
+        statement = insert(cls).values(values).returning(cls)
+        todos = db.execute(_returning_objects(cls, statement)).scalars().all()
+        db.commit()
+        _update_stats(user_id, {(False, None): len(todos)}, started_at)
+
+        # the IDs are generated in the order of the rows
+        return sorted(todos, key=lambda todo: todo.id)
+
+    @classmethod
+    def import_multiple(
+        cls, db: Session, todos_data: list[ToDoCreate], user_id: int
+    ) -> int:
+        """
+        Insert several todos without getting them back, with COPY in
+        PostgreSQL or executemany otherwise. Return the number of todos.
+        """
+        started_at = time.monotonic()
+        # COPY doesn't apply the column defaults of the model
+        columns = ["title", "description", "done", "user_id"]
+        rows = [
+            (todo_data.title, todo_data.description, False, user_id)
+            for todo_data in todos_data
+        ]
+        table = cls.__table__.name
+        dbapi_connection = db.connection().connection
+        driver = db.get_bind().dialect.driver
+        if driver == "psycopg2":
+            buffer = io.StringIO(
+                "".join(
+                    "\t".join(_copy_value(value) for value in row) + "\n"
+                    for row in rows
+                )
+            )
+            with dbapi_connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer
+                )
+        elif driver == "asyncpg":
+            # the session runs in a greenlet, which can await the driver
+            await_only(
+                dbapi_connection.driver_connection.copy_records_to_table(
+                    table, records=rows, columns=columns
+                )
+            )
+        else:
+            db.execute(insert(cls.__table__), [dict(zip(columns, row)) for row in rows])
+        db.commit()
+        _update_stats(user_id, {(False, None): len(rows)}, started_at)
+
+        return len(rows)
+
+    @classmethod
+    def get_multiple_by_id(
+        cls, db: Session, ids: list[int], user_id: int | None = None
+    ) -> list["ToDo"]:
+        statement = (
+            select(cls)
+            .where(cls.id.in_(ids), *cls._owner_filter(user_id))
+            .order_by(cls.id)
+            .execution_options(populate_existing=True)
+        )
+        return db.execute(statement).scalars().all()
+
+    @classmethod
+    def get_owners(cls, db: Session, ids: list[int]) -> dict[int, int]:
+        """
+        User ID of each existing todo.
+        """
+        statement = select(cls.id, cls.user_id).where(cls.id.in_(ids))
+        return dict(db.execute(statement).all())
+
+    @classmethod
+    def update_multiple(
+        cls,
+        db: Session,
+        updates: dict[int, dict[str, Any]],
+        user_id: int | None = None,
+    ) -> list["ToDo"]:
+        """
+        Update several todos (with different values) in the same transaction,
+        only the ones of the user if user_id is not None.
+        Return the todos that exist and belong to the user.
+        """
+        column_names = get_column_names(cls) - {"id", "user_id"}
+        # one executemany UPDATE for each set of updated fields
+        groups: dict[tuple[str, ...], list[dict[str, Any]]] = {}
+        for todo_id, values in updates.items():
+            fields = tuple(sorted(field for field in values if field in column_names))
+            if fields:
+                groups.setdefault(fields, []).append(
+                    {
+                        "todo_id": todo_id,
+                        **{f"new_{field}": values[field] for field in fields},
+                    }
+                )
+
+        for fields, parameters in groups.items():
+            statement = (
+                update(cls.__table__)
+                .where(cls.id == bindparam("todo_id"), *cls._owner_filter(user_id))
+                .values({field: bindparam(f"new_{field}") for field in fields})
+            )
+            db.execute(statement, parameters)
+        db.commit()
+
+        todos = cls.get_multiple_by_id(db, list(updates), user_id)
+        _invalidate_stats({todo.user_id for todo in todos})
+        return todos
+
+    @classmethod
+    def update_all(
+        cls,
+        db: Session,
+        ids: list[int],
+        values: dict[str, Any],
+        user_id: int | None = None,
+    ) -> list["ToDo"]:
+        """
+        Set the same values to several todos with a single UPDATE, only the
+        ones of the user if user_id is not None.
+        Return the updated todos.
+        """
+        statement = (
+            update(cls)
+            .where(cls.id.in_(ids), *cls._owner_filter(user_id))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if not supports_returning(db):
+            db.execute(statement)
+            db.commit()
+            todos = cls.get_multiple_by_id(db, ids, user_id)
+            _invalidate_stats({todo.user_id for todo in todos})
+            return todos
+
+        statement = _returning_objects(cls, statement.returning(cls))
+        todos = db.execute(statement).scalars().all()
+        db.commit()
+        _invalidate_stats({todo.user_id for todo in todos})
+
+        return sorted(todos, key=lambda todo: todo.id)
+
+    @classmethod
+    def delete_multiple(
+        cls, db: Session, ids: list[int], user_id: int | None = None
+    ) -> list[int]:
+        """
+        Delete several todos with a single DELETE, only the ones of the user
+        if user_id is not None.
+        Return the IDs of the deleted todos.
+        """
+        where = (cls.id.in_(ids), *cls._owner_filter(user_id))
+        statement = delete(cls.__table__).where(*where)
+        if supports_returning(db):
+            deleted = db.execute(statement.returning(cls.id, cls.user_id)).all()
+        else:
+            query = select(cls.id, cls.user_id).where(*where).with_for_update()
+            deleted = db.execute(query).all()
+            db.execute(statement)
+        db.commit()
+        _invalidate_stats({row.user_id for row in deleted})
+
+        return [row.id for row in deleted]
+
+    @classmethod
+    def delete_by_owner(cls, db: Session, user_id: int, limit: int) -> int:
+        """
+        Delete up to limit todos of a user with a single DELETE, in its own
+        transaction (to delete all of them in batches).
+        Return the number of deleted todos.
+        """
+        batch = select(cls.id).where(cls.user_id == user_id).limit(limit)
+        statement = delete(cls.__table__).where(cls.id.in_(batch.scalar_subquery()))
+        deleted = db.execute(statement).rowcount
+        db.commit()
+        _invalidate_stats({user_id})
+
+        return deleted
+
+    @classmethod
+    def _owner_filter(cls, user_id: int | None) -> list:
+        return [] if user_id is None else [cls.user_id == user_id]
+
+    @classmethod
+    def _listing_filters(
+        cls,
+        start_datetime: datetime | None,
+        end_datetime: datetime | None,
+        done: bool | None,
+    ) -> list:
+        filters = []
+        if done is not None:
+            # without bound parameters, to match the partial index
+            filters.append(cls.done if done else ~cls.done)
+        if start_datetime:
+            filters.append(cls.time_created >= start_datetime)
+        if end_datetime:
+            filters.append(cls.time_created <= end_datetime)
+
+        return filters
+
     @classmethod
     def get_multiple(
         cls,
@@ -46,13 +403,248 @@ class ToDo(Base, BaseCrudModel):
         start_datetime: datetime = None,
         end_datetime: datetime = None,
         done: bool = None,
+        after: tuple[datetime, int] | None = None,
     ):
-        query = db.query(cls).filter(cls.user_id == user_id)
-        if done is not None:
-            query = query.filter(cls.done == done)
-        if start_datetime:
-            query = query.filter(cls.time_created >= start_datetime)
-        if end_datetime:
-            query = query.filter(cls.time_created <= end_datetime)
+        """
+        Todos of a user sorted by (time_created, id), after the given
+        (time_created, id) key if any (keyset pagination).
+        """
+        statement = cls._page_statement(
+            [cls], user_id, offset, limit, start_datetime, end_datetime, done, after
+        )
+        return db.execute(statement).scalars().all()
+
+    @classmethod
+    def get_multiple_rows(
+        cls,
+        db: Session,
+        fields: Sequence[str],
+        user_id: int,
+        offset: int = 0,
+        limit: int = 100,
+        start_datetime: datetime = None,
+        end_datetime: datetime = None,
+        done: bool = None,
+        after: tuple[datetime, int] | None = None,
+    ) -> list[Row]:
+        """
+        Same as get_multiple, but only selecting the given columns (and the
+        sort key, after them), as rows (not ORM objects, so they are not
+        added to the session).
+        """
+        columns = get_projection(cls, tuple(fields), ("time_created", "id"))
+        statement = cls._page_statement(
+            columns, user_id, offset, limit, start_datetime, end_datetime, done, after
+        )
+        return db.execute(statement).all()
+
+    @classmethod
+    def _page_statement(
+        cls,
+        entities: list,
+        user_id: int,
+        offset: int,
+        limit: int,
+        start_datetime: datetime | None,
+        end_datetime: datetime | None,
+        done: bool | None,
+        after: tuple[datetime, int] | None,
+    ):
+        statement = select(*entities).where(
+            cls.user_id == user_id,
+            *cls._listing_filters(start_datetime, end_datetime, done),
+        )
+        if after:
+            statement = statement.where(tuple_(cls.time_created, cls.id) > after)
+
+        return statement.order_by(cls.time_created, cls.id).offset(offset).limit(limit)
+
+    @classmethod
+    async def get_multiple_async(
+        cls,
+        db: DBSession,
+        user_id: int,
+        offset: int = 0,
+        limit: int = 100,
+        start_datetime: datetime = None,
+        end_datetime: datetime = None,
+        done: bool = None,
+        after: tuple[datetime, int] | None = None,
+    ):
+        return await run_db(
+            db,
+            cls.get_multiple,
+            user_id=user_id,
+            offset=offset,
+            limit=limit,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            done=done,
+            after=after,
+        )
+
+    @classmethod
+    async def get_multiple_rows_async(
+        cls,
+        db: DBSession,
+        fields: Sequence[str],
+        user_id: int,
+        offset: int = 0,
+        limit: int = 100,
+        start_datetime: datetime = None,
+        end_datetime: datetime = None,
+        done: bool = None,
+        after: tuple[datetime, int] | None = None,
+    ) -> list[Row]:
+        return await run_db(
+            db,
+            cls.get_multiple_rows,
+            fields,
+            user_id=user_id,
+            offset=offset,
+            limit=limit,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            done=done,
+            after=after,
+        )
+
+    @classmethod
+    async def create_multiple_async(
+        cls, db: DBSession, todos_data: list[ToDoCreate], user_id: int
+    ) -> list["ToDo"]:
+        return await run_db(db, cls.create_multiple, todos_data, user_id)
+
+    @classmethod
+    async def import_multiple_async(
+        cls, db: DBSession, todos_data: list[ToDoCreate], user_id: int
+    ) -> int:
+        return await run_db(db, cls.import_multiple, todos_data, user_id)
+
+    @classmethod
+    async def get_owners_async(cls, db: DBSession, ids: list[int]) -> dict[int, int]:
+        return await run_db(db, cls.get_owners, ids)
+
+    @classmethod
+    async def update_multiple_async(
+        cls,
+        db: DBSession,
+        updates: dict[int, dict[str, Any]],
+        user_id: int | None = None,
+    ) -> list["ToDo"]:
+        return await run_db(db, cls.update_multiple, updates, user_id)
+
+    @classmethod
+    async def update_all_async(
+        cls,
+        db: DBSession,
+        ids: list[int],
+        values: dict[str, Any],
+        user_id: int | None = None,
+    ) -> list["ToDo"]:
+        return await run_db(db, cls.update_all, ids, values, user_id)
+
+    @classmethod
+    async def delete_multiple_async(
+        cls, db: DBSession, ids: list[int], user_id: int | None = None
+    ) -> list[int]:
+        return await run_db(db, cls.delete_multiple, ids, user_id)
+
+    @classmethod
+    async def delete_by_owner_async(
+        cls, db: DBSession, user_id: int, limit: int
+    ) -> int:
+        return await run_db(db, cls.delete_by_owner, user_id, limit)
+
+    @classmethod
+    async def stream_async(
+        cls,
+        db: DBSession,
+        user_id: int | None,
+        start_datetime: datetime = None,
+        end_datetime: datetime = None,
+        done: bool = None,
+        batch_size: int = 1000,
+    ):
+        """
+        Rows (not ORM objects) of the todos of a user, or of all the users if
+        user_id is None, in batches. Same filters as get_multiple.
+        """
+        statement = (
+            select(*cls.__table__.columns)
+            .where(
+                *cls._owner_filter(user_id),
+                *cls._listing_filters(start_datetime, end_datetime, done),
+            )
+            .order_by(cls.user_id, cls.time_created, cls.id)
+        )
+        async for batch in stream_db(db, statement, batch_size):
+            yield batch
+
+
+def _stats_bucket(todo: ToDo) -> tuple[bool, date | None]:
+    done = bool(todo.done)
+    return done, todo.time_done.date() if done and todo.time_done else None
+
+
+def _stats_from_buckets(buckets: Counter) -> ToDoStats:
+    done_per_day = sorted(
+        (day, count) for (done, day), count in buckets.items() if done and day
+    )
+    return ToDoStats(
+        total=sum(buckets.values()),
+        open=sum(count for (done, _), count in buckets.items() if not done),
+        done=sum(count for (done, _), count in buckets.items() if done),
+        done_per_day=[
+            ToDoDayCount(day=day, count=count) for day, count in done_per_day
+        ],
+    )
+
+
+def _update_stats(
+    user_id: int, changes: dict[tuple[bool, date | None], int], started_at: float
+):
+    """
+    Apply the changes of a write (started at the given monotonic time) to
+    the cached stats of the user, if any.
+    """
+    with _todo_stats_lock:
+        _todo_stats_computing.pop(user_id, None)
+        cached = todo_stats_cache.get(user_id)
+        if cached is None:
+            return
+
+        buckets, computed_at = cached
+        if computed_at >= started_at:
+            # the query could have seen the write already, so the changes
+            # could be counted twice
+            todo_stats_cache.pop(user_id)
+            return
+
+        buckets = buckets.copy()
+        buckets.update(changes)
+        # keep the expiration of the stats computed in the DB, they can still
+        # miss the writes of other processes
+        ttl = settings.TODO_STATS_CACHE_TTL_SECONDS - (time.monotonic() - computed_at)
+        todo_stats_cache.set(user_id, (+buckets, computed_at), ttl=ttl)
+
+
+def _invalidate_stats(user_ids: set[int]):
+    with _todo_stats_lock:
+        for user_id in user_ids:
+            _todo_stats_computing.pop(user_id, None)
+            todo_stats_cache.pop(user_id)
+
+
+def _copy_value(value: Any) -> str:
+    # text format of COPY, with \N for NULL and escaped special characters
+    if value is None:
+        return "\\N"
 
-        return query.offset(offset).limit(limit).all()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
@@ -1,14 +1,33 @@
-from typing import Any
+from typing import Any, Sequence
 
-from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from sqlalchemy import (Boolean, Column, DateTime, Index, Integer, String,
+                        delete, select, text, update)
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session, relationship
 from sqlalchemy.sql import func
 
-from app.core.security import get_password_hash, verify_password
-from app.database.db import Base
-from app.schemas.user import UserCreate, UserUpdate
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.core.security import (get_password_hash, get_password_hash_async,
+                               make_unusable_password,
+                               verify_and_update_password,
+                               verify_and_update_password_async)
+from app.database.db import Base, DBSession, run_db
+from app.database.types import Timestamp
+from app.schemas.user import Principal, UserCreate, UserUpdate
 
-from .base_crud_model import BaseCrudModel
+from .base_crud_model import BaseCrudModel, get_projection
+from .revoked_token import RevokedToken
+from .todo import todo_stats_cache
+from .user_identity import UserIdentity
+
+settings = get_settings()
+
+# authorization fields of recently seen users, keyed by user ID
+principal_cache = TTLCache(
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
 
 
 class User(Base, BaseCrudModel):
@@ -21,9 +40,30 @@ class User(Base, BaseCrudModel):
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
     is_verified = Column(Boolean, default=False)
-    time_created = Column(DateTime(timezone=True), server_default=func.now())
+    time_created = Column(Timestamp, server_default=func.now())
+    # set when the user is deleted, until the purger removes it with its todos
+    time_deleted = Column(DateTime(timezone=True))
 
     todos = relationship("ToDo", back_populates="user", cascade="delete, delete-orphan")
+    identities = relationship(
+        "UserIdentity", back_populates="user", cascade="delete, delete-orphan"
+    )
+
+    __table_args__ = (
+        # users pending to be purged, in order of deletion
+        Index(
+            "ix_users_deleted",
+            "time_deleted",
+            "id",
+            postgresql_where=text("time_deleted IS NOT NULL"),
+            sqlite_where=text("time_deleted IS NOT NULL"),
+        ),
+    )
+
+    @classmethod
+    def get_by_id(cls, db: Session, id: int):
+        # deleted users are gone for the API, even before they are purged
+        return db.query(cls).filter(cls.id == id, cls.time_deleted.is_(None)).first()
 
     @classmethod
     def create(
@@ -32,28 +72,215 @@ class User(Base, BaseCrudModel):
         user_data: UserCreate,
         is_verified: bool = False,
         is_superuser: bool = False,
+        hashed_password: str | None = None,
     ):
-        new_user = User(
-            email=user_data.email,
-            full_name=user_data.full_name,
-            hashed_password=get_password_hash(user_data.password),
+        if hashed_password is None:
+            hashed_password = get_password_hash(user_data.password)
+
+        return cls.insert(
+            db,
+            {
+                "email": user_data.email,
+                "full_name": user_data.full_name,
+                "hashed_password": hashed_password,
+                "is_verified": is_verified,
+                "is_superuser": is_superuser,
+            },
+        )
+
+    @classmethod
+    async def create_async(
+        cls,
+        db: DBSession,
+        user_data: UserCreate,
+        is_verified: bool = False,
+        is_superuser: bool = False,
+    ):
+        """
+        Same as create, but hashing the password in the password hashing
+        executor and running the DB queries without blocking the event loop.
+        """
+        hashed_password = await get_password_hash_async(user_data.password)
+        return await run_db(
+            db,
+            cls.create,
+            user_data,
             is_verified=is_verified,
             is_superuser=is_superuser,
+            hashed_password=hashed_password,
         )
-        db.add(new_user)
+
+    @classmethod
+    def create_federated(
+        cls,
+        db: Session,
+        email: str,
+        provider: str,
+        subject: str,
+        full_name: str | None = None,
+    ):
+        """
+        Create a user without password, linked to its account in an external
+        identity provider. The email is considered verified by the provider.
+        """
+        new_user = cls.insert(
+            db,
+            {
+                "email": email,
+                "full_name": full_name,
+                "hashed_password": make_unusable_password(),
+                "is_verified": True,
+            },
+            commit=False,
+        )
+        UserIdentity.create(db, new_user.id, provider, subject, commit=False)
         db.commit()
-        db.refresh(new_user)
 
         return new_user
 
     @classmethod
-    def get_multiple(cls, db: Session, offset: int = 0, limit: int = 100):
-        return db.query(cls).offset(offset).limit(limit).all()
+    async def create_federated_async(
+        cls,
+        db: DBSession,
+        email: str,
+        provider: str,
+        subject: str,
+        full_name: str | None = None,
+    ):
+        return await run_db(
+            db,
+            cls.create_federated,
+            email=email,
+            provider=provider,
+            subject=subject,
+            full_name=full_name,
+        )
+
+    @classmethod
+    def get_multiple(
+        cls,
+        db: Session,
+        offset: int = 0,
+        limit: int = 100,
+        after_id: int | None = None,
+    ):
+        """
+        Users sorted by id, after the given id if any (keyset pagination).
+        """
+        statement = cls._page_statement([cls], offset, limit, after_id)
+        return db.execute(statement).scalars().all()
+
+    @classmethod
+    def get_multiple_rows(
+        cls,
+        db: Session,
+        fields: Sequence[str],
+        offset: int = 0,
+        limit: int = 100,
+        after_id: int | None = None,
+    ) -> list[Row]:
+        """
+        Same as get_multiple, but only selecting the given columns (and the
+        id, after them), as rows (not ORM objects, so they are not added to
+        the session).
+        """
+        columns = get_projection(cls, tuple(fields), ("id",))
+        statement = cls._page_statement(columns, offset, limit, after_id)
+        return db.execute(statement).all()
+
+    @classmethod
+    def _page_statement(
+        cls, entities: list, offset: int, limit: int, after_id: int | None
+    ):
+        statement = select(*entities).where(cls.time_deleted.is_(None))
+        if after_id is not None:
+            statement = statement.where(cls.id > after_id)
+
+        return statement.order_by(cls.id).offset(offset).limit(limit)
 
     @classmethod
     def get_by_email(cls, db: Session, email: str):
         return db.query(cls).filter(cls.email == email).first()
 
+    @classmethod
+    async def get_multiple_async(
+        cls,
+        db: DBSession,
+        offset: int = 0,
+        limit: int = 100,
+        after_id: int | None = None,
+    ):
+        return await run_db(
+            db, cls.get_multiple, offset=offset, limit=limit, after_id=after_id
+        )
+
+    @classmethod
+    async def get_multiple_rows_async(
+        cls,
+        db: DBSession,
+        fields: Sequence[str],
+        offset: int = 0,
+        limit: int = 100,
+        after_id: int | None = None,
+    ) -> list[Row]:
+        return await run_db(
+            db,
+            cls.get_multiple_rows,
+            fields,
+            offset=offset,
+            limit=limit,
+            after_id=after_id,
+        )
+
+    @classmethod
+    async def get_by_email_async(cls, db: DBSession, email: str):
+        return await run_db(db, cls.get_by_email, email=email)
+
+    @classmethod
+    def get_by_identity(cls, db: Session, provider: str, subject: str):
+        return (
+            db.query(cls)
+            .join(UserIdentity)
+            .filter(UserIdentity.provider == provider, UserIdentity.subject == subject)
+            .first()
+        )
+
+    @classmethod
+    async def get_by_identity_async(cls, db: DBSession, provider: str, subject: str):
+        return await run_db(db, cls.get_by_identity, provider, subject)
+
+    @classmethod
+    def get_principal(cls, db: Session, id: int) -> Principal | None:
+        """
+        Get the fields needed to authorize a user, from the principal cache
+        if possible (to avoid querying the DB on every authenticated request).
+        """
+        if not settings.PRINCIPAL_CACHE_ENABLED:
+            user = cls.get_by_id(db, id)
+            return Principal.from_orm(user) if user else None
+
+        principal = principal_cache.get(id)
+        if principal is None:
+            user = cls.get_by_id(db, id)
+            if not user:
+                return None
+
+            principal = Principal.from_orm(user)
+            principal_cache.set(id, principal)
+
+        return principal
+
+    @classmethod
+    async def get_principal_async(cls, db: DBSession, id: int) -> Principal | None:
+        # cached principals are returned without switching to the DB session
+        principal = (
+            principal_cache.get(id) if settings.PRINCIPAL_CACHE_ENABLED else None
+        )
+        if principal is not None:
+            return principal
+
+        return await run_db(db, cls.get_principal, id)
+
     @classmethod
     def update(
         cls,
@@ -72,7 +299,115 @@ class User(Base, BaseCrudModel):
             update_data["hashed_password"] = get_password_hash(update_data["password"])
             update_data.pop("password")
 
-        return BaseCrudModel.update(db, current=current, new=update_data)
+        updated_user = BaseCrudModel.update(db, current=current, new=update_data)
+        principal_cache.pop(updated_user.id)
+
+        return updated_user
+
+    @classmethod
+    async def update_async(
+        cls,
+        db: DBSession,
+        current,
+        new: UserUpdate | dict[str, Any],
+    ):
+        """
+        Same as update, but hashing the password in the password hashing
+        executor and running the DB queries without blocking the event loop.
+        """
+        if isinstance(new, dict):
+            update_data = new
+        else:
+            update_data = new.dict(exclude_unset=True)
+
+        if "password" in update_data:
+            update_data["hashed_password"] = await get_password_hash_async(
+                update_data["password"]
+            )
+            update_data.pop("password")
+
+        return await run_db(db, cls.update, current=current, new=update_data)
+
+    @classmethod
+    def delete(cls, db: Session, db_obj):
+        principal_cache.pop(db_obj.id)
+        todo_stats_cache.pop(db_obj.id)
+        # the tokens of the user are revoked in the same transaction
+        RevokedToken.revoke_user(db, db_obj.id, commit=False)
+        return super().delete(db, db_obj)
+
+    @classmethod
+    def delete_by_id(cls, db: Session, id: int):
+        principal_cache.pop(id)
+        todo_stats_cache.pop(id)
+        RevokedToken.revoke_user(db, id, commit=False)
+        return super().delete_by_id(db, id)
+
+    @classmethod
+    def soft_delete(cls, db: Session, db_obj):
+        """
+        Mark a user as deleted, revoking its tokens and freeing its email and
+        identities (to sign up again). Unlike delete, its todos are not
+        loaded: the user is removed later by the purger, with its todos.
+        """
+        principal_cache.pop(db_obj.id)
+        todo_stats_cache.pop(db_obj.id)
+        statement = (
+            update(cls)
+            .where(cls.id == db_obj.id)
+            .values(
+                time_deleted=func.now(),
+                is_active=False,
+                email=f"{db_obj.id}@deleted.invalid",
+                hashed_password=make_unusable_password(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(statement)
+        db.execute(delete(UserIdentity).where(UserIdentity.user_id == db_obj.id))
+        RevokedToken.revoke_user(db, db_obj.id, commit=False)
+        db.commit()
+
+        return db_obj
+
+    @classmethod
+    def get_deleted_ids(cls, db: Session, limit: int = 100) -> list[int]:
+        """
+        IDs of the users pending to be purged, oldest deletions first.
+        """
+        statement = (
+            select(cls.id)
+            .where(cls.time_deleted.is_not(None))
+            .order_by(cls.time_deleted, cls.id)
+            .limit(limit)
+        )
+        return db.execute(statement).scalars().all()
+
+    @classmethod
+    def purge(cls, db: Session, id: int) -> bool:
+        """
+        Remove a deleted user (once its todos are deleted, the rest of the
+        related rows are deleted by the DB).
+        """
+        statement = delete(cls.__table__).where(
+            cls.id == id, cls.time_deleted.is_not(None)
+        )
+        purged = db.execute(statement).rowcount > 0
+        db.commit()
+
+        return purged
+
+    @classmethod
+    async def soft_delete_async(cls, db: DBSession, db_obj):
+        return await run_db(db, cls.soft_delete, db_obj)
+
+    @classmethod
+    async def get_deleted_ids_async(cls, db: DBSession, limit: int = 100) -> list[int]:
+        return await run_db(db, cls.get_deleted_ids, limit)
+
+    @classmethod
+    async def purge_async(cls, db: DBSession, id: int) -> bool:
+        return await run_db(db, cls.purge, id)
 
     @classmethod
     def authenticate(cls, db: Session, email: str, password: str):
@@ -80,7 +415,43 @@ class User(Base, BaseCrudModel):
         if not user:
             return None
 
-        if not verify_password(password, user.hashed_password):
+        verified, new_hash = verify_and_update_password(password, user.hashed_password)
+        if not verified:
             return None
 
+        if new_hash:
+            cls._update_password_hash(db, user, new_hash)
+
+        return user
+
+    @classmethod
+    async def authenticate_async(cls, db: DBSession, email: str, password: str):
+        """
+        Same as authenticate, but verifying the password in the password
+        hashing executor and running the DB queries without blocking the
+        event loop.
+        """
+        user = await run_db(db, cls.get_by_email, email=email)
+        if not user:
+            return None
+
+        verified, new_hash = await verify_and_update_password_async(
+            password, user.hashed_password
+        )
+        if not verified:
+            return None
+
+        if new_hash:
+            await run_db(db, cls._update_password_hash, user, new_hash)
+
         return user
+
+    @classmethod
+    def _update_password_hash(cls, db: Session, user, new_hash: str):
+        """
+        Replace a hash that does not follow the hashing policy anymore,
+        already verified (so the password itself is unchanged).
+        """
+        user.hashed_password = new_hash
+        db.add(user)
+        db.commit()
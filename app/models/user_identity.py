@@ -0,0 +1,51 @@
+from sqlalchemy import Column, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Session, relationship
+from sqlalchemy.sql import func
+
+from app.database.db import Base
+from app.database.types import Timestamp
+
+from .base_crud_model import BaseCrudModel
+
+
+class UserIdentity(Base, BaseCrudModel):
+    """
+    Account of a user in an external identity provider (e.g. Google),
+    identified by the stable subject the provider assigns to it.
+    """
+
+    __tablename__ = "user_identities"
+    __table_args__ = (UniqueConstraint("provider", "subject"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    time_created = Column(Timestamp, server_default=func.now())
+
+    user = relationship("User", back_populates="identities")
+
+    @classmethod
+    def create(
+        cls,
+        db: Session,
+        user_id: int,
+        provider: str,
+        subject: str,
+        commit: bool = True,
+    ):
+        return cls.insert(
+            db,
+            {"provider": provider, "subject": subject, "user_id": user_id},
+            commit=commit,
+        )
+
+    @classmethod
+    def get(cls, db: Session, provider: str, subject: str):
+        return (
+            db.query(cls)
+            .filter(cls.provider == provider, cls.subject == subject)
+            .first()
+        )
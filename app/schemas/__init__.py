@@ -1,3 +1,6 @@
-from .todo import ToDoCreate, ToDoOut, ToDoUpdate
+from .todo import (ToDoBulkCreate, ToDoBulkIds, ToDoBulkResult, ToDoBulkUpdate,
+                   ToDoBulkUpdateItem, ToDoCreate, ToDoDayCount,
+                   ToDoImportError, ToDoImportResult, ToDoOut, ToDoStats,
+                   ToDoUpdate)
 from .token import RefreshToken, Token, TokenPayload
-from .user import User, UserCreate, UserUpdate
+from .user import Principal, User, UserCreate, UserUpdate
@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, validator
 
 
 # common properties
@@ -33,3 +33,61 @@ class ToDoOut(ToDoBase):
 
     class Config:
         orm_mode = True
+
+
+# properties to receive when creating several todos
+class ToDoBulkCreate(BaseModel):
+    items: list[ToDoCreate] = Field(min_items=1)
+
+
+class ToDoBulkUpdateItem(ToDoUpdate):
+    id: int
+
+
+# properties to receive when updating several todos
+class ToDoBulkUpdate(BaseModel):
+    items: list[ToDoBulkUpdateItem] = Field(min_items=1)
+
+    @validator("items")
+    def unique_ids(cls, items):
+        if len({item.id for item in items}) != len(items):
+            raise ValueError("duplicated ToDo IDs")
+        return items
+
+
+# properties to receive when resolving several todos
+class ToDoBulkIds(BaseModel):
+    ids: list[int] = Field(min_items=1)
+
+
+# result of each item of a bulk operation
+class ToDoBulkResult(BaseModel):
+    id: int
+    status_code: int
+    detail: str | None = None
+    todo: ToDoOut | None = None
+
+
+class ToDoImportError(BaseModel):
+    line: int
+    detail: str
+
+
+# summary of an import, with the first errors
+class ToDoImportResult(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: list[ToDoImportError] = []
+
+
+class ToDoDayCount(BaseModel):
+    day: date
+    count: int
+
+
+# aggregated counts of the todos of a user
+class ToDoStats(BaseModel):
+    total: int
+    open: int
+    done: int
+    done_per_day: list[ToDoDayCount]
@@ -9,6 +9,9 @@ class Token(BaseModel):
 
 class TokenPayload(BaseModel):
     sub: str | None = None
+    exp: int | None = None
+    iat: float | None = None
+    jti: str | None = None
 
 
 class RefreshToken(BaseModel):
@@ -30,3 +30,14 @@ class User(UserBase):
 
     class Config:
         orm_mode = True
+
+
+# properties needed to authorize the current user
+class Principal(BaseModel):
+    id: int
+    is_active: bool = True
+    is_superuser: bool = False
+
+    class Config:
+        orm_mode = True
+        allow_mutation = False
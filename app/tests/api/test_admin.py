@@ -0,0 +1,41 @@
+import os
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+
+def test_read_metrics(client: TestClient, auth_headers_superuser):
+    headers, _ = auth_headers_superuser
+
+    response = client.get("/api/admin/metrics", headers=headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    metrics = response.json()
+    assert metrics["pid"] == os.getpid()
+    assert {"size", "checked_out", "checkout_wait_seconds"} <= set(
+        metrics["db_pool"]["sync"]
+    )
+    assert {"token", "principal", "todo_stats", "google_token"} == set(metrics["cache"])
+    assert "in_flight" in metrics["password_hashing"]
+    assert {"users_pending", "users_purged", "todos_purged"} <= set(
+        metrics["user_purge"]
+    )
+
+
+def test_read_metrics_prometheus(client: TestClient, auth_headers_superuser):
+    headers, _ = auth_headers_superuser
+
+    response = client.get("/api/admin/metrics/prometheus", headers=headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    assert f'db_pool_checkouts{{engine="sync",pid="{os.getpid()}"}} ' in response.text
+    assert f'cache_hits{{cache="principal",pid="{os.getpid()}"}} ' in response.text
+
+
+def test_read_metrics_not_superuser(client: TestClient, auth_headers):
+    headers, _ = auth_headers
+
+    for path in ["/api/admin/metrics", "/api/admin/metrics/prometheus"]:
+        response = client.get(path, headers=headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,143 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from app.api.middleware import (COMPRESSORS, CompressionMiddleware,
+                                choose_encoding)
+from app.models import User
+from app.tests.factories import ToDoFactory
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encodings, expected",
+    [
+        ("gzip, deflate, br", ["zstd", "br", "gzip"], "br"),
+        ("gzip;q=0.9, br;q=0.5", ["zstd", "br", "gzip"], "gzip"),
+        ("*", ["zstd", "br", "gzip"], "zstd"),
+        ("br;q=0, *;q=0.1", ["br", "gzip"], "gzip"),
+        ("GZIP; q=1", ["gzip"], "gzip"),
+        ("identity", ["gzip"], None),
+        ("gzip;q=invalid", ["gzip"], None),
+        ("", ["gzip"], None),
+    ],
+)
+def test_choose_encoding(accept_encoding, encodings, expected):
+    assert choose_encoding(accept_encoding, encodings) == expected
+
+
+def decompress(encoding: str, data: bytes) -> bytes:
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+    if encoding == "br":
+        return pytest.importorskip("brotli").Decompressor().process(data)
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def run_middleware(app, accept_encoding: str, minimum_size: int = 10):
+    """
+    Messages sent by the middleware with the given ASGI app.
+    """
+    middleware = CompressionMiddleware(
+        app, minimum_size=minimum_size, levels={"gzip": 6, "br": 4, "zstd": 3}
+    )
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return messages
+
+
+def make_app(chunks: list[bytes], headers: list[tuple[bytes, bytes]]):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for i, chunk in enumerate(chunks):
+            more_body = i < len(chunks) - 1
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": more_body}
+            )
+
+    return app
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_compress_streaming_response(encoding):
+    if encoding not in COMPRESSORS:
+        pytest.skip(f"{encoding} not installed")
+    chunks = [b'{"id": 1}\n' * 10, b'{"id": 2}\n' * 10, b""]
+    app = make_app(chunks, [(b"content-type", b"application/x-ndjson")])
+
+    start, *bodies = run_middleware(app, encoding)
+
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == encoding.encode()
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert b"content-length" not in headers
+    assert len(bodies) == len(chunks)
+    # every chunk is flushed, so the first one can be read on its own
+    assert decompress(encoding, bodies[0]["body"]) == chunks[0]
+    assert decompress(encoding, b"".join(body["body"] for body in bodies)) == b"".join(
+        chunks
+    )
+
+
+@pytest.mark.parametrize(
+    "chunks, headers, accept_encoding",
+    [
+        ([b"short"], [(b"content-type", b"application/json")], "gzip"),
+        ([b"a" * 100], [(b"content-type", b"image/png")], "gzip"),
+        ([b"a" * 100], [(b"content-type", b"text/event-stream")], "gzip"),
+        (
+            [gzip.compress(b"a" * 100)],
+            [(b"content-type", b"text/plain"), (b"content-encoding", b"gzip")],
+            "gzip",
+        ),
+        ([b"a" * 100], [(b"content-type", b"application/json")], "identity"),
+    ],
+    ids=["small", "binary", "event_stream", "already_compressed", "not_accepted"],
+)
+def test_not_compressed(chunks, headers, accept_encoding):
+    app = make_app(chunks, list(headers))
+
+    start, body = run_middleware(app, accept_encoding)
+
+    assert dict(start["headers"]).get(b"content-encoding") == dict(headers).get(
+        b"content-encoding"
+    )
+    assert body["body"] == chunks[0]
+
+
+def test_compressed_listing(
+    client: TestClient, auth_headers: tuple[dict[str, str], User]
+):
+    headers, user = auth_headers
+    ToDoFactory.create_batch(20, user=user, description="Description " * 10)
+
+    response = client.get("/api/todos", headers=headers)
+    uncompressed = response.content
+
+    response = client.get(
+        "/api/todos", headers={**headers, "Accept-Encoding": "gzip"}, stream=True
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    compressed = response.raw.read(decode_content=False)
+    assert int(response.headers["content-length"]) == len(compressed)
+    assert len(compressed) < len(uncompressed)
+    assert decompress("gzip", compressed) == uncompressed
@@ -5,8 +5,11 @@ from fastapi import status
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app.core.security import create_account_verification_token
+from app.core.config import get_settings
+from app.core.security import (create_account_verification_token,
+                               create_refresh_token)
 from app.models import User
+from app.models.user import principal_cache
 from app.tests.factories import UserFactory
 from app.tests.fixtures import mock_email  # noqa: F401
 
@@ -63,6 +66,31 @@ def test_get_access_token_invalid(
         assert response.json() == {"detail": "Inactive user"}
 
 
+def test_get_access_token_rate_limited(
+    client: TestClient,
+    db_session: Session,
+    mocker,
+):
+    verify_password = mocker.patch("app.models.user.verify_and_update_password_async")
+    settings = get_settings()
+    form_data = {"username": "test@test.com", "password": "wrong_password"}
+
+    for _ in range(settings.LOGIN_RATE_LIMIT_PER_USERNAME):
+        response = client.post("api/token", data=form_data)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.post("api/token", data=form_data)
+
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) > 0
+    verify_password.assert_not_called()
+
+    # the limit is per username
+    form_data["username"] = "other@test.com"
+    response = client.post("api/token", data=form_data)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 def test_get_refresh_token_valid(
     client: TestClient,
     db_session: Session,
@@ -89,7 +117,9 @@ def test_get_refresh_token_valid(
     assert token["token_type"] == "bearer"
 
 
-@pytest.mark.parametrize("cases", ["invalid_refresh_token", "user_not_found"])
+@pytest.mark.parametrize(
+    "cases", ["invalid_refresh_token", "user_not_found", "user_deleted"]
+)
 def test_get_refresh_token_invalid(
     client: TestClient,
     db_session: Session,
@@ -109,8 +139,12 @@ def test_get_refresh_token_invalid(
     data = {"grant_type": "refresh_token", "token": token["refresh_token"]}
     if cases == "invalid_refresh_token":
         data["grant_type"] = "not_refresh_token"
+    elif cases == "user_not_found":
+        # delete the row directly, User.delete also revokes the user tokens
+        db_user = User.get_by_email(db_session, email=user_data["email"])
+        db_session.delete(db_user)
+        db_session.commit()
     else:
-        # user_not_found case
         db_user = User.get_by_email(db_session, email=user_data["email"])
         User.delete(db_session, db_user)
 
@@ -119,6 +153,9 @@ def test_get_refresh_token_invalid(
     if cases == "invalid_refresh_token":
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert response.json() == {"detail": "Invalid refresh token"}
+    elif cases == "user_deleted":
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response.json() == {"detail": "Token revoked"}
     else:
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert response.json() == {"detail": "User not found"}
@@ -181,6 +218,21 @@ def test_register_user_email_disabled(client: TestClient, db_session: Session):
     assert created_user.get("is_verified")
 
 
+def test_register_user_rate_limited(client: TestClient, db_session: Session):
+    settings = get_settings()
+    for i in range(settings.REGISTER_RATE_LIMIT_BURST):
+        data = {"email": f"user{i}@example.com", "password": "123456"}
+        response = client.post("/api/register", json=data)
+        assert response.status_code == status.HTTP_201_CREATED
+
+    data = {"email": "another_user@example.com", "password": "123456"}
+    response = client.post("/api/register", json=data)
+
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert "Retry-After" in response.headers
+    assert not User.get_by_email(db_session, email=data["email"])
+
+
 def test_register_user_existing_email(client: TestClient, db_session: Session):
     user = UserFactory.create()
 
@@ -208,7 +260,9 @@ def test_current_user_non_existent(
 ):
     headers, user = auth_headers
 
-    User.delete(db_session, db_obj=user)
+    # delete the row directly, User.delete also revokes the user tokens
+    db_session.delete(user)
+    db_session.commit()
 
     response = client.get("/api/users/me", headers=headers)
 
@@ -216,6 +270,74 @@ def test_current_user_non_existent(
     assert response.json() == {"detail": "User not found"}
 
 
+def test_current_user_deleted(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+
+    User.delete(db_session, db_obj=user)
+
+    response = client.get("/api/users/me", headers=headers)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.json() == {"detail": "Token revoked"}
+
+
+def test_logout(
+    client: TestClient,
+    db_session: Session,
+    auth_headers_superuser: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers_superuser
+    user_data = {"email": "test@test.com", "password": "123456"}
+    response = client.post("/api/users", json=user_data, headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    form_data = {"username": user_data["email"], "password": user_data["password"]}
+    token = client.post("api/token", data=form_data).json()
+    user_headers = {"Authorization": f"Bearer {token['access_token']}"}
+    other_token = client.post("api/token", data=form_data).json()
+    other_headers = {"Authorization": f"Bearer {other_token['access_token']}"}
+
+    response = client.post(
+        "api/logout",
+        json={"refresh_token": token["refresh_token"]},
+        headers=user_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"message": "Logged out"}
+
+    response = client.get("/api/users/me", headers=user_headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    data = {"grant_type": "refresh_token", "token": token["refresh_token"]}
+    response = client.post("api/refresh_token", json=data)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    # other tokens of the same user are still valid
+    response = client.get("/api/users/me", headers=other_headers)
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_logout_refresh_token_other_user(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    other_user = UserFactory.create()
+
+    response = client.post(
+        "api/logout",
+        json={"refresh_token": create_refresh_token(other_user.id)},
+        headers=headers,
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "Invalid refresh token"}
+
+
 def test_current_user_inactive(
     client: TestClient,
     db_session: Session,
@@ -231,6 +353,32 @@ def test_current_user_inactive(
     assert response.json() == {"detail": "Inactive user"}
 
 
+def test_current_user_principal_cache(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+
+    response = client.get("/api/todos", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert principal_cache.get(user.id).is_active
+
+    # updating the user must invalidate the cached principal
+    User.update(db_session, current=user, new={"is_active": False})
+    assert principal_cache.get(user.id) is None
+
+    response = client.get("/api/todos", headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "Inactive user"}
+
+    User.delete(db_session, db_obj=user)
+    assert principal_cache.get(user.id) is None
+
+    response = client.get("/api/todos", headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
 def test_verify_account(client: TestClient, db_session: Session):
     user = UserFactory.create(is_verified=False)
 
@@ -253,3 +401,10 @@ def test_verify_account_not_found(client: TestClient, db_session: Session):
 
     assert response.status_code == status.HTTP_404_NOT_FOUND
     assert response.json() == {"detail": "No user registered with that email"}
+
+
+def test_get_jwks_symmetric_key(client: TestClient):
+    response = client.get("/api/.well-known/jwks.json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"keys": []}
@@ -3,21 +3,27 @@ from fastapi import HTTPException, status
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app.models import User
+from app.core.security import has_usable_password
+from app.models import User, UserIdentity
 from app.tests.factories import UserFactory
 
 
-def mock_validate_google_token(token: str):
-    if token not in ["valid", "no_user", "already_registered"]:
+async def mock_validate_google_token(token: str):
+    if token not in ["valid", "no_user", "already_registered", "unverified"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect email or password",
         )
 
-    return {"email": "user@example.com", "name": "User Example"}
+    return {
+        "sub": "1234",
+        "email": "user@example.com",
+        "email_verified": token != "unverified",
+        "name": "User Example",
+    }
 
 
-@pytest.mark.parametrize("token", ["valid", "invalid", "no_user"])
+@pytest.mark.parametrize("token", ["valid", "invalid", "no_user", "unverified"])
 def test_login_google_token(
     client: TestClient,
     db_session: Session,
@@ -42,9 +48,13 @@ def test_login_google_token(
         assert token["token_type"] == "bearer"
     else:
         assert response.status_code == status.HTTP_400_BAD_REQUEST
+        # the account is not linked to the user with the same email
+        assert not UserIdentity.get(db_session, "google", "1234")
 
 
-@pytest.mark.parametrize("token", ["valid", "invalid", "already_registered"])
+@pytest.mark.parametrize(
+    "token", ["valid", "invalid", "already_registered", "unverified"]
+)
 def test_register_google(
     client: TestClient,
     db_session: Session,
@@ -70,5 +80,57 @@ def test_register_google(
         assert db_user
         assert db_user.email == email
         assert db_user.is_verified
+        assert not has_usable_password(db_user.hashed_password)
+        assert User.get_by_identity(db_session, "google", "1234").id == db_user.id
     else:
         assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not User.get_by_identity(db_session, "google", "1234")
+
+
+def test_login_google_links_identity(
+    client: TestClient,
+    db_session: Session,
+    mocker,
+):
+    user = UserFactory.create(email="user@example.com")
+    mocker.patch(
+        "app.api.endpoints.login_google._validate_google_token",
+        mock_validate_google_token,
+    )
+
+    response = client.post("/api/token_google", json={"access_token": "valid"})
+    assert response.status_code == status.HTTP_200_OK
+
+    identity = UserIdentity.get(db_session, "google", "1234")
+    assert identity.user_id == user.id
+
+    # the user is found by the Google account even after changing the email
+    User.update(db_session, current=user, new={"email": "new@example.com"})
+    response = client.post("/api/token_google", json={"access_token": "valid"})
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_register_google_skips_password_hashing(
+    client: TestClient,
+    db_session: Session,
+    mocker,
+):
+    mocker.patch(
+        "app.api.endpoints.login_google._validate_google_token",
+        mock_validate_google_token,
+    )
+    hash_password = mocker.patch("app.core.security.pwd_context.hash")
+    verify_password = mocker.patch("app.core.security.pwd_context.verify_and_update")
+
+    response = client.post("/api/register_google", json={"access_token": "valid"})
+    assert response.status_code == status.HTTP_201_CREATED
+
+    # users registered with Google can't log in with a password
+    response = client.post(
+        "/api/token",
+        data={"username": "user@example.com", "password": "any_password"},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    hash_password.assert_not_called()
+    verify_password.assert_not_called()
@@ -4,7 +4,7 @@ from fastapi import status
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app.core.security import create_password_reset_token
+from app.core.security import create_access_token, create_password_reset_token
 from app.models import User
 from app.tests.factories import UserFactory
 from app.tests.fixtures import mock_email  # noqa: F401
@@ -73,3 +73,31 @@ def test_reset_password_not_found(client: TestClient, db_session: Session):
 
     assert response.status_code == status.HTTP_404_NOT_FOUND
     assert response.json() == {"detail": "No user registered with that email"}
+
+
+def test_reset_password_revokes_tokens(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+
+    token = create_password_reset_token(user.email)
+    reset_data = {"token": token, "password": "some_other_password"}
+    response = client.post("api/password_reset", json=reset_data)
+    assert response.status_code == status.HTTP_200_OK
+
+    # tokens issued before the reset are no longer valid
+    response = client.get("/api/users/me", headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.json() == {"detail": "Token revoked"}
+
+    # the reset token can only be used once
+    response = client.post("api/password_reset", json=reset_data)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    auth_token = create_access_token(subject=user.id)
+    response = client.get(
+        "/api/users/me", headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == status.HTTP_200_OK
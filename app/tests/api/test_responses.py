@@ -0,0 +1,52 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from app.api.responses import FastJSONResponse, dumps
+from app.schemas import ToDoBulkResult, ToDoDayCount, ToDoOut, ToDoStats
+
+TODO = ToDoOut(
+    id=1,
+    title="ToDo ñ",
+    description=None,
+    time_created=datetime(2026, 10, 18, 12, 30, 5, 123456, tzinfo=timezone.utc),
+    done=True,
+    time_done=datetime(2026, 10, 19, 8, tzinfo=timezone(timedelta(hours=-3))),
+    user_id=2,
+)
+
+CONTENTS = {
+    "model": TODO,
+    "naive_datetime": TODO.copy(update={"time_created": datetime(2026, 10, 18)}),
+    "nested_models": [ToDoBulkResult(id=1, status_code=200, todo=TODO)],
+    "dates": ToDoStats(
+        total=1,
+        open=0,
+        done=1,
+        done_per_day=[ToDoDayCount(day=date(2026, 10, 19), count=1)],
+    ),
+    "int_keys": {1: "a"},
+}
+
+
+@pytest.mark.parametrize("use_orjson", [True, False], ids=["orjson", "json"])
+@pytest.mark.parametrize("content", CONTENTS.values(), ids=CONTENTS.keys())
+def test_dumps_same_as_jsonable_encoder(mocker, use_orjson, content):
+    if not use_orjson:
+        mocker.patch("app.api.responses.orjson", None)
+
+    expected = json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+    assert dumps(content) == expected
+    assert FastJSONResponse(content).body == expected
+
+
+def test_dumps_not_serializable():
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
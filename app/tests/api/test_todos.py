@@ -1,11 +1,18 @@
+import csv
+import io
+import json
+import time
 from datetime import datetime, timedelta
 
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 
 from app.models import ToDo, User
+from app.models.todo import _update_stats, todo_stats_cache
+from app.schemas import ToDoCreate
 from app.tests.factories import ToDoFactory
 
 
@@ -103,6 +110,144 @@ def test_get_todos(
         assert "description" in todo
         assert "time_created" in todo
         assert todo.get("user_id") == user.id
+        # same output as the response model
+        response = client.get(f"/api/todos/{todo['id']}", headers=headers)
+        assert todo == response.json()
+
+
+def test_get_todos_cursor(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+
+    now = datetime.utcnow()
+    # todos created at the same time are sorted by ID
+    todos = [
+        ToDoFactory.create(user=user, time_created=now - timedelta(hours=hours))
+        for hours in [1, 3, 2, 2, 0]
+    ]
+    expected_ids = [
+        todo.id for todo in sorted(todos, key=lambda t: (t.time_created, t.id))
+    ]
+
+    todo_ids = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/api/todos", headers=headers, params=params)
+        assert response.status_code == status.HTTP_200_OK
+        todo_ids += [todo["id"] for todo in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert todo_ids == expected_ids
+
+    # legacy offset pagination, with the same order
+    response = client.get("/api/todos?offset=2&limit=2", headers=headers)
+    assert [todo["id"] for todo in response.json()] == expected_ids[2:4]
+
+
+def test_get_todos_cursor_server_default(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    # time_created set by the DB, with a different format than the cursor
+    # values (the same for all the todos created in the same second)
+    todos = [
+        ToDo.create(db_session, ToDoCreate(title=f"ToDo {i}"), user_id=user.id)
+        for i in range(6)
+    ]
+
+    todo_ids = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/api/todos", headers=headers, params=params)
+        assert response.status_code == status.HTTP_200_OK
+        todo_ids += [todo["id"] for todo in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert sorted(todo_ids) == todo_ids
+    assert todo_ids == sorted(todo.id for todo in todos)
+
+
+def test_get_todos_fields(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    todos = ToDoFactory.create_batch(3, user=user)
+
+    todo_ids = []
+    params = {"limit": 2, "fields": "title, done,id"}
+    while True:
+        response = client.get("/api/todos", headers=headers, params=params)
+        assert response.status_code == status.HTTP_200_OK
+        for todo in response.json():
+            # in the order of the response model
+            assert list(todo) == ["title", "id", "done"]
+            todo_ids.append(todo["id"])
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert sorted(todo_ids) == sorted(todo.id for todo in todos)
+
+    response = client.get(f"/api/todos/{todos[0].id}?fields=title", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"title": todos[0].title}
+
+
+@pytest.mark.parametrize(
+    "fields, detail",
+    [("title,unknown", "Invalid fields: unknown"), (",", "Invalid fields: ,")],
+    ids=["unknown_field", "no_fields"],
+)
+def test_get_todos_invalid_fields(
+    client: TestClient, auth_headers: tuple[dict[str, str], User], fields, detail
+):
+    headers, _ = auth_headers
+
+    response = client.get("/api/todos", headers=headers, params={"fields": fields})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": detail}
+
+
+@pytest.mark.parametrize(
+    "query_params, status_code, detail",
+    [
+        ("cursor=invalid", status.HTTP_400_BAD_REQUEST, "Invalid cursor"),
+        ("cursor=WzFd", status.HTTP_400_BAD_REQUEST, "Invalid cursor"),
+        (
+            "cursor=WzFd&offset=1",
+            status.HTTP_400_BAD_REQUEST,
+            "Use either cursor or offset",
+        ),
+        ("limit=101", status.HTTP_422_UNPROCESSABLE_ENTITY, None),
+    ],
+    ids=["invalid_cursor", "wrong_cursor_values", "cursor_and_offset", "max_limit"],
+)
+def test_get_todos_pagination_errors(
+    client: TestClient,
+    auth_headers: tuple[dict[str, str], User],
+    query_params,
+    status_code,
+    detail,
+):
+    headers, user = auth_headers
+
+    response = client.get(f"/api/todos?{query_params}", headers=headers)
+
+    assert response.status_code == status_code
+    if detail:
+        assert response.json() == {"detail": detail}
 
 
 @pytest.mark.parametrize(
@@ -358,3 +503,375 @@ def test_mark_as_done(
 
     done_datetime = datetime.strptime(todo["time_done"], "%Y-%m-%dT%H:%M:%S")
     assert done_datetime >= time_before
+
+
+def test_create_todos_bulk(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    data = {"items": [{"title": "First"}, {"title": "Second", "description": "2"}]}
+
+    response = client.post("/api/todos/bulk", json=data, headers=headers)
+
+    assert response.status_code == status.HTTP_201_CREATED
+    results = response.json()
+    assert [result["status_code"] for result in results] == [201, 201]
+    assert [result["todo"]["title"] for result in results] == ["First", "Second"]
+    for result in results:
+        db_todo = ToDo.get_by_id(db_session, id=result["id"])
+        assert db_todo.user_id == user.id
+        assert result["todo"]["time_created"]
+
+
+def test_create_multiple_single_insert(
+    db_session: Session, auth_headers: tuple[dict[str, str], User]
+):
+    _, user = auth_headers
+    ToDoFactory.create(user=user)
+    statements = []
+
+    def capture_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", capture_statement)
+    try:
+        todos = ToDo.create_multiple(
+            db_session, [ToDoCreate(title=f"ToDo {i}") for i in range(5)], user.id
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", capture_statement)
+
+    assert [todo.title for todo in todos] == [f"ToDo {i}" for i in range(5)]
+    assert all(todo.user_id == user.id and todo.time_created for todo in todos)
+    assert len([s for s in statements if s.lstrip().startswith("INSERT")]) == 1
+
+
+def get_bulk_todo_ids(user: User) -> list[int]:
+    # one todo of the user, one of other user and one that does not exist
+    return [
+        ToDoFactory.create(user=user).id,
+        ToDoFactory.create(user__id=user.id + 1).id,
+        100,
+    ]
+
+
+def check_bulk_errors(results: list[dict]):
+    assert results[1]["status_code"] == status.HTTP_400_BAD_REQUEST
+    assert results[1]["detail"] == "ToDo does not belong to current user"
+    assert results[2]["status_code"] == status.HTTP_404_NOT_FOUND
+    assert results[2]["detail"] == "ToDo not found"
+
+
+def test_update_todos_bulk(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    todo_ids = get_bulk_todo_ids(user)
+    other_todo = ToDoFactory.create(user=user)
+    data = {
+        "items": [{"id": todo_id, "title": "Other Title"} for todo_id in todo_ids]
+        + [{"id": other_todo.id, "done": True}]
+    }
+
+    response = client.patch("/api/todos/bulk", json=data, headers=headers)
+
+    assert response.status_code == status.HTTP_207_MULTI_STATUS
+    results = response.json()
+    assert [result["id"] for result in results] == todo_ids + [other_todo.id]
+    assert results[0]["status_code"] == status.HTTP_200_OK
+    assert results[0]["todo"]["title"] == "Other Title"
+    assert results[3]["todo"]["done"]
+    assert results[3]["todo"]["title"] == other_todo.title
+    check_bulk_errors(results)
+    assert ToDo.get_by_id(db_session, id=todo_ids[1]).title != "Other Title"
+
+
+def test_update_todos_bulk_duplicated_ids(
+    client: TestClient,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    data = {"items": [{"id": 1, "title": "A"}, {"id": 1, "title": "B"}]}
+
+    response = client.patch("/api/todos/bulk", json=data, headers=headers)
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_mark_as_done_bulk(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    todo_ids = get_bulk_todo_ids(user)
+
+    response = client.put(
+        "/api/todos/bulk/resolve", json={"ids": todo_ids}, headers=headers
+    )
+
+    assert response.status_code == status.HTTP_207_MULTI_STATUS
+    results = response.json()
+    assert results[0]["status_code"] == status.HTTP_200_OK
+    assert results[0]["todo"]["done"]
+    assert results[0]["todo"]["time_done"]
+    check_bulk_errors(results)
+    assert not ToDo.get_by_id(db_session, id=todo_ids[1]).done
+
+
+def test_delete_todos_bulk(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    todo_ids = get_bulk_todo_ids(user)
+
+    response = client.delete(
+        "/api/todos/bulk", params={"ids": todo_ids}, headers=headers
+    )
+
+    assert response.status_code == status.HTTP_207_MULTI_STATUS
+    results = response.json()
+    assert results[0]["status_code"] == status.HTTP_204_NO_CONTENT
+    check_bulk_errors(results)
+    assert not ToDo.get_by_id(db_session, id=todo_ids[0])
+    assert ToDo.get_by_id(db_session, id=todo_ids[1])
+
+
+def test_todos_bulk_max_items(
+    client: TestClient,
+    auth_headers: tuple[dict[str, str], User],
+    mocker,
+):
+    headers, user = auth_headers
+    mocker.patch("app.api.endpoints.todos.settings.TODOS_BULK_MAX_ITEMS", 1)
+    data = {"items": [{"title": "First"}, {"title": "Second"}]}
+
+    response = client.post("/api/todos/bulk", json=data, headers=headers)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "Too many ToDo items (maximum 1)"}
+
+
+@pytest.mark.parametrize("export_format", ["ndjson", "csv"])
+def test_export_todos(
+    client: TestClient,
+    auth_headers: tuple[dict[str, str], User],
+    export_format,
+    mocker,
+):
+    headers, user = auth_headers
+    # several batches of rows
+    mocker.patch("app.api.endpoints.todos.settings.TODOS_EXPORT_BATCH_SIZE", 2)
+    todos = ToDoFactory.create_batch(5, user=user, done=False)
+    ToDoFactory.create(user=user, done=True)
+    ToDoFactory.create(user__id=user.id + 1, done=False)
+
+    response = client.get(
+        f"/api/todos/export?format={export_format}&done=false", headers=headers
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-disposition"] == (
+        f'attachment; filename="todos.{export_format}"'
+    )
+    if export_format == "ndjson":
+        assert response.headers["content-type"] == "application/x-ndjson"
+        exported = [json.loads(line) for line in response.text.splitlines()]
+    else:
+        assert response.headers["content-type"].startswith("text/csv")
+        exported = list(csv.DictReader(io.StringIO(response.text)))
+
+    assert [int(todo["id"]) for todo in exported] == [todo.id for todo in todos]
+    assert exported[0]["title"] == todos[0].title
+    assert exported[0]["time_created"] == todos[0].time_created.isoformat()
+
+
+def test_export_all_todos(
+    client: TestClient,
+    auth_headers_superuser: tuple[dict[str, str], User],
+):
+    headers, superuser = auth_headers_superuser
+    todos = [ToDoFactory.create(user=superuser), ToDoFactory.create(user__id=1000)]
+
+    response = client.get("/api/todos/export/all", headers=headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    exported_ids = {json.loads(line)["id"] for line in response.text.splitlines()}
+    assert exported_ids == {todo.id for todo in todos}
+
+
+def test_export_all_todos_not_superuser(
+    client: TestClient,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+
+    response = client.get("/api/todos/export/all", headers=headers)
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert response.json() == {"detail": "Not superuser"}
+
+
+def test_import_todos_ndjson(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+    mocker,
+):
+    headers, user = auth_headers
+    # several batches of todos
+    mocker.patch("app.api.endpoints.todos.settings.TODOS_IMPORT_BATCH_SIZE", 2)
+    lines = [
+        '{"title": "First", "description": "One"}',
+        '{"title": "Second"}',
+        "",
+        '{"description": "No title"}',
+        "not json",
+        '{"title": "Third"}',
+    ]
+
+    def body():
+        # the lines are split across the chunks
+        data = "\n".join(lines).encode()
+        for i in range(0, len(data), 7):
+            yield data[i : i + 7]
+
+    response = client.post("/api/todos/import", data=body(), headers=headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result["imported"] == 3
+    assert result["failed"] == 2
+    assert result["errors"][0] == {"line": 4, "detail": "title: field required"}
+    assert result["errors"][1]["line"] == 5
+    todos = ToDo.get_multiple(db_session, user_id=user.id)
+    assert [todo.title for todo in todos] == ["First", "Second", "Third"]
+    assert todos[0].description == "One"
+    assert not todos[0].done
+
+
+def test_import_todos_csv(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+    mocker,
+):
+    headers, user = auth_headers
+    mocker.patch("app.api.endpoints.todos.settings.TODOS_IMPORT_MAX_ERRORS", 1)
+    data = (
+        "title,description\n"
+        'First,"Two\nlines"\n'
+        "Second,\n"
+        "Third\n"
+        "Fourth,a,b\n"
+    )
+
+    response = client.post(
+        "/api/todos/import?format=csv", data=data.encode(), headers=headers
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "imported": 2,
+        "failed": 2,
+        "errors": [{"line": 5, "detail": "Invalid CSV: wrong number of values"}],
+    }
+    todos = ToDo.get_multiple(db_session, user_id=user.id)
+    assert [(todo.title, todo.description) for todo in todos] == [
+        ("First", "Two\nlines"),
+        ("Second", None),
+    ]
+
+
+def test_get_todo_stats(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    today = datetime.utcnow().replace(microsecond=0)
+    yesterday = today - timedelta(days=1)
+    ToDoFactory.create_batch(3, user=user)
+    ToDoFactory.create_batch(2, user=user, done=True, time_done=yesterday)
+    ToDoFactory.create(user=user, done=True, time_done=today)
+    ToDoFactory.create(user__id=user.id + 1)
+
+    response = client.get("/api/todos/stats", headers=headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "total": 6,
+        "open": 3,
+        "done": 3,
+        "done_per_day": [
+            {"day": yesterday.date().isoformat(), "count": 2},
+            {"day": today.date().isoformat(), "count": 1},
+        ],
+    }
+
+
+def test_todo_stats_cache(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+):
+    headers, user = auth_headers
+    todo = ToDoFactory.create(user=user)
+    assert client.get("/api/todos/stats", headers=headers).json()["open"] == 1
+
+    # the cached stats are updated by the writes, without querying the DB again
+    client.post("/api/todos", json={"title": "New"}, headers=headers)
+    client.put(f"/api/todos/{todo.id}/resolve", headers=headers)
+    hits = todo_stats_cache.hits
+    stats = ToDo.get_stats(db_session, user.id)
+    assert todo_stats_cache.hits == hits + 1
+    assert (stats.total, stats.open, stats.done) == (2, 1, 1)
+    assert stats.done_per_day[0].count == 1
+
+    # same stats as computed in the DB
+    client.delete(f"/api/todos/{todo.id}", headers=headers)
+    cached_stats = client.get("/api/todos/stats", headers=headers).json()
+    todo_stats_cache.clear()
+    assert client.get("/api/todos/stats", headers=headers).json() == cached_stats
+    assert cached_stats == {"total": 1, "open": 1, "done": 0, "done_per_day": []}
+
+    # the bulk writes invalidate the cached stats
+    todo_ids = [todo["id"] for todo in client.get("/api/todos", headers=headers).json()]
+    client.put("/api/todos/bulk/resolve", json={"ids": todo_ids}, headers=headers)
+    assert todo_stats_cache.get(user.id) is None
+    assert client.get("/api/todos/stats", headers=headers).json()["done"] == 1
+
+
+def test_todo_stats_cache_concurrent_writes(
+    db_session: Session, auth_headers: tuple[dict[str, str], User]
+):
+    _, user = auth_headers
+    ToDoFactory.create(user=user)
+
+    # a write committed after the stats query started (not counted), and
+    # applied before they are cached: the stats are not cached
+    def concurrent_write(*args):
+        _update_stats(user.id, {(False, None): 1}, time.monotonic())
+
+    engine = db_session.get_bind()
+    event.listen(engine, "after_cursor_execute", concurrent_write, once=True)
+    try:
+        assert ToDo.get_stats(db_session, user.id).total == 1
+    finally:
+        event.remove(engine, "after_cursor_execute", concurrent_write)
+    assert todo_stats_cache.get(user.id) is None
+
+    # a write committed before the stats query (counted), and applied after
+    # they are cached: the write is not counted twice
+    started_at = time.monotonic()
+    ToDoFactory.create(user=user)
+    assert ToDo.get_stats(db_session, user.id).total == 2
+    _update_stats(user.id, {(False, None): 1}, started_at)
+    assert ToDo.get_stats(db_session, user.id).total == 2
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 
 import pytest
@@ -5,8 +6,10 @@ from fastapi import status
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app.models import User
-from app.tests.factories import UserFactory
+from app.core.security import create_access_token, get_password_hash
+from app.database.purge import user_purger
+from app.models import ToDo, User
+from app.tests.factories import ToDoFactory, UserFactory
 
 
 @pytest.mark.parametrize("cases", ["unauthenticated", "not_superuser", "superuser"])
@@ -162,11 +165,52 @@ def test_get_users(
         assert "id" in u
         assert u.get("is_active")
         assert "is_verified" in u
+        # same output as the response model
+        assert u == client.get(f"/api/users/{u['id']}", headers=headers).json()
 
     # current user must be present in the returned users list
     assert user.email in [u["email"] for u in users]
 
 
+def test_get_users_cursor(
+    client: TestClient, auth_headers_superuser: tuple[dict[str, str], User]
+):
+    UserFactory.create_batch(4)
+    headers, user = auth_headers_superuser
+
+    user_ids = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/api/users", headers=headers, params=params)
+        assert response.status_code == status.HTTP_200_OK
+        user_ids += [u["id"] for u in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert len(user_ids) == 5
+    assert user_ids == sorted(user_ids)
+
+
+def test_get_users_fields(
+    client: TestClient, auth_headers_superuser: tuple[dict[str, str], User]
+):
+    UserFactory.create_batch(2)
+    headers, user = auth_headers_superuser
+
+    response = client.get("/api/users?fields=email,id&limit=2", headers=headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [list(u) for u in response.json()] == [["email", "id"]] * 2
+    assert "X-Next-Cursor" in response.headers
+
+    response = client.get("/api/users/me?fields=email", headers=headers)
+    assert response.json() == {"email": user.email}
+
+    response = client.get("/api/users/me?fields=password", headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 def test_update_user_me(
     client: TestClient, db_session: Session, auth_headers: tuple[dict[str, str], User]
 ):
@@ -242,3 +286,71 @@ def test_delete_user_by_id(
 
         db_user = User.get_by_id(db_session, id=user_id)
         assert not db_user
+
+
+def test_delete_user_purges_todos(
+    client: TestClient,
+    db_session: Session,
+    auth_headers: tuple[dict[str, str], User],
+    mocker,
+):
+    headers, user = auth_headers
+    user_id = user.id
+    ToDoFactory.create_batch(5, user=user)
+    other_todo = ToDoFactory.create()
+    # several batches for the todos of the user
+    mocker.patch.object(user_purger, "batch_size", 2)
+    todos_purged = user_purger.todos_purged
+
+    response = client.delete("/api/users/me", headers=headers)
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    # the background task runs before the test client returns
+    assert db_session.query(User).filter(User.id == user_id).count() == 0
+    assert db_session.query(ToDo).filter(ToDo.user_id == user_id).count() == 0
+    assert ToDo.get_by_id(db_session, other_todo.id)
+    assert user_purger.todos_purged == todos_purged + 5
+
+
+def test_delete_user_before_purge(
+    client: TestClient,
+    db_session: Session,
+    auth_headers_superuser: tuple[dict[str, str], User],
+    mocker,
+):
+    headers, _ = auth_headers_superuser
+    user = UserFactory.create(
+        email="deleted@example.com", hashed_password=get_password_hash("123456")
+    )
+    user_id = user.id
+    ToDoFactory.create_batch(3, user=user)
+    user_headers = {"Authorization": f"Bearer {create_access_token(subject=user_id)}"}
+    # as if the process crashed before purging the user
+    mocker.patch.object(user_purger, "purge_user", mocker.AsyncMock())
+
+    response = client.delete(f"/api/users/{user_id}", headers=headers)
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.get(f"/api/users/{user_id}", headers=headers).status_code == 404
+    response = client.get("/api/users", headers=headers)
+    assert user_id not in [user["id"] for user in response.json()]
+    response = client.get("/api/users/me", headers=user_headers)
+    assert response.status_code in (
+        status.HTTP_401_UNAUTHORIZED,
+        status.HTTP_404_NOT_FOUND,
+    )
+    response = client.post(
+        "/api/token",
+        data={"username": "deleted@example.com", "password": "123456"},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert User.get_deleted_ids(db_session) == [user_id]
+    # the email can be used again
+    assert UserFactory.create(email="deleted@example.com")
+
+    # the next run of the purger resumes the purge
+    mocker.stopall()
+    assert asyncio.run(user_purger.purge_pending(db_session)) == 1
+    assert User.get_deleted_ids(db_session) == []
+    assert db_session.query(User).filter(User.id == user_id).count() == 0
+    assert db_session.query(ToDo).filter(ToDo.user_id == user_id).count() == 0
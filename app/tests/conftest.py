@@ -5,10 +5,14 @@ from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
 from app.api.dependencies import get_db
+from app.core.rate_limit import rate_limiter
 from app.core.security import create_access_token
 from app.database.db import Base, create_engine_and_session
 from app.main import app
 from app.models import User
+from app.models.revoked_token import revocation_filter
+from app.models.todo import todo_stats_cache
+from app.models.user import principal_cache
 from app.tests.factories import UserFactory, factory_list
 
 test_engine, TestSessionLocal = create_engine_and_session(
@@ -61,6 +65,11 @@ def db_session(db_connection) -> Session:
 
     session.close()
     transaction.rollback()
+    # cached users might not exist anymore after the rollback
+    principal_cache.clear()
+    todo_stats_cache.clear()
+    rate_limiter.clear()
+    revocation_filter.reset()
 
 
 @pytest.fixture(scope="function")
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException, status
+from fastapi.testclient import TestClient
+from jose import jwk, jwt
+from sqlalchemy.orm import Session
+
+from app.core.google_auth import GoogleTokenValidator, _parse_max_age
+from app.models import User
+from app.tests.factories import UserFactory
+
+USERINFO = {"sub": "1234", "email": "user@example.com", "email_verified": True}
+
+
+class GoogleStubHandler(BaseHTTPRequestHandler):
+    """
+    Stub of the Google userinfo endpoint, only accepting the "valid" token.
+    """
+
+    def do_GET(self):
+        self.server.requests += 1
+        # slow enough for concurrent validations to overlap
+        time.sleep(0.05)
+        if self.headers.get("Authorization") != "Bearer valid":
+            self.send_response(401)
+            self.end_headers()
+            return
+
+        body = json.dumps(USERINFO).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture()
+def google_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GoogleStubHandler)
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture()
+def validator(google_stub_server) -> GoogleTokenValidator:
+    host, port = google_stub_server.server_address
+    return GoogleTokenValidator(
+        userinfo_url=f"http://{host}:{port}/userinfo",
+        timeout=5,
+        max_connections=10,
+        cache_max_size=100,
+        cache_ttl=60,
+    )
+
+
+def test_validate_google_token(google_stub_server, validator: GoogleTokenValidator):
+    async def validate_twice():
+        first = await validator.validate("valid")
+        second = await validator.validate("valid")
+        await validator.close()
+        return first, second
+
+    first, second = asyncio.run(validate_twice())
+
+    assert first == second == USERINFO
+    # the second validation comes from the cache
+    assert google_stub_server.requests == 1
+
+
+def test_validate_google_token_coalesced(
+    google_stub_server, validator: GoogleTokenValidator
+):
+    async def validate_concurrently():
+        results = await asyncio.gather(*[validator.validate("valid") for _ in range(5)])
+        await validator.close()
+        return results
+
+    results = asyncio.run(validate_concurrently())
+
+    assert all(result["email"] == "user@example.com" for result in results)
+    assert google_stub_server.requests == 1
+
+
+def test_validate_google_token_invalid(
+    google_stub_server, validator: GoogleTokenValidator
+):
+    async def validate_invalid():
+        try:
+            await validator.validate("invalid")
+        finally:
+            await validator.close()
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(validate_invalid())
+
+    assert exc_info.value.status_code == status.HTTP_400_BAD_REQUEST
+    assert len(validator.cache) == 0
+
+
+def test_validate_google_token_unavailable():
+    validator = GoogleTokenValidator(
+        userinfo_url="http://127.0.0.1:1/userinfo",
+        timeout=1,
+        max_connections=1,
+        cache_max_size=100,
+        cache_ttl=60,
+    )
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(validator.validate("valid"))
+
+    assert exc_info.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def test_register_google_stub_server(
+    client: TestClient,
+    db_session: Session,
+    mocker,
+    validator: GoogleTokenValidator,
+):
+    mocker.patch("app.api.endpoints.login_google.google_token_validator", validator)
+
+    response = client.post("/api/register_google", json={"access_token": "valid"})
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert User.get_by_email(db_session, email="user@example.com")
+
+
+@pytest.fixture()
+def google_keys(tmp_path) -> tuple[str, GoogleTokenValidator]:
+    """
+    Private key to sign ID tokens, and a validator using the local JWKS file
+    with the matching public key.
+    """
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_jwk = jwk.construct(private_pem, "RS256").public_key().to_dict()
+    public_jwk["kid"] = "google-key"
+    jwks_file = tmp_path / "jwks.json"
+    jwks_file.write_text(json.dumps({"keys": [public_jwk]}))
+
+    validator = GoogleTokenValidator(
+        userinfo_url="http://127.0.0.1:1/userinfo",
+        timeout=1,
+        max_connections=1,
+        cache_max_size=100,
+        cache_ttl=60,
+        client_id="client-id",
+        jwks_url=jwks_file.as_uri(),
+    )
+    return private_pem, validator
+
+
+def create_id_token(private_pem: str, kid: str = "google-key", **claims) -> str:
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": "client-id",
+        "sub": "1234",
+        "email": "user@example.com",
+        "email_verified": True,
+        "exp": int(time.time()) + 3600,
+        "at_hash": "some_hash",
+    }
+    payload.update(claims)
+    return jwt.encode(payload, private_pem, algorithm="RS256", headers={"kid": kid})
+
+
+def test_verify_google_id_token(google_keys):
+    private_pem, validator = google_keys
+
+    claims = asyncio.run(validator.validate(create_id_token(private_pem)))
+
+    assert claims["sub"] == "1234"
+    assert claims["email"] == "user@example.com"
+
+
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"aud": "other-client-id"},
+        {"iss": "https://example.com"},
+        {"exp": 0},
+        {"email_verified": False},
+        {"kid": "unknown-key"},
+    ],
+    ids=["audience", "issuer", "expired", "email_not_verified", "unknown_key"],
+)
+def test_verify_google_id_token_invalid(google_keys, claims):
+    private_pem, validator = google_keys
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(validator.validate(create_id_token(private_pem, **claims)))
+
+    assert exc_info.value.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_google_id_token_cache_expiration(google_keys, mocker):
+    private_pem, validator = google_keys
+    # expires before the TTL of the cache (60 seconds)
+    id_token = create_id_token(private_pem, exp=int(time.time()) + 5)
+    key = hashlib.sha256(id_token.encode()).digest()
+
+    asyncio.run(validator.validate(id_token))
+    assert validator.cache.get(key) is not None
+
+    mocker.patch("app.core.cache.time.monotonic", return_value=time.monotonic() + 10)
+    assert validator.cache.get(key) is None
+
+
+def test_parse_max_age():
+    headers = httpx.Headers({"Cache-Control": "public, max-age=20000", "Age": "500"})
+
+    assert _parse_max_age(headers) == 19500
+    assert _parse_max_age(httpx.Headers({"Cache-Control": "no-cache"})) is None
+
+
+def test_login_google_id_token(
+    client: TestClient,
+    db_session: Session,
+    mocker,
+    google_keys,
+):
+    private_pem, validator = google_keys
+    mocker.patch("app.api.endpoints.login_google.google_token_validator", validator)
+    UserFactory.create(email="user@example.com")
+
+    id_token = create_id_token(private_pem)
+    response = client.post("/api/token_google", json={"access_token": id_token})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert "access_token" in response.json()
@@ -0,0 +1,114 @@
+import json
+import os
+import pathlib
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException, status
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from app.core.config import Settings, get_settings
+from app.core.keys import load_key_ring
+from app.core.security import create_access_token, decode_token
+from app.main import app
+
+
+def generate_pem_keys() -> tuple[str, str]:
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return private_pem.decode(), public_pem.decode()
+
+
+def write_key_ring(path, active_kid: str, keys: list[dict[str, str]]):
+    path.write_text(json.dumps({"active_kid": active_kid, "keys": keys}))
+    # make sure the modification time changes between writes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+@pytest.fixture()
+def key_ring_settings(tmp_path, mocker) -> Settings:
+    private_pem, _ = generate_pem_keys()
+    keys_file = tmp_path / "keys.json"
+    write_key_ring(
+        keys_file,
+        "key-1",
+        [{"kid": "key-1", "alg": "ES256", "private_key": private_pem}],
+    )
+
+    settings = Settings(JWT_KEYS_FILE=str(keys_file), JWT_KEYS_RELOAD_SECONDS=0)
+    mocker.patch("app.core.security.settings", settings)
+    return settings
+
+
+def test_key_ring_tokens(key_ring_settings: Settings):
+    token = create_access_token(subject=1)
+
+    assert jwt.get_unverified_header(token) == {
+        "alg": "ES256",
+        "kid": "key-1",
+        "typ": "JWT",
+    }
+    assert decode_token(token, key_ring_settings).sub == "1"
+
+
+def test_key_ring_rotation(key_ring_settings: Settings):
+    keys_file = pathlib.Path(key_ring_settings.JWT_KEYS_FILE)
+    old_token = create_access_token(subject=1)
+    old_key = json.loads(keys_file.read_text())["keys"][0]
+
+    # the old key is kept to verify the tokens it already signed
+    private_pem, _ = generate_pem_keys()
+    new_key = {"kid": "key-2", "alg": "ES256", "private_key": private_pem}
+    write_key_ring(keys_file, "key-2", [old_key, new_key])
+    new_token = create_access_token(subject=2)
+
+    assert jwt.get_unverified_header(new_token)["kid"] == "key-2"
+    assert decode_token(old_token, key_ring_settings).sub == "1"
+    assert decode_token(new_token, key_ring_settings).sub == "2"
+
+    # once the old key is removed, its tokens are no longer valid
+    write_key_ring(keys_file, "key-2", [new_key])
+    with pytest.raises(HTTPException) as exc_info:
+        decode_token(old_token, key_ring_settings)
+
+    assert exc_info.value.detail == "Could not validate credentials"
+
+
+def test_key_ring_public_key_only(tmp_path):
+    _, public_pem = generate_pem_keys()
+    keys_file = tmp_path / "keys.json"
+    write_key_ring(
+        keys_file, "key-1", [{"kid": "key-1", "alg": "ES256", "public_key": public_pem}]
+    )
+
+    # the active key must be able to sign tokens
+    with pytest.raises(ValueError):
+        load_key_ring(str(keys_file))
+
+
+def test_get_jwks(client: TestClient, key_ring_settings: Settings):
+    app.dependency_overrides[get_settings] = lambda: key_ring_settings
+    response = client.get("/api/.well-known/jwks.json")
+    del app.dependency_overrides[get_settings]
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Cache-Control"] == "public, max-age=0"
+    (public_key,) = response.json()["keys"]
+    assert public_key["kid"] == "key-1"
+    assert public_key["kty"] == "EC"
+    assert "d" not in public_key
+
+    # the public key verifies the tokens without the key ring
+    token = create_access_token(subject=1)
+    assert jwt.decode(token, public_key, algorithms=["ES256"])["sub"] == "1"
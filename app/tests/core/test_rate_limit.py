@@ -0,0 +1,73 @@
+import pytest
+
+from app.core.rate_limit import (MemoryRateLimiter, RateLimiter,
+                                 SQLiteRateLimiter, sliding_window,
+                                 token_bucket)
+
+
+def test_sliding_window():
+    hit = sliding_window(limit=2, window=60)
+
+    state, retry_after = hit(None, 120.0)
+    assert retry_after == 0
+    state, retry_after = hit(state, 130.0)
+    assert retry_after == 0
+    state, retry_after = hit(state, 150.0)
+    # the current window is full until it ends
+    assert retry_after == 30
+
+    # two thirds of the previous window still count in the sliding window
+    state, retry_after = hit(state, 200.0)
+    assert retry_after == 10
+    state, retry_after = hit(state, 210.0)
+    assert retry_after == 0
+
+
+def test_token_bucket():
+    hit = token_bucket(capacity=2, refill_rate=0.5)
+
+    state, retry_after = hit(None, 0.0)
+    state, retry_after = hit(state, 0.0)
+    assert retry_after == 0
+    state, retry_after = hit(state, 1.0)
+    assert retry_after == 1
+    state, retry_after = hit(state, 2.0)
+    assert retry_after == 0
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_rate_limiter_backends(tmp_path, backend):
+    if backend == "memory":
+        limiter = MemoryRateLimiter()
+    else:
+        limiter = SQLiteRateLimiter(str(tmp_path / "rate_limits.db"))
+
+    assert limiter.hit_sliding_window("key", limit=1, window=60) == 0
+    assert limiter.hit_sliding_window("key", limit=1, window=60) > 0
+    assert limiter.hit_sliding_window("other_key", limit=1, window=60) == 0
+    assert limiter.hit_token_bucket("bucket", capacity=1, refill_rate=1) == 0
+    assert limiter.hit_token_bucket("bucket", capacity=1, refill_rate=1) > 0
+
+    limiter.clear()
+    assert limiter.hit_sliding_window("key", limit=1, window=60) == 0
+
+
+def test_sqlite_rate_limiter_shared(tmp_path):
+    # two limiters using the same file act like two worker processes
+    path = str(tmp_path / "rate_limits.db")
+    worker_1 = SQLiteRateLimiter(path)
+    worker_2 = SQLiteRateLimiter(path)
+
+    assert worker_1.hit_sliding_window("key", limit=2, window=60) == 0
+    assert worker_2.hit_sliding_window("key", limit=2, window=60) == 0
+    assert worker_1.hit_sliding_window("key", limit=2, window=60) > 0
+
+
+def test_rate_limiter_backend_methods():
+    class IncompleteRateLimiter(RateLimiter):
+        def _apply(self, key, hit, ttl):
+            return 0
+
+    # a backend without clear fails when created, not on the first request
+    with pytest.raises(TypeError):
+        IncompleteRateLimiter()
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.core.bloom import BloomFilter
+from app.models import RevokedToken
+from app.models.revoked_token import RevocationFilter, revocation_filter
+from app.schemas import TokenPayload
+
+
+def test_bloom_filter():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"key-{i}" for i in range(1000)]
+    for key in keys:
+        bloom_filter.add(key)
+
+    assert all(key in bloom_filter for key in keys)
+    # the keys already in the filter are not counted again
+    count = bloom_filter.count
+    bloom_filter.add(keys[0])
+    assert bloom_filter.count == count
+    false_positives = sum(f"other-{i}" in bloom_filter for i in range(10000))
+    assert false_positives < 300
+
+
+def test_revocation_filter_refresh(db_session: Session):
+    token_data = TokenPayload(sub="1", jti="some_token_id", iat=0, exp=2**32)
+    # another worker, whose filter doesn't know about the revocations yet
+    other_filter = RevocationFilter(
+        capacity=100, error_rate=0.01, refresh_seconds=0, overlap_seconds=60
+    )
+    other_filter.refresh(db_session)
+    assert "some_token_id" not in other_filter
+
+    RevokedToken.revoke_token(db_session, token_data)
+    other_filter.refresh(db_session)
+
+    assert "some_token_id" in other_filter
+    assert "user:1" not in other_filter
+
+
+def test_is_revoked(db_session: Session):
+    token_data = TokenPayload(sub="1", jti="some_token_id", iat=100)
+
+    assert not RevokedToken.is_revoked(db_session, token_data)
+
+    RevokedToken.revoke_user(db_session, user_id=1)
+    assert RevokedToken.is_revoked(db_session, token_data)
+    # a user key in the filter is not enough, tokens issued later are still valid
+    assert "user:1" in revocation_filter
+    newer_token_data = TokenPayload(sub="1", jti="newer_token_id", iat=2**40)
+    assert not RevokedToken.is_revoked(db_session, newer_token_data)
+
+
+def test_revocation_filter_refresh_late_commit(db_session: Session):
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    db_session.add_all(
+        [
+            RevokedToken(id=1, key="first", expires_at=expires_at),
+            RevokedToken(id=1000, key="last", expires_at=expires_at),
+        ]
+    )
+    db_session.commit()
+    other_filter = RevocationFilter(
+        capacity=100, error_rate=0.01, refresh_seconds=0, overlap_seconds=60
+    )
+    other_filter.refresh(db_session)
+    assert "late" not in other_filter
+
+    # a concurrent transaction, started before the refresh and committed after
+    # it, with a much lower ID
+    db_session.add(
+        RevokedToken(
+            id=2,
+            key="late",
+            expires_at=expires_at,
+            time_revoked=datetime.utcnow() - timedelta(seconds=30),
+        )
+    )
+    db_session.commit()
+    other_filter.refresh(db_session)
+
+    assert "late" in other_filter
+    assert "last" in other_filter
+
+
+def test_revocation_filter_refresh_without_changes(db_session: Session, mocker):
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    db_session.add_all(
+        [RevokedToken(key=f"key-{i}", expires_at=expires_at) for i in range(10)]
+    )
+    db_session.commit()
+    other_filter = RevocationFilter(
+        capacity=100, error_rate=0.01, refresh_seconds=0, overlap_seconds=60
+    )
+    rebuild = mocker.spy(other_filter, "_rebuild")
+
+    # the revocations in the overlap are loaded again, but not counted again
+    for _ in range(100):
+        other_filter.refresh(db_session)
+
+    rebuild.assert_called_once()
+    assert other_filter._filter.count == 10
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.cache import TTLCache
+from app.core.config import Settings, get_settings
+from app.core.security import (PasswordHashingExecutor, create_access_token,
+                               create_password_context, decode_token_cached,
+                               get_password_hash, token_cache, verify_password)
+from app.models import User
+from app.tests.factories import UserFactory
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # "a" becomes the most recently used entry
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1}
+
+
+def test_ttl_cache_expiration(mocker):
+    cache = TTLCache(max_size=10, ttl=60)
+    monotonic = mocker.patch("app.core.cache.time.monotonic", return_value=100.0)
+    cache.set("a", 1)
+    # entries can expire before the cache TTL, but never after it
+    cache.set("b", 2, ttl=10)
+    cache.set("c", 3, ttl=600)
+
+    monotonic.return_value = 120.0
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    monotonic.return_value = 161.0
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+def test_decode_token_cached():
+    token_cache.clear()
+    settings = get_settings()
+    token = create_access_token(subject=1)
+
+    assert decode_token_cached(token, settings).sub == "1"
+    assert decode_token_cached(token, settings).sub == "1"
+    assert token_cache.hits == 1
+    assert token_cache.misses == 1
+
+
+def test_decode_token_cached_disabled():
+    token_cache.clear()
+    settings = Settings(TOKEN_CACHE_ENABLED=False, SECRET_KEY=get_settings().SECRET_KEY)
+    token = create_access_token(subject=1)
+
+    assert decode_token_cached(token, settings).sub == "1"
+    assert len(token_cache) == 0
+
+
+def test_decode_token_cached_expired():
+    token_cache.clear()
+    token = create_access_token(subject=1, expires_delta=timedelta(seconds=-1))
+
+    with pytest.raises(HTTPException) as exc_info:
+        decode_token_cached(token, get_settings())
+
+    assert exc_info.value.detail == "Token expired"
+    assert len(token_cache) == 0
+
+
+def test_password_hashing_executor():
+    executor = PasswordHashingExecutor(max_workers=1, max_queue=1)
+
+    async def hash_and_verify():
+        hashed = await executor.run(get_password_hash, "secret")
+        return await executor.run(verify_password, "secret", hashed)
+
+    assert asyncio.run(hash_and_verify())
+    assert executor.stats()["submitted"] == 2
+    assert executor.stats()["completed"] == 2
+    assert executor.stats()["in_flight"] == 0
+    executor.shutdown()
+
+
+def test_password_hashing_executor_full_queue():
+    executor = PasswordHashingExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def run_concurrently():
+        # one call running and one waiting in the queue, the third is rejected
+        tasks = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert executor.queued == 1
+
+        with pytest.raises(HTTPException) as exc_info:
+            await executor.run(release.wait)
+
+        release.set()
+        await asyncio.gather(*tasks)
+        return exc_info.value
+
+    exc = asyncio.run(run_concurrently())
+
+    assert exc.status_code == 503
+    assert exc.headers == {"Retry-After": "1"}
+    assert executor.stats()["rejected"] == 1
+    assert executor.stats()["completed"] == 2
+    executor.shutdown()
+
+
+def create_test_password_context(**costs):
+    return create_password_context(Settings(PASSWORD_HASH_LOW_COST=False, **costs))
+
+
+@pytest.mark.parametrize(
+    "schemes", [["bcrypt"], ["argon2", "bcrypt"]], ids=["bcrypt", "argon2"]
+)
+def test_password_context_upgrades_hashes(schemes):
+    old_context = create_test_password_context(
+        PASSWORD_HASH_SCHEMES=["bcrypt"], BCRYPT_ROUNDS=4
+    )
+    new_context = create_test_password_context(
+        PASSWORD_HASH_SCHEMES=schemes,
+        BCRYPT_ROUNDS=5,
+        ARGON2_MEMORY_COST=32,
+        ARGON2_PARALLELISM=1,
+    )
+    old_hash = old_context.hash("secret")
+
+    verified, new_hash = new_context.verify_and_update("secret", old_hash)
+
+    assert verified
+    assert new_hash.startswith("$argon2id$" if schemes[0] == "argon2" else "$2b$05$")
+    assert new_context.verify_and_update("secret", new_hash) == (True, None)
+
+
+def test_authenticate_rehashes_password(db_session, mocker):
+    old_context = create_test_password_context(
+        PASSWORD_HASH_SCHEMES=["bcrypt"], BCRYPT_ROUNDS=4
+    )
+    user = UserFactory.create(hashed_password=old_context.hash("secret"))
+    new_context = create_test_password_context(
+        PASSWORD_HASH_SCHEMES=["argon2", "bcrypt"],
+        ARGON2_MEMORY_COST=32,
+        ARGON2_PARALLELISM=1,
+    )
+    mocker.patch("app.core.security.pwd_context", new_context)
+
+    assert not User.authenticate(db_session, user.email, "wrong_password")
+    assert user.hashed_password.startswith("$2b$")
+
+    assert User.authenticate(db_session, user.email, "secret")
+    db_session.refresh(user)
+    assert user.hashed_password.startswith("$argon2id$")
+    assert User.authenticate(db_session, user.email, "secret")
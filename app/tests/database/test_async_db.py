@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import NullPool
+
+from app.api.dependencies import get_db
+from app.core.rate_limit import rate_limiter
+from app.database.db import (Base, create_async_engine_and_session,
+                             create_engine_and_session)
+from app.main import app
+from app.models import ToDo, User
+from app.models.revoked_token import revocation_filter
+from app.models.todo import todo_stats_cache
+from app.models.user import principal_cache
+from app.schemas import ToDoCreate, UserCreate
+
+
+@pytest.fixture()
+def async_session_factory(tmp_path):
+    """
+    Fixture to get async sessions of a separate SQLite DB (using aiosqlite).
+    """
+    db_path = tmp_path / "async_test.db"
+    engine, _ = create_engine_and_session(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    async_engine, AsyncSessionLocal = create_async_engine_and_session(
+        f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool
+    )
+    yield AsyncSessionLocal
+
+    principal_cache.clear()
+    todo_stats_cache.clear()
+    rate_limiter.clear()
+    revocation_filter.reset()
+
+
+@pytest.fixture()
+def async_client(async_session_factory) -> TestClient:
+    async def override_get_db():
+        async with async_session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    with TestClient(app) as c:
+        yield c
+
+    del app.dependency_overrides[get_db]
+
+
+def test_async_models(async_session_factory):
+    async def run():
+        async with async_session_factory() as db:
+            user_in = UserCreate(email="user@example.com", password="password")
+            user = await User.create_async(db, user_in)
+            await ToDo.create_async(db, ToDoCreate(title="ToDo"), user.id)
+
+            assert await User.get_by_email_async(db, "user@example.com") == user
+            assert await User.authenticate_async(db, user.email, "password") == user
+            todos = await ToDo.get_multiple_async(db, user_id=user.id)
+            assert [todo.title for todo in todos] == ["ToDo"]
+
+            await User.delete_async(db, user)
+            assert await User.get_by_id_async(db, user.id) is None
+            assert await ToDo.get_multiple_async(db, user_id=user.id) == []
+
+    asyncio.run(run())
+
+
+def test_async_endpoints(async_client: TestClient):
+    user_data = {"email": "user@example.com", "password": "password"}
+    response = async_client.post("/api/register", json=user_data)
+    assert response.status_code == status.HTTP_201_CREATED
+
+    form_data = {"username": user_data["email"], "password": user_data["password"]}
+    response = async_client.post("/api/token", data=form_data)
+    assert response.status_code == status.HTTP_201_CREATED
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = async_client.get("/api/users/me", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["email"] == user_data["email"]
+
+    response = async_client.post("/api/todos", headers=headers, json={"title": "ToDo"})
+    assert response.status_code == status.HTTP_201_CREATED
+    todo_id = response.json()["id"]
+
+    response = async_client.put(f"/api/todos/{todo_id}/resolve", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["done"]
+
+    response = async_client.get("/api/todos", headers=headers)
+    assert [todo["id"] for todo in response.json()] == [todo_id]
+
+    # streamed with an async session
+    response = async_client.get("/api/todos/export", headers=headers)
+    assert [json.loads(line)["id"] for line in response.iter_lines()] == [todo_id]
+
+    response = async_client.post("/api/logout", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = async_client.get("/api/users/me", headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,90 @@
+from sqlalchemy.dialects import postgresql
+
+from app.models import ToDo, User
+from app.models.base_crud_model import (_returning_objects, get_column_names,
+                                        get_projection, supports_returning)
+from app.models.todo import _copy_value
+from app.schemas import ToDoCreate, ToDoOut, ToDoUpdate
+from app.tests.factories.user_factory import UserFactory
+
+
+def test_get_column_names():
+    assert get_column_names(ToDo) == {
+        "id",
+        "title",
+        "description",
+        "done",
+        "time_created",
+        "time_done",
+        "user_id",
+    }
+
+
+def test_returning_statements_compile():
+    # SQLite does not support RETURNING, check the statements for PostgreSQL
+    statement = ToDo.__table__.insert().values(title="ToDo", user_id=1).returning(ToDo)
+    compiled = str(
+        _returning_objects(ToDo, statement).compile(dialect=postgresql.dialect())
+    )
+    assert compiled.startswith("INSERT INTO todos")
+    assert "RETURNING todos.id" in compiled
+
+
+def test_crud_fallback(db_session):
+    assert not supports_returning(db_session)
+
+    user = UserFactory.create()
+    todo = ToDo.create(db_session, ToDoCreate(title="ToDo"), user.id)
+    assert todo.id is not None
+    assert todo.time_created is not None
+
+    todo = ToDo.update(db_session, todo, ToDoUpdate(done=True))
+    assert todo.done
+
+    # fields that are not columns are ignored
+    todo = ToDo.update(db_session, todo, {"title": "New", "unknown": 1})
+    assert todo.title == "New"
+
+    assert ToDo.delete_by_id(db_session, todo.id).id == todo.id
+    assert ToDo.get_by_id(db_session, todo.id) is None
+    assert User.get_by_id(db_session, user.id) is not None
+
+
+def test_copy_value():
+    assert _copy_value(None) == "\\N"
+    assert _copy_value(False) == "False"
+    assert _copy_value("a\\N\tb\nc\r") == "a\\\\N\\tb\\nc\\r"
+
+
+def test_get_multiple_rows(db_session):
+    user = UserFactory.create()
+    todos = [
+        ToDo.create(db_session, ToDoCreate(title=f"ToDo {i}"), user.id)
+        for i in range(3)
+    ]
+    db_session.expunge_all()
+
+    fields = list(ToDoOut.__fields__)
+    rows = ToDo.get_multiple_rows(db_session, fields, user.id, limit=2)
+
+    assert [tuple(row._mapping) for row in rows] == [tuple(fields)] * 2
+    assert [row.id for row in rows] == [todo.id for todo in todos[:2]]
+    # nothing is loaded into the session
+    assert not db_session.identity_map
+    rows = User.get_multiple_rows(db_session, ["id", "email"])
+    assert [tuple(row) for row in rows] == [(user.id, user.email)]
+
+
+def test_get_multiple_rows_projection(db_session):
+    user = UserFactory.create()
+    ToDo.create(db_session, ToDoCreate(title="ToDo"), user.id)
+    get_projection.cache_clear()
+
+    for _ in range(2):
+        rows = ToDo.get_multiple_rows(db_session, ["id", "title"], user.id)
+        # the sort key is selected for the cursor, after the fields
+        assert list(rows[0]._mapping) == ["id", "title", "time_created"]
+
+    # the projection is computed once per combination of fields
+    assert get_projection.cache_info().misses == 1
+    assert get_projection.cache_info().hits == 1
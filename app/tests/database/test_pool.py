@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+from app.database.pool import (MeteredQueuePool, attach_pool_metrics,
+                               get_pool_stats)
+
+
+@pytest.fixture()
+def metered_engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool_test.db'}",
+        poolclass=MeteredQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    attach_pool_metrics(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_pool_metrics(metered_engine):
+    connection = metered_engine.connect()
+    stats = get_pool_stats(metered_engine.pool)
+    assert stats["checkouts"] == 1
+    assert stats["in_use"] == stats["checked_out"] == 1
+    assert stats["connections_created"] == 1
+
+    # the only connection of the pool is in use
+    with pytest.raises(exc.TimeoutError):
+        metered_engine.connect()
+    assert get_pool_stats(metered_engine.pool)["checkout_timeouts"] == 1
+
+    connection.invalidate()
+    connection.close()
+    stats = get_pool_stats(metered_engine.pool)
+    assert stats["in_use"] == stats["checked_out"] == 0
+    assert stats["invalidations"] == 1
+
+
+def test_pool_metrics_after_dispose(metered_engine):
+    metered_engine.connect().close()
+    metered_engine.dispose()
+    metered_engine.connect().close()
+
+    stats = get_pool_stats(metered_engine.pool)
+    assert stats["checkouts"] == 2
+    assert stats["connections_created"] == 2
+    assert stats["checkout_wait_seconds"] >= stats["checkout_wait_max_seconds"] > 0
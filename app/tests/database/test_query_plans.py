@@ -0,0 +1,226 @@
+import asyncio
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import schemas
+from app.database.db import Base
+from app.models import RevokedToken, ToDo, User, UserIdentity
+from app.schemas import ToDoCreate, TokenPayload, UserCreate
+
+
+def collect_batches(batches) -> list:
+    async def collect():
+        return [batch async for batch in batches]
+
+    return asyncio.run(collect())
+
+
+# columns selected by the listings by default (all the fields of the response)
+TODO_FIELDS = tuple(schemas.ToDoOut.__fields__)
+USER_FIELDS = tuple(schemas.User.__fields__)
+
+# PostgreSQL DB to also check the query plans there (skipped if not set)
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_DATABASE_URL")
+
+# hot queries of the models, none of them should scan a whole table
+HOT_QUERIES = {
+    "user_get_by_id": lambda db, data: User.get_by_id(db, data["user"].id),
+    "user_get_by_email": lambda db, data: User.get_by_email(db, data["user"].email),
+    "user_get_by_identity": lambda db, data: User.get_by_identity(
+        db, "google", data["subject"]
+    ),
+    "user_get_multiple_cursor": lambda db, data: User.get_multiple(
+        db, limit=10, after_id=data["user"].id
+    ),
+    "user_get_multiple_rows_cursor": lambda db, data: User.get_multiple_rows(
+        db, USER_FIELDS, limit=10, after_id=data["user"].id
+    ),
+    "user_get_multiple_rows_async": lambda db, data: asyncio.run(
+        User.get_multiple_rows_async(
+            db, USER_FIELDS, limit=10, after_id=data["user"].id
+        )
+    ),
+    "user_identity_get": lambda db, data: UserIdentity.get(
+        db, "google", data["subject"]
+    ),
+    "todo_get_by_id": lambda db, data: ToDo.get_by_id(db, data["todo"].id),
+    "todo_get_multiple": lambda db, data: ToDo.get_multiple(db, data["user"].id),
+    "todo_get_multiple_done": lambda db, data: ToDo.get_multiple(
+        db, data["user"].id, done=True
+    ),
+    "todo_get_multiple_pending": lambda db, data: ToDo.get_multiple(
+        db, data["user"].id, done=False
+    ),
+    "todo_get_multiple_datetimes": lambda db, data: ToDo.get_multiple(
+        db,
+        data["user"].id,
+        start_datetime=datetime.utcnow() - timedelta(days=1),
+        end_datetime=datetime.utcnow() + timedelta(days=1),
+    ),
+    "todo_get_multiple_cursor": lambda db, data: ToDo.get_multiple(
+        db, data["user"].id, after=(data["todo"].time_created, data["todo"].id)
+    ),
+    "todo_stream": lambda db, data: collect_batches(
+        ToDo.stream_async(db, data["user"].id)
+    ),
+    "todo_stream_done": lambda db, data: collect_batches(
+        ToDo.stream_async(db, data["user"].id, done=True)
+    ),
+    "todo_get_stats": lambda db, data: ToDo.get_stats(db, data["user"].id),
+    "todo_get_multiple_rows": lambda db, data: ToDo.get_multiple_rows(
+        db, TODO_FIELDS, data["user"].id
+    ),
+    "todo_get_multiple_rows_fields": lambda db, data: ToDo.get_multiple_rows(
+        db, ("title", "done"), data["user"].id
+    ),
+    "todo_get_multiple_rows_pending": lambda db, data: ToDo.get_multiple_rows(
+        db, TODO_FIELDS, data["user"].id, done=False
+    ),
+    "todo_get_multiple_rows_cursor": lambda db, data: ToDo.get_multiple_rows(
+        db,
+        TODO_FIELDS,
+        data["user"].id,
+        after=(data["todo"].time_created, data["todo"].id),
+    ),
+    "todo_get_multiple_rows_async": lambda db, data: asyncio.run(
+        ToDo.get_multiple_rows_async(db, TODO_FIELDS, data["user"].id)
+    ),
+    "todo_get_owners": lambda db, data: ToDo.get_owners(db, [data["todo"].id]),
+    "todo_get_multiple_by_id": lambda db, data: ToDo.get_multiple_by_id(
+        db, [data["todo"].id], data["user"].id
+    ),
+    "todo_update_all": lambda db, data: ToDo.update_all(
+        db, [data["todo"].id], {"done": True}, data["user"].id
+    ),
+    "todo_delete_multiple": lambda db, data: ToDo.delete_multiple(
+        db, [data["todo"].id], data["user"].id
+    ),
+    "todo_delete_by_owner": lambda db, data: ToDo.delete_by_owner(
+        db, data["user"].id, 100
+    ),
+    "revoked_token_is_revoked": lambda db, data: RevokedToken.is_revoked_in_db(
+        db, TokenPayload(sub=str(data["user"].id), jti="jti", iat=0)
+    ),
+    "revoked_token_get_since": lambda db, data: RevokedToken.get_since(
+        db, datetime.now(timezone.utc)
+    ),
+}
+
+
+@pytest.fixture(scope="module")
+def postgres_connection():
+    if not POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_DATABASE_URL not set")
+
+    # tables in a temporary schema. Small tables are cheaper to scan, so
+    # disable the sequential scans, only used then if there is no index.
+    schema = f"test_query_plans_{uuid.uuid4().hex}"
+    engine = create_engine(
+        POSTGRES_URL,
+        connect_args={"options": f"-c search_path={schema} -c enable_seqscan=off"},
+    )
+    connection = engine.connect()
+    connection.execute(text(f"CREATE SCHEMA {schema}"))
+    Base.metadata.create_all(bind=connection)
+    yield connection
+
+    connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    connection.close()
+    engine.dispose()
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def plan_db(request) -> Session:
+    if request.param == "sqlite":
+        yield request.getfixturevalue("db_session")
+        return
+
+    connection = request.getfixturevalue("postgres_connection")
+    transaction = connection.begin()
+    db = sessionmaker(bind=connection, expire_on_commit=False)()
+    yield db
+
+    db.close()
+    transaction.rollback()
+
+
+def is_full_scan(dialect_name: str, plan_line: str) -> bool:
+    if dialect_name == "sqlite":
+        # "SCAN <table>" with or without index (SEARCH uses the index keys)
+        return bool(re.match(r"SCAN (?!CONSTANT ROW)", plan_line))
+
+    return "Seq Scan" in plan_line
+
+
+def explain(db: Session, statement: str, parameters) -> list[str]:
+    connection = db.connection()
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row.detail for row in rows]
+
+    rows = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+    return [row[0] for row in rows]
+
+
+def create_data(db: Session) -> dict:
+    user = User.create(
+        db,
+        UserCreate(email=f"{uuid.uuid4().hex}@example.com", password="x"),
+        hashed_password="",
+    )
+    data = {
+        "user": user,
+        "todo": ToDo.create(db, ToDoCreate(title="ToDo"), user.id),
+        "subject": uuid.uuid4().hex,
+    }
+    UserIdentity.create(db, user.id, "google", data["subject"])
+    return data
+
+
+def capture_plans(db: Session, query, data) -> list[tuple[str, list[str]]]:
+    """
+    Statements run by the query, with their plans.
+    """
+    statements = []
+
+    def capture_statement(conn, cursor, statement, parameters, context, executemany):
+        if re.match(r"\s*(SELECT|UPDATE|DELETE)", statement):
+            statements.append((statement, parameters))
+
+    connection = db.connection()
+    event.listen(connection, "before_cursor_execute", capture_statement)
+    try:
+        query(db, data)
+    finally:
+        event.remove(connection, "before_cursor_execute", capture_statement)
+
+    assert statements
+    return [
+        (statement, explain(db, statement, parameters))
+        for statement, parameters in statements
+    ]
+
+
+@pytest.mark.parametrize("query_name", HOT_QUERIES)
+def test_hot_queries_use_indexes(plan_db: Session, query_name):
+    data = create_data(plan_db)
+
+    dialect_name = plan_db.connection().dialect.name
+    for statement, plan in capture_plans(plan_db, HOT_QUERIES[query_name], data):
+        full_scans = [line for line in plan if is_full_scan(dialect_name, line)]
+        assert not full_scans, f"{statement}\n" + "\n".join(plan)
+
+
+def test_todo_stats_use_user_index(plan_db: Session):
+    data = create_data(plan_db)
+
+    [(_, plan)] = capture_plans(plan_db, HOT_QUERIES["todo_get_stats"], data)
+    # "SEARCH todos USING INDEX ... (user_id=?)" or "Index Cond: (user_id = 1)"
+    index_lines = [line for line in plan if re.search(r"INDEX|Index Cond", line)]
+    assert any(re.search(r"user_id ?=", line) for line in index_lines), "\n".join(plan)
@@ -0,0 +1,92 @@
+import itertools
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.api.dependencies import READ_FROM_PRIMARY_HEADER
+from app.core.config import get_settings
+from app.database.db import Base, Replica, replica_router
+from app.models import User
+
+
+def create_replica(name: str, db_url: str, user: User | None = None) -> Replica:
+    replica = Replica(name, db_url, get_settings().DATABASE_ASYNC)
+    if user is not None:
+        # same user as in the primary DB, with the replica name to tell them apart
+        Base.metadata.create_all(bind=replica.engine)
+        db = replica.SessionLocal()
+        db.add(User(id=user.id, email=user.email, full_name=name, is_active=True))
+        db.commit()
+        db.close()
+
+    return replica
+
+
+@pytest.fixture()
+def user_headers(db_session: Session, auth_headers) -> dict[str, str]:
+    headers, user = auth_headers
+    User.update(db_session, user, new={"full_name": "primary"})
+    return headers
+
+
+@pytest.fixture()
+def replicas(tmp_path, monkeypatch, auth_headers) -> list[Replica]:
+    """
+    Fixture using SQLite DB files as read replicas of the test DB.
+    """
+    _, user = auth_headers
+    replicas = [
+        create_replica(f"replica{i}", f"sqlite:///{tmp_path / f'replica{i}.db'}", user)
+        for i in range(2)
+    ]
+    monkeypatch.setattr(replica_router, "replicas", replicas)
+    monkeypatch.setattr(replica_router, "_counter", itertools.count())
+    yield replicas
+
+    for replica in replicas:
+        replica.engine.dispose()
+
+
+def get_user_name(client: TestClient, headers: dict[str, str]) -> str:
+    response = client.get("/api/users/me", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()["full_name"]
+
+
+def test_read_from_replicas(client: TestClient, user_headers, replicas):
+    names = [get_user_name(client, user_headers) for _ in range(4)]
+
+    assert names == ["replica0", "replica1", "replica0", "replica1"]
+
+
+def test_read_from_primary_header(client: TestClient, user_headers, replicas):
+    headers = {**user_headers, READ_FROM_PRIMARY_HEADER: "true"}
+
+    assert get_user_name(client, headers) == "primary"
+
+
+def test_read_your_writes(client: TestClient, user_headers, replicas):
+    response = client.put(
+        "/api/users/me", headers=user_headers, json={"full_name": "updated"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["full_name"] == "updated"
+
+    # the client reads from the primary until the cookie expires
+    assert get_user_name(client, user_headers) == "updated"
+    client.cookies.clear()
+    assert get_user_name(client, user_headers) == "replica0"
+
+
+def test_replica_ejection(client: TestClient, tmp_path, user_headers, replicas):
+    # the DB file can't be created, so connecting to the replica fails
+    broken_replica = create_replica("broken", f"sqlite:///{tmp_path}/missing/db")
+    replica_router.replicas = [broken_replica, replicas[1]]
+
+    # the read is retried in the primary, and the replica is not used anymore
+    assert get_user_name(client, user_headers) == "primary"
+    assert not broken_replica.healthy
+    names = [get_user_name(client, user_headers) for _ in range(3)]
+    assert names == ["replica1", "replica1", "replica1"]
@@ -8,7 +8,7 @@ from .user_factory import UserFactory
 
 
 class ToDoFactory(factory.alchemy.SQLAlchemyModelFactory):
-    id = factory.Sequence(lambda x: f"{x}")
+    id = factory.Sequence(lambda x: x)
     title = factory.Faker("sentence")
     description = factory.Faker("paragraph")
     time_created = factory.LazyFunction(datetime.now)
@@ -6,7 +6,7 @@ from app.models import User
 
 
 class UserFactory(factory.alchemy.SQLAlchemyModelFactory):
-    id = factory.Sequence(lambda x: f"{x}")
+    id = factory.Sequence(lambda x: x)
     email = factory.Faker("email")
     full_name = factory.Faker("name")
     is_active = True
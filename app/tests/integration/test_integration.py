@@ -48,7 +48,7 @@ def test_register_user_create_todo(client: TestClient):
 
     # step 7: check token is no longer valid
     response = client.get("/api/users/me", headers=auth_header)
-    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
     # step 8: check it is not possible to get a new token
     form_data = {"username": user_data["email"], "password": user_data["password"]}
@@ -0,0 +1,77 @@
+"""
+Latency of hashing and verifying a password with each hashing scheme.
+
+Uses the costs of the current settings (e.g. BCRYPT_ROUNDS, ARGON2_TIME_COST),
+which can be tuned through environment variables, to compare the p99 latency
+against the latency budget of a login.
+
+Usage:
+    $ BCRYPT_ROUNDS=13 python -m benchmarks.password_hashing --budget-ms 250
+"""
+import argparse
+import statistics
+import time
+
+from app.core.config import get_settings
+from app.core.security import create_password_context
+
+
+def measure(func, iterations: int) -> list[float]:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1e3)
+
+    return latencies
+
+
+def percentile(latencies: list[float], percent: int) -> float:
+    return statistics.quantiles(latencies, n=100, method="inclusive")[percent - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--schemes", nargs="+", default=["bcrypt", "argon2"])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    settings = get_settings()
+    print(
+        f"bcrypt rounds: {settings.BCRYPT_ROUNDS}, "
+        f"argon2 time cost: {settings.ARGON2_TIME_COST}, "
+        f"memory cost: {settings.ARGON2_MEMORY_COST} KiB, "
+        f"parallelism: {settings.ARGON2_PARALLELISM}"
+    )
+    for scheme in args.schemes:
+        context = create_password_context(
+            settings.copy(
+                update={
+                    "PASSWORD_HASH_SCHEMES": [scheme],
+                    "PASSWORD_HASH_LOW_COST": False,
+                }
+            )
+        )
+        password = "benchmark_password"
+        hashed_password = context.hash(password)
+
+        for operation, func in [
+            ("hash", lambda: context.hash(password)),
+            ("verify", lambda: context.verify(password, hashed_password)),
+        ]:
+            latencies = measure(func, args.iterations)
+            p99 = percentile(latencies, 99)
+            line = (
+                f"{scheme:<8} {operation:<8}"
+                f" mean {statistics.mean(latencies):8.2f} ms"
+                f" p50 {percentile(latencies, 50):8.2f} ms"
+                f" p99 {p99:8.2f} ms"
+            )
+            if args.budget_ms is not None:
+                line += " (over budget)" if p99 > args.budget_ms else " (ok)"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-request overhead of the token revocation check.
+
+Compares decoding a (cached) access token alone, decoding it and checking
+the revocation filter, and decoding it and always checking the DB.
+
+Usage:
+    $ python -m benchmarks.token_revocation --revocations 10000
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.core.config import get_settings
+from app.core.security import create_access_token, decode_token_cached
+from app.database.db import Base, create_engine_and_session
+from app.models import RevokedToken
+
+
+def measure(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--revocations", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    engine, SessionLocal = create_engine_and_session("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    db.bulk_insert_mappings(
+        RevokedToken,
+        [
+            {"key": uuid.uuid4().hex, "expires_at": expires_at}
+            for _ in range(args.revocations)
+        ],
+    )
+    db.commit()
+
+    settings = get_settings()
+    token = create_access_token(subject=1)
+    token_data = decode_token_cached(token, settings)
+
+    def decode_only():
+        decode_token_cached(token, settings)
+
+    def decode_and_check():
+        RevokedToken.is_revoked(db, decode_token_cached(token, settings))
+
+    # without the filter, every token has to be checked in the DB
+    def decode_and_check_db():
+        RevokedToken.is_revoked_in_db(db, decode_token_cached(token, settings))
+
+    # load the filter before measuring
+    RevokedToken.is_revoked(db, token_data)
+
+    print(f"revocations in DB: {args.revocations}")
+    for name, func in [
+        ("decode only", decode_only),
+        ("decode + filter check", decode_and_check),
+        ("decode + DB check", decode_and_check_db),
+    ]:
+        print(f"{name:<24} {measure(func, args.iterations):8.2f} us/request")
+
+    db.close()
+
+
+if __name__ == "__main__":
+    main()